@@ -2,6 +2,7 @@
 {
     using System;
     using System.ComponentModel;
+    using System.IO;
     using System.Linq;
     using System.Reflection;
     using System.Reflection.Emit;
@@ -32,11 +33,34 @@ namespace MVRuntimeLib
 }
 ";
 
+        /// <summary>
+        /// Version of the generated wrapper code. Bump this whenever the
+        /// template or code generation changes, to invalidate cached wrappers.
+        /// </summary>
+        public const int Version = 1;
+
         /// <summary>
         /// Type of class to be wrapped
         /// </summary>
         public Type Target { get; private set; }
 
+        /// <summary>
+        /// Identifies the generated wrapper by interface GUID, interop assembly
+        /// version and generator version, e.g. for naming cached assemblies
+        /// </summary>
+        public string CacheKey
+        {
+            get
+            {
+                return string.Join(
+                    "_",
+                    this.Target.Name,
+                    this.Target.GUID.ToString("N"),
+                    this.Target.Assembly.GetName().Version,
+                    Version);
+            }
+        }
+
         /// <summary>
         /// Code body for the generated wrapper
         /// </summary>
@@ -211,28 +235,115 @@ public {returnType} {func}({args1}) {
             // dynamic assembly
             var builder = assemblyBuilder.DefineDynamicModule(name.Name);
 
-            // configure Roslyn output
-            // { SyntaxTree.ParseText(this.Code) },
-            var tree = SyntaxTree.ParseCompilationUnit(this.Code);
-            var compiler = Compilation.Create(
-                "Test",
-                new CompilationOptions(OutputKind.DynamicallyLinkedLibrary),
-                new[] { tree },
-                new MetadataReference[]
+            // compile and store output in module
+            var result = CreateCompilation("Test", this).Emit(builder);
+            ThrowOnFailure(result);
+
+            // return dynamic assembly
+            return builder;
+        }
+
+        /// <summary>
+        /// Invokes the Roslyn C# compiler and saves the wrapper as an assembly on
+        /// disk, so that it can be reloaded later without recompiling
+        /// </summary>
+        /// <param name="path">Path of the assembly file to create</param>
+        /// <returns>The loaded assembly</returns>
+        /// <exception cref="NotSupportedException">If the code fails to compile</exception>
+        public Assembly CompileToFile(string path)
+        {
+            return EmitToFile(path, this);
+        }
+
+        /// <summary>
+        /// Generates the wrappers for all given classes and saves them together
+        /// as a single assembly on disk
+        /// </summary>
+        /// <param name="targets">Types of classes to be wrapped</param>
+        /// <param name="path">Path of the assembly file to create</param>
+        /// <returns>The loaded assembly</returns>
+        /// <exception cref="NotSupportedException">If the code fails to compile</exception>
+        public static Assembly CompileAll(Type[] targets, string path)
+        {
+            return EmitToFile(path, targets.Select(target => new StubGenerator(target)).ToArray());
+        }
+
+        /// <summary>
+        /// Compiles the given generators into a single assembly file. The file
+        /// is written to a temporary name first and then moved into place, so
+        /// that concurrent processes never load a partially written assembly.
+        /// </summary>
+        /// <param name="path">Path of the assembly file to create</param>
+        /// <param name="generators">Wrappers to include in the assembly</param>
+        /// <returns>The loaded assembly</returns>
+        internal static Assembly EmitToFile(string path, params StubGenerator[] generators)
+        {
+            var temp = path + "." + Guid.NewGuid().ToString("N") + ".tmp";
+            try
+            {
+                using (var stream = File.Create(temp))
+                {
+                    ThrowOnFailure(
+                        CreateCompilation(Path.GetFileNameWithoutExtension(path), generators).Emit(stream));
+                }
+
+                if (!File.Exists(path))
+                {
+                    try
                     {
-                        // for 'using System'
-                        // new MetadataFileReference(typeof(Guid).Assembly.Location),
-                        new AssemblyFileReference(typeof(Guid).Assembly.Location), 
+                        File.Move(temp, path);
+                    }
+                    catch (IOException)
+                    {
+                        // another process won the race, use its copy instead
+                    }
+                }
+            }
+            finally
+            {
+                if (File.Exists(temp))
+                {
+                    File.Delete(temp);
+                }
+            }
 
-                        // reference to original proxied class
-                        new AssemblyFileReference(this.Target.Assembly.Location),
+            return Assembly.LoadFrom(path);
+        }
 
-                        // reference to IronBindings
-                        new AssemblyFileReference(typeof(StubGenerator).Assembly.Location)
-                    });
+        /// <summary>
+        /// Configures the Roslyn compiler for a set of wrappers
+        /// </summary>
+        /// <param name="outputName">Name of the generated assembly</param>
+        /// <param name="generators">Wrappers to include in the assembly</param>
+        /// <returns>Compilation ready to be emitted</returns>
+        private static Compilation CreateCompilation(string outputName, params StubGenerator[] generators)
+        {
+            var references = new[]
+                {
+                    // for 'using System'
+                    typeof(Guid).Assembly.Location,
 
-            // compile and store output in module
-            var result = compiler.Emit(builder);
+                    // reference to IronBindings
+                    typeof(StubGenerator).Assembly.Location
+                }
+                // references to original proxied classes
+                .Union(generators.Select(generator => generator.Target.Assembly.Location))
+                .Select(location => (MetadataReference)new AssemblyFileReference(location));
+
+            return Compilation.Create(
+                outputName,
+                new CompilationOptions(OutputKind.DynamicallyLinkedLibrary),
+                generators.Select(generator => SyntaxTree.ParseCompilationUnit(generator.Code)),
+                references);
+        }
+
+        /// <summary>
+        /// Checks the output of the Roslyn compiler
+        /// </summary>
+        /// <param name="result">Result of emitting a compilation</param>
+        /// <exception cref="NotSupportedException">If the code failed to compile</exception>
+        private static void ThrowOnFailure(EmitResult result)
+        {
             if (!result.Success)
             {
                 // print failed output
@@ -242,9 +353,6 @@ public {returnType} {func}({args1}) {
                         from diagnostic in result.Diagnostics
                         select diagnostic.Location + ": " + diagnostic.Info.GetMessage()));
             }
-
-            // return dynamic assembly
-            return builder;
         }
 
         /// <summary>
@@ -2,22 +2,11 @@
 # this is a python module
 #-------------------------
 
-import logging, os, sys, types
+import logging, os, sys, threading, types
+from operator import attrgetter
 
 if sys.platform == 'cli':
 	import clr
-	# check if the CLR already has references to MVRuntimeLib, e.g. inserted by TorsoSharp
-	if not filter(lambda r: r.FullName.startswith('Interop.MVRuntimeLib'), clr.References):
-		sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
-		clr.AddReferenceToFile('Interop.MVRuntimeLib.dll')
-		clr.AddReferenceToFile('IronBindings.dll')
-		clr.AddReference('Microsoft.VisualBasic')
-
-	# load the COM interfaces
-	from MVRuntimeLib import *
-
-	# import IronBindings interface extensions
-	clr.ImportExtensions(Extensions)
 
 
 __version__ = (1, 1)
@@ -28,11 +17,15 @@ def get_type(obj):
 	Gets the COM interface name of an object instance
 	"""
 
-	if sys.platform == 'cli':
-		from Microsoft.VisualBasic import Information
-		return Information.TypeName(obj)
-	else:
-		raise NotImplemented
+	if sys.platform != 'cli':
+		raise NotImplementedError
+
+	global _Information
+	if _Information is None:
+		from Microsoft.VisualBasic import Information as _Information
+	return _Information.TypeName(obj)
+
+_Information = None
 
 
 class ProxyMixin(object):
@@ -46,33 +39,252 @@ class ProxyMixin(object):
 
 	def __init__(self, proxyobj, *args, **kwargs):
 		object.__setattr__(self, '_proxyobj', proxyobj)
+		_count(type(self).__name__, 1)
 
 	def __del__(self):
-		# release com reference to proxied object
-		if sys.platform == 'cli':
-			from System.Runtime.InteropServices import Marshal
-			obj = object.__getattribute__(self, '_proxyobj')
-			Marshal.FinalReleaseComObject(obj)
-		else:
-			obj = object.__getattribute__(self, '_proxyobj')
-			if hasattr(obj, 'Release'):
-				obj.Release()
-
-	def __getattribute__(self, name):
-		# check if call can be handled by proxy or proxied object
-		try:
-			return object.__getattribute__(self, name)
-		except AttributeError:
-			return getattr(self.get(), name)
+		self.release()
+
+	def release(self):
+		"""
+		Releases the proxied object now instead of when the proxy is garbage
+		collected. The proxy cannot be used afterwards.
+
+		:rtype: Whether the object had not been released yet
+		"""
+
+		obj = object.__getattribute__(self, '_proxyobj')
+		if obj is None:
+			return False
+		object.__setattr__(self, '_proxyobj', None)
+		_count(type(self).__name__, -1)
+		_release_native(obj)
+		return True
+
+	def __getattr__(self, name):
+		# only called if the call can't be handled by the proxy itself
+		if name == '_proxyobj' or name.startswith('__'):
+			raise AttributeError(name)
+		return getattr(self._proxyobj, name)
 
 	def get(self):
 		# returns the original proxied object
-		return object.__getattribute__(self, '_proxyobj')
+		return self._proxyobj
 
 	@property
 	def TypeName(self):
 		# Gets the type name of the proxied class
-		return get_type(self.get())
+		return get_type(self._proxyobj)
+
+def _release_native(obj, final=True):
+	"""
+	Releases the reference to a runtime object
+
+	:param final: On .NET, whether to release all references of the runtime
+		callable wrapper, which is shared by every reference to the same COM
+		object, instead of just one
+	"""
+
+	if sys.platform == 'cli':
+		from System.Runtime.InteropServices import Marshal
+		if Marshal.IsComObject(obj):
+			if final:
+				Marshal.FinalReleaseComObject(obj)
+			else:
+				Marshal.ReleaseComObject(obj)
+	elif hasattr(obj, 'Release'):
+		obj.Release()
+
+# numbers of proxies and tracked runtime objects that have not been released,
+# keyed by type name
+_live = {}
+
+def _count(name, delta):
+	with _scope_lock:
+		_live[name] = _live.get(name, 0) + delta
+
+def live_objects():
+	"""
+	Counts the proxies, and the runtime objects tracked by a `ProxyScope`,
+	that have not been released yet. Counts that keep growing from one test
+	to the next point to leaks.
+
+	:rtype: Dictionary of counts keyed by type name
+	"""
+
+	with _scope_lock:
+		return dict((name, count) for name, count in _live.iteritems() if count)
+
+# active scopes, innermost last. Scopes are shared by all threads, so that
+# objects created by worker threads (see `muvee.stubs.map_concurrent`) are
+# released with the scope that started them.
+_scopes = []
+_scope_lock = threading.RLock()
+
+def track(obj):
+	"""
+	Registers a runtime object with the innermost active `ProxyScope`, if any,
+	to be released when it exits. Only objects created by the caller (e.g.
+	results of `CreateMVSource`) may be tracked, never objects fetched from the
+	runtime's core or casts of it.
+
+	:param obj: Runtime object or proxy
+	:rtype: `obj`
+	"""
+
+	if _scopes:
+		with _scope_lock:
+			if _scopes:
+				_scopes[-1].track(obj)
+	return obj
+
+class ProxyScope(object):
+	"""
+	Context manager releasing the runtime objects created and tracked inside it
+	(see `track`) at once when it exits, instead of whenever they are garbage
+	collected. Objects must not be used after their scope has exited, unless
+	they were passed to `keep`. Each object gives up one reference, so other
+	references to the same runtime object stay usable, and the runtime's core
+	itself is never released.
+
+	Example:
+		with ProxyScope() as scope:
+			for path in paths:
+				AddSourceImage(path)
+		print scope.released
+	"""
+
+	def __init__(self):
+		self.objects = []
+		# numbers of released objects, keyed by type name
+		self.released = {}
+
+	def __enter__(self):
+		with _scope_lock:
+			_scopes.append(self)
+		return self
+
+	def __exit__(self, *args):
+		with _scope_lock:
+			_scopes.remove(self)
+		self.release()
+
+	def track(self, obj):
+		"""Registers an object to be released when the scope exits"""
+
+		if not isinstance(obj, ProxyMixin):
+			_count(type(obj).__name__, 1)
+		self.objects.append(obj)
+		return obj
+
+	def keep(self, obj):
+		"""
+		Stops tracking an object, so that it stays usable after the scope
+		exits. It is tracked by the enclosing scope instead, if there is one.
+
+		:rtype: `obj`
+		"""
+
+		with _scope_lock:
+			self.objects = [o for o in self.objects if o is not obj]
+			if not isinstance(obj, ProxyMixin):
+				_count(type(obj).__name__, -1)
+			if self in _scopes and _scopes.index(self) > 0:
+				_scopes[_scopes.index(self) - 1].track(obj)
+		return obj
+
+	def release(self):
+		"""Releases all tracked objects, most recently created first"""
+
+		mvrt = sys.modules.get(__name__ + '.mvrt')
+		core = getattr(mvrt, 'Core', None)
+		# objects released so far, by id
+		seen = { id(core): core }
+
+		while self.objects:
+			obj = self.objects.pop()
+			name = type(obj).__name__
+			if isinstance(obj, ProxyMixin):
+				released = obj.release()
+			else:
+				_count(name, -1)
+				released = id(obj) not in seen
+				if released:
+					seen[id(obj)] = obj
+					_release_native(obj, final=False)
+			if released:
+				self.released[name] = self.released.get(name, 0) + 1
+
+class ProxyCollectionMixin(ProxyMixin):
+	"""
+	ProxyMixin for COM collections, adding slicing, bulk fetching of elements
+	and a cached element count. Subclasses implement `_fetch_len` to fetch the
+	count from the proxied collection, and must call `invalidate` in any method
+	that adds or removes elements. The cached count is per wrapper instance.
+	"""
+
+	def __init__(self, proxyobj, *args, **kwargs):
+		super(ProxyCollectionMixin, self).__init__(proxyobj, *args, **kwargs)
+		self._len = None
+
+	def _fetch_len(self):
+		raise NotImplementedError
+
+	def invalidate(self):
+		# forget the cached element count
+		self._len = None
+
+	def __len__(self):
+		if self._len is None:
+			self._len = self._fetch_len()
+		return self._len
+
+	def __getitem__(self, key):
+		obj = self._proxyobj
+		if isinstance(key, slice):
+			return [obj[i] for i in xrange(*key.indices(len(self)))]
+		return obj[key]
+
+	def __iter__(self):
+		obj = self._proxyobj
+		for i in xrange(len(self)):
+			yield obj[i]
+
+	def snapshot(self, *fields):
+		"""
+		Fetches all elements of the collection, and optionally some of their
+		attributes, in a single pass. Dotted attribute names are supported, and
+		each intermediate object is only fetched once per element.
+
+		Example:
+			captions.snapshot('Start', 'Stop', 'TextDisplayFormat.Color')
+
+		:param fields: Names of element attributes to fetch
+		:rtype: List of elements if no fields are given, list of attribute values
+			if given a single field, else a list of tuples of attribute values
+		"""
+
+		items = list(self)
+		if not fields:
+			return items
+
+		paths = [field.rpartition('.')[::2] for field in fields]
+		rows = []
+		for item in items:
+			parents = { '': item }
+			row = []
+			for parent, name in paths:
+				if parent not in parents:
+					parents[parent] = attrgetter(parent)(item)
+				row.append(getattr(parents[parent], name))
+			rows.append(tuple(row))
+
+		if len(fields) == 1:
+			return [row[0] for row in rows]
+		return rows
+
+	def to_list(self):
+		# returns all elements of the collection as a list
+		return self.snapshot()
 
 def stub_func(name):
 	"""
@@ -128,7 +340,8 @@ def gen_stub(cls):
 	The wrapper class should support all methods and properties of its origin
 	class, and will simply delegates all such calls to the wrapped object.
 	Once generated, the original class will be replaced in the global namespace
-	by the wrapper class.
+	by the wrapper class. Compiled wrappers are cached on disk per interface
+	version (see `muvee.cache`), so each interface is compiled at most once.
 
 	Example:
 		# type casting src2 from an IDualMVSource_Image instance to IMVSource
@@ -138,56 +351,225 @@ def gen_stub(cls):
 	:param cls: Class to wrap with
 	"""
 
+	# modules importing the original interface keep calling gen_stub with it,
+	# so every wrapper is only ever generated once per process
+	try:
+		return _stubs[cls]
+	except KeyError:
+		pass
+
+	# use a wrapper generated ahead-of-time by `muvee.prebuild`, registering
+	# each one only when it is first asked for
+	global _prebuilt
+	if _prebuilt is None:
+		from . import prebuild
+		_prebuilt = prebuild.load()
+	if cls in _prebuilt:
+		_register_stub(cls, _prebuilt.pop(cls))
+		return _stubs[cls]
+
 	# if not .NET, check if the platform has its own casting implementation
 	if sys.platform != 'cli':
-		class Castor(object):
-			"""
-			Functor that calls the native bindings' "To[Class]" function
-			"""
-			def __init__(self):
-				self.cls = cls
-
-			def __call__(self, obj):
-				if hasattr(obj, "To" + self.cls.__name__):
-					return getattr(obj, "To" + self.cls.__name__)()
-				raise NotImplementedError
-
-		return Castor()
+		_register_stub(cls, Castor(cls))
+		return _stubs[cls]
 
 	# check classname in case cls is already a wrapper
 	if type(cls) != types.TypeType and 'Wrapper' in str(cls):
 		return cls
 
-	print 'Generating stubs for', cls.__name__
+	_register_stub(cls, _load_stub(cls))
+	return _stubs[cls]
+
+def _register_stub(cls, stub):
+	"""
+	Caches a generated wrapper, and on .NET replaces the original class in the
+	global namespace
+	"""
+
+	_stubs[cls] = stub
+	if sys.platform == 'cli':
+		_stubs[stub] = _stubs[cls]
+		globals()[stub.Name] = stub
+		globals()['_' + cls.__name__], globals()[cls.__name__] = cls, stub
+
+class Castor(object):
+	"""
+	Functor that calls the native bindings' "To[Class]" function
+	"""
+
+	def __init__(self, cls):
+		self.cls = cls
+		self.name = "To" + cls.__name__
+
+	def __call__(self, obj):
+		func = getattr(obj, self.name, None)
+		if func is not None:
+			return func()
+		raise NotImplementedError
+
+# casts by generated wrappers and castors, keyed by the class they were
+# generated from
+_stubs = {}
+# prebuilt wrappers not registered yet, keyed by the class they were generated
+# from, or None until loaded
+_prebuilt = None
+
+def _load_stub(cls):
+	"""
+	Loads the compiled wrapper for `cls` from the on-disk stub cache, compiling
+	and storing it first if this interface version has not been seen before.
+
+	:param cls: Class to wrap with
+	"""
+
+	from System.Reflection import Assembly
+	from .cache import cache_dir
+
 	generator = StubGenerator(cls)
-	module = generator.Compile()
-	
-	# compile successful, replace original class in global namespace
-	t = module.Assembly.GetTypes()[0]
-	globals()[t.Name] = t
-	globals()['_' + cls.__name__], globals()[cls.__name__] = globals()[cls.__name__], t
-	return t
+	path = os.path.join(cache_dir('stubs'), generator.CacheKey + '.dll')
+	if os.path.isfile(path):
+		assembly = Assembly.LoadFrom(path)
+	else:
+		logging.info('Generating stubs for %s', cls.__name__)
+		assembly = generator.CompileToFile(path)
+	clr.AddReference(assembly)
+	return assembly.GetType('MVRuntimeLib.%sWrapper' % cls.__name__)
 
 
 #========= Start =========
 
-# load IronBindings
-import mvrt
-sys.modules['muvee.mvrt'] = mvrt
+# The runtime bindings, interfaces, enumerators and stubs are only loaded once
+# any of them is first used, so that processes which only need e.g.
+# `muvee.testing` do not pay for loading the runtime and GUI toolkits.
+
+_loaded = False
+_load_lock = threading.RLock()
+
+def load():
+	"""
+	Loads the muvee runtime bindings, and imports its interfaces, enumerators
+	and all stubs into the `muvee` namespace. Called automatically the first
+	time any of them is used.
+	"""
+
+	global _loaded, mvrt
+	with _load_lock:
+		if _loaded:
+			return
+		# stub modules import names from the package while it is being loaded
+		_loaded = True
+
+		if sys.platform == 'cli':
+			# check if the CLR already has references to MVRuntimeLib, e.g. inserted by TorsoSharp
+			if not filter(lambda r: r.FullName.startswith('Interop.MVRuntimeLib'), clr.References):
+				sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+				clr.AddReferenceToFile('Interop.MVRuntimeLib.dll')
+				clr.AddReferenceToFile('IronBindings.dll')
+				clr.AddReference('Microsoft.VisualBasic')
+
+			# load the COM interfaces
+			import MVRuntimeLib
+			_import_all(MVRuntimeLib)
+
+			# import IronBindings interface extensions
+			clr.ImportExtensions(MVRuntimeLib.Extensions)
+
+		# load IronBindings, or the simulated runtime (see `muvee.simrt`)
+		if os.environ.get('MUFAT_SIMRT') == '1':
+			import simrt as mvrt
+		else:
+			import mvrt
+		sys.modules['muvee.mvrt'] = mvrt
+
+		# MacOS and the simulated runtime
+		if sys.platform == 'darwin' or mvrt.__name__.endswith('simrt'):
+			_import_all(mvrt)
+			# add reverse lookups to the bindings' enumerators
+			import enums
+			for name in enums.SOURCES:
+				globals()[name] = enums.from_class(globals()[name])
+
+		# Windows only
+		else:
+			import enums
+			_import_all(enums)
+
+		# import stubs
+		import stub__IMVCore
+		import stub__IMVCaptionCollection
+		import stub__IMVStyleCollection
+		import stubs
+		_import_all(stubs)
+
+def _import_all(module):
+	"""Same as `from module import *` into the `muvee` namespace"""
+
+	names = getattr(module, '__all__', None) or \
+			[name for name in dir(module) if not name.startswith('_')]
+	namespace = globals()
+	for name in names:
+		namespace[name] = getattr(module, name)
+
+
+class _Package(types.ModuleType):
+	"""
+	Module object of the `muvee` package, which calls `load` the first time a
+	name that is not defined yet is looked up.
+	"""
+
+	def __init__(self, module):
+		super(_Package, self).__init__(module.__name__, module.__doc__)
+		# all attributes are stored in the original module's namespace, which
+		# is the one the package's functions see as their globals
+		self.__dict__.update(_module=module, __file__=module.__file__,
+				__path__=module.__path__, __package__=module.__name__)
+
+	def __getattr__(self, name):
+		namespace = self._module.__dict__
+		if name not in namespace and not _loaded and not \
+				(name.startswith('__') and name != '__all__') and \
+				name not in _submodules():
+			load()
+		if name == '__all__' and name not in namespace:
+			return [n for n in namespace if not n.startswith('_')]
+		try:
+			return namespace[name]
+		except KeyError:
+			raise AttributeError(name)
+
+	def __setattr__(self, name, value):
+		setattr(self._module, name, value)
+
+	def __delattr__(self, name):
+		delattr(self._module, name)
+
+	def __dir__(self):
+		return sorted(self._module.__dict__)
+
+def _submodules():
+	"""Names of the package's modules, which must not trigger `load`"""
+
+	global _submodule_names
+	if _submodule_names is None:
+		from pkgutil import iter_modules
+		_submodule_names = set(name for loader, name, ispkg in iter_modules(__path__)) #@UnusedVariable
+	return _submodule_names
+
+_submodule_names = None
+
+class _RuntimeImporter(object):
+	"""Import hook that loads the runtime when `muvee.mvrt` is imported"""
 
-# MacOS
-if sys.platform == 'darwin':
-	from mvrt import *
+	def find_module(self, fullname, path=None):
+		if fullname == __name__ + '.mvrt' and not _loaded:
+			return self
 
-# Windows only
-else:
-	from enums import *
+	def load_module(self, fullname):
+		load()
+		return sys.modules[fullname]
 
-# import stubs
-import stub__IMVCore
-import stub__IMVCaptionCollection
-import stub__IMVStyleCollection
-from stubs import *
+sys.meta_path.append(_RuntimeImporter())
+sys.modules[__name__] = _Package(sys.modules[__name__])
 
 # register for uncaught exceptions
 def excepthook(etype, value, tb):
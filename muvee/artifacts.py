@@ -0,0 +1,88 @@
+"""
+Content-addressed store of uploaded test artifacts (logs and summaries).
+
+Each file is uploaded once under a key derived from the sha1 of its contents,
+so identical artifacts of different runs, hosts or nights share one object.
+Hashes of uploaded files are remembered in an index in the local muFAT cache,
+so that repeated artifacts are neither uploaded nor looked up again.
+"""
+
+import os
+from hashlib import sha1
+from . import cache
+
+URL = "https://mufat.s3.amazonaws.com/"
+
+
+def digest(path):
+	"""Gets the sha1 hex digest of a file's contents"""
+
+	h = sha1()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), ''):
+			h.update(block)
+	return h.hexdigest()
+
+
+class ArtifactStore(object):
+	"""
+	Uploads files to an S3 bucket by content hash.
+
+	Example:
+		store = ArtifactStore(boto.connect_s3(...).get_bucket("mufat"))
+		result["log"] = store.upload(logfile)
+	"""
+
+	def __init__(self, bucket, url=URL, prefix="artifacts", index=None):
+		"""
+		:param bucket: `boto.s3.bucket.Bucket` to upload to
+		:param url: Public URL of the bucket
+		:param prefix: Folder in the bucket to upload artifacts to
+		:param index: File to store the hashes of uploaded artifacts in.
+			Default: a file per bucket in the 'artifacts' folder of the local
+			muFAT cache
+		"""
+
+		self.bucket = bucket
+		self.url = url
+		self.prefix = prefix
+		self.index = index or os.path.join(cache.cache_dir('artifacts'), '%s.bin' % bucket.name)
+		# key names of uploaded artifacts, keyed by digest
+		self.uploaded = cache.load(self.index, {})
+		self.skipped = 0
+
+	def key(self, digest, ext=""):
+		"""
+		Gets the key name of an artifact in the bucket.
+
+		:param digest: sha1 hex digest of the artifact's contents
+		:param ext: File extension to append, e.g. ".txt"
+		"""
+
+		return "%s/%s/%s%s" % (self.prefix, digest[:2], digest, ext)
+
+	def upload(self, path):
+		"""
+		Uploads a file, unless a file with the same contents has been uploaded
+		before.
+
+		:param path: Path to the file
+		:rtype: Public URL of the uploaded object
+		"""
+
+		d = digest(path)
+		name = self.uploaded.get(d)
+		if name is None:
+			name = self.key(d, os.path.splitext(path)[1])
+			# may have been uploaded by another host
+			if self.bucket.get_key(name) is None:
+				key = self.bucket.new_key(name)
+				key.set_contents_from_filename(path, reduced_redundancy=True)
+				key.make_public()
+			else:
+				self.skipped += 1
+			self.uploaded[d] = name
+			cache.dump(self.uploaded, self.index)
+		else:
+			self.skipped += 1
+		return self.url + name
@@ -0,0 +1,160 @@
+"""
+Persistent index of assertion fingerprints across muFAT runs.
+
+Every unique assertion found by `runner.get_asserts` is identified by the sha1
+of its source file and message. The index remembers, per fingerprint, when and
+where it was first and last seen and how often, plus every run that hit it, so
+that new assertions of a runtime build can be told apart from known ones
+without searching uploaded logs.
+
+Example:
+	index = AssertIndex()
+	new = index.record(assertdict, build=1234, host="mac-mini", run="foo.py")
+	for fingerprint in new:
+		print index.get(fingerprint)["message"]
+"""
+
+import os, sqlite3, time
+from . import cache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS asserts (
+	fingerprint TEXT PRIMARY KEY,
+	file TEXT,
+	message TEXT,
+	first_build TEXT,
+	first_host TEXT,
+	first_run TEXT,
+	first_seen REAL,
+	last_build TEXT,
+	last_host TEXT,
+	last_run TEXT,
+	last_seen REAL,
+	count INTEGER
+);
+CREATE TABLE IF NOT EXISTS hits (
+	fingerprint TEXT,
+	build TEXT,
+	host TEXT,
+	dbkey TEXT,
+	run TEXT,
+	count INTEGER,
+	seen REAL
+);
+CREATE INDEX IF NOT EXISTS hits_fingerprint ON hits (fingerprint, build);
+CREATE INDEX IF NOT EXISTS hits_build ON hits (build);
+"""
+
+
+class AssertIndex(object):
+	"""
+	Assertion fingerprints stored in a sqlite database.
+	"""
+
+	def __init__(self, path=None):
+		"""
+		:param path: Database file. Default: 'asserts.db' in the 'asserts'
+			folder of the local muFAT cache
+		"""
+
+		self.path = path or os.path.join(cache.cache_dir('asserts'), 'asserts.db')
+		self.db = sqlite3.connect(self.path, timeout=30)
+		self.db.row_factory = sqlite3.Row
+		self.db.executescript(SCHEMA)
+
+	def close(self):
+		self.db.close()
+
+	def record(self, uniques, build, host, run, dbkey=None):
+		"""
+		Records the assertions hit by a run.
+
+		:param uniques: Dictionary of unique assertions, as returned by
+			`runner.get_asserts`
+		:param build: Runtime build the run was made with
+		:param host: Name of the host the run was made on
+		:param run: Name of the muFAT run
+		:param dbkey: Database key of the night the run belongs to
+		:rtype: List of fingerprints that had not been seen in any other build
+		"""
+
+		build = str(build)
+		now = time.time()
+		with self.db:
+			for fingerprint, details in uniques.iteritems():
+				count = details["occurances"]
+				updated = self.db.execute("""UPDATE asserts SET
+						last_build = ?, last_host = ?, last_run = ?, last_seen = ?,
+						count = count + ? WHERE fingerprint = ?""",
+						(build, host, run, now, count, fingerprint)).rowcount
+				if not updated:
+					self.db.execute("INSERT INTO asserts VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+							(fingerprint, details["file"], details["message"],
+							build, host, run, now, build, host, run, now, count))
+				self.db.execute("INSERT INTO hits VALUES (?,?,?,?,?,?,?)",
+						(fingerprint, build, host, dbkey, run, count, now))
+		return [f for f in uniques if self.is_new(f, build)]
+
+	def get(self, fingerprint):
+		"""
+		Looks up an assertion.
+
+		:param fingerprint: sha1 hex digest of the assertion's file and message
+		:rtype: Dictionary of the assertion's columns, or None if never seen
+		"""
+
+		row = self.db.execute("SELECT * FROM asserts WHERE fingerprint = ?",
+				(fingerprint,)).fetchone()
+		if row is not None:
+			return dict(zip(row.keys(), row))
+
+	def is_new(self, fingerprint, build):
+		"""
+		Checks whether an assertion has only been seen in the given build.
+
+		:param fingerprint: sha1 hex digest of the assertion's file and message
+		:param build: Runtime build
+		"""
+
+		return self.db.execute("SELECT 1 FROM hits WHERE fingerprint = ? AND build != ? LIMIT 1",
+				(fingerprint, str(build))).fetchone() is None
+
+	def runs(self, fingerprint, build=None):
+		"""
+		Lists the runs that hit an assertion, most recent first.
+
+		:param fingerprint: sha1 hex digest of the assertion's file and message
+		:param build: Only list runs of this runtime build. Default: all builds
+		:rtype: List of dictionaries of build, host, dbkey, run, count and seen
+			(timestamp)
+		"""
+
+		query = "SELECT build, host, dbkey, run, count, seen FROM hits WHERE fingerprint = ?"
+		args = [fingerprint]
+		if build is not None:
+			query += " AND build = ?"
+			args.append(str(build))
+		rows = self.db.execute(query + " ORDER BY seen DESC", args).fetchall()
+		return [dict(zip(row.keys(), row)) for row in rows]
+
+	def new_in(self, build):
+		"""
+		Lists the assertions first seen in a runtime build.
+
+		:param build: Runtime build
+		:rtype: List of fingerprints
+		"""
+
+		rows = self.db.execute("""SELECT fingerprint FROM asserts WHERE first_build = ?
+				AND fingerprint NOT IN (SELECT fingerprint FROM hits WHERE build != ?)""",
+				(str(build), str(build))).fetchall()
+		return [row[0] for row in rows]
+
+
+if __name__ == "__main__":
+	import sys
+	index = AssertIndex()
+	for fingerprint in sys.argv[1:]:
+		print index.get(fingerprint)
+		for hit in index.runs(fingerprint):
+			print "\t%(build)s %(host)s %(dbkey)s %(run)s x%(count)d" % hit
@@ -0,0 +1,379 @@
+"""
+Micro-benchmarks of the binding layer, i.e. the overhead muFAT itself adds on
+top of the muvee runtime. They can run against the simulated runtime on any
+platform (see `muvee.simrt`):
+
+	MUFAT_SIMRT=1 python -m muvee.benchmark -o results.json
+	MUFAT_SIMRT=1 python -m muvee.benchmark -b baseline.json
+
+Results are written as JSON, with the best and median time per operation of
+every benchmark. When given a baseline of earlier results, the run fails if
+any benchmark got slower by more than the tolerance. The run also fails if
+importing the package takes longer than the import budget.
+"""
+
+import json, os, re, shutil, subprocess, sys, tempfile, time
+from contextlib import contextmanager
+
+# version of the results format
+FORMAT = 1
+
+# each measurement is repeated until it runs for at least this many seconds
+MIN_TIME = 0.05
+REPEAT = 5
+
+# seconds `import muvee` may take at most, can be overridden with the
+# MUFAT_IMPORT_BUDGET environment variable
+IMPORT_BUDGET = float(os.environ.get('MUFAT_IMPORT_BUDGET', 0.5))
+
+# registered benchmarks: name -> setup function returning the operation to time
+BENCHMARKS = {}
+
+def benchmark(name):
+	"""
+	Function decorator to register a benchmark. The decorated function sets up
+	the benchmark, and returns a function performing a single operation, or
+	the measurement itself for benchmarks that cannot be repeated in-process
+	(see `measure`).
+
+	Example:
+		@benchmark('normalize')
+		def _normalize():
+			return lambda: normalize(r'c:\\mufat_repo\\a.jpg')
+
+	:param name: Name of the benchmark in the results
+	"""
+
+	def _f(f):
+		BENCHMARKS[name] = f
+		return f
+	return _f
+
+class Skipped(Exception):
+	"""Raised by a benchmark setup if it cannot run in this environment"""
+	pass
+
+@contextmanager
+def _quiet():
+	# discards everything printed while timing, e.g. progress lines
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, 'w')
+	try:
+		yield
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+def measure(op, min_time=MIN_TIME, repeat=REPEAT):
+	"""
+	Times an operation, calling it often enough that timer resolution does not
+	matter.
+
+	:param op: Function to time
+	:param min_time: Minimum number of seconds for each measurement
+	:param repeat: Number of measurements
+	:rtype: Dictionary of the number of calls per measurement, and the best
+		and median number of seconds per call
+	"""
+
+	def timed(n):
+		start = time.time()
+		for _ in xrange(n):
+			op()
+		return time.time() - start
+
+	n = 1
+	while timed(n) < min_time:
+		n *= 2
+	times = sorted(timed(n) / n for _ in xrange(repeat))
+	return { 'iterations': n, 'best': times[0], 'median': times[len(times) / 2] }
+
+def measure_import(statement, repeat=REPEAT):
+	"""
+	Times import statements in fresh interpreters, excluding the time taken by
+	the interpreter to start up.
+
+	:param statement: Python statement to time
+	:param repeat: Number of measurements
+	:rtype: Same as `measure`
+	"""
+
+	code = 'import time; start = time.time(); %s; print time.time() - start' % statement
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+		os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+		env.get('PYTHONPATH')]))
+	times = sorted(float(subprocess.check_output([sys.executable, '-c', code],
+			env=env).split()[-1]) for _ in xrange(repeat))
+	return { 'iterations': 1, 'best': times[0], 'median': times[len(times) / 2] }
+
+#=== benchmarks
+
+@benchmark('import.muvee')
+def _import():
+	return measure_import('import muvee')
+
+@benchmark('import.muvee.load')
+def _import_load():
+	return measure_import('import muvee; muvee.load()')
+
+def _captions(count):
+	from .mvrt import Core
+	from . import IMVCaptionCollection
+	captions = Core.CreateMVSource(1).Captions
+	for i in xrange(count):
+		captions.AddCaption('caption %d' % i, i, i + 1.0)
+	return IMVCaptionCollection(captions)
+
+@benchmark('proxy.attribute')
+def _proxy_attribute():
+	captions = _captions(1)
+	captions.ToXML
+	return lambda: captions.ToXML
+
+@benchmark('proxy.method')
+def _proxy_method():
+	captions = _captions(10)
+	return lambda: captions.ToXML()
+
+@benchmark('gen_stub.cast')
+def _gen_stub():
+	from .mvrt import Core
+	from . import gen_stub, IMVSource2
+	src = Core.CreateMVSource(1)
+	return lambda: gen_stub(IMVSource2)(src)
+
+@benchmark('collection.captions.iterate')
+def _captions_iterate():
+	captions = _captions(100)
+	return lambda: list(captions)
+
+@benchmark('collection.captions.snapshot')
+def _captions_snapshot():
+	from .stub__IMVCaptionCollection import TIME_FIELDS, FORMAT_FIELDS
+	captions = _captions(100)
+	fields = TIME_FIELDS + FORMAT_FIELDS
+	return lambda: captions.snapshot(*fields)
+
+@benchmark('collection.styles.snapshot')
+def _styles_snapshot():
+	from .mvrt import Core
+	from . import IMVStyleCollection
+	styles = IMVStyleCollection(Core.Styles)
+	return lambda: styles.snapshot('InternalName')
+
+@benchmark('testing.normalize')
+def _normalize():
+	from .testing import normalize
+	paths = [r'c:\mufat_repo\img\a.jpg', r'C:\muveedebug\out.mp4',
+		r'y:\testsets\b.mov', r'relative\c.mp3']
+	return lambda: map(normalize, paths)
+
+@benchmark('runner.get_asserts')
+def _get_asserts():
+	try:
+		from .runner import get_asserts
+	except ImportError, e:
+		raise Skipped(str(e))
+
+	lines = []
+	for i in xrange(2000):
+		if i % 40 == 0:
+			lines.append('12:00:%02d.%03d  mvrt_%d.cpp(%d)  ASSERT FAILED: '
+					'frame %d out of range' % (i % 60, i, i % 5, i, i % 7))
+		else:
+			lines.append('12:00:%02d.%03d  Progress: %.2f' % (i % 60, i, i / 2000.0))
+	data = '\n'.join(lines) + '\n'
+	return lambda: get_asserts(data)
+
+def _write_rvl(path, count):
+	# writes a project with `count` sources of each kind
+	lines = ['<project>', '<image>']
+	for i in xrange(count):
+		lines.append('<file><index>%d</index><name>c:\\mufat_repo\\%d.jpg</name>'
+			'<rotation>0</rotation><minDur>2.5</minDur>'
+			'<magicSpot activetype="1"><targetrects>'
+			'<rect X1="0.1" X2="0.9" Y1="0.1" Y2="0.9" /></targetrects></magicSpot>'
+			'<caption string="image %d" font="Arial" fontcolor="16777215" '
+			'offsetX="0.1" offsetY="0.8" height="0.1" width="0.8" align="18" />'
+			'</file>' % (3 * i, i, i))
+	lines += ['</image>', '<audio>']
+	for i in xrange(count):
+		lines.append('<file><index>%d</index><name>c:\\mufat_repo\\%d.mp3</name>'
+			'<cliprange start="0" stop="30" /></file>' % (3 * i + 1, i))
+	lines += ['</audio>', '<video>']
+	for i in xrange(count):
+		lines.append('<file><index>%d</index><name>c:\\mufat_repo\\%d.mov</name>'
+			'<cliprange start="0" stop="60" /><captions><caption>'
+			'<string>video %d</string><timeStart>1</timeStart><timeEnd>5</timeEnd>'
+			'<font>Arial</font><fontcolor>255</fontcolor><offsetX>0.1</offsetX>'
+			'<offsetY>0.1</offsetY><height>0.2</height><width>0.8</width>'
+			'<align>9</align></caption></captions><highlights><highlight>'
+			'<start>10</start><stop>20</stop></highlight></highlights>'
+			'<excludes><exclude><start>40</start><stop>50</stop></exclude>'
+			'</excludes></file>' % (3 * i + 2, i, i))
+	lines += ['</video>', '<settings><SelectedStyle>S00509_Cuts</SelectedStyle>'
+		'<SuperStyles default="1" /><StyleTextParams /><EnableTitle>0</EnableTitle>'
+		'<EnableCredits>0</EnableCredits><AudioMix><Voiceover>1</Voiceover>'
+		'<SoundFx>1</SoundFx><Video>0.5</Video><Music>0.8</Music></AudioMix>'
+		'</settings>', '</project>']
+	with open(path, 'w') as f:
+		f.write('\n'.join(lines))
+
+@benchmark('rvl.parse')
+def _rvl_parse():
+	from . import rvl
+	path = os.path.join(_tempdir(), 'project.rvl')
+	_write_rvl(path, 100)
+	return lambda: rvl.parse(path)
+
+@benchmark('rvl.load.cached')
+def _rvl_load():
+	from . import rvl
+	path = os.path.join(_tempdir(), 'project.rvl')
+	_write_rvl(path, 100)
+	rvl.load(path)
+	return lambda: rvl.load(path)
+
+@benchmark('stubs.CheckProgress')
+def _check_progress():
+	from .stubs import CheckProgress
+	steps = [i / 100.0 for i in xrange(101)]
+
+	def op():
+		progress = iter(steps)
+		CheckProgress(progress.next, sleep=0)
+	return op
+
+#=== running and comparing
+
+_temp = None
+
+def _tempdir():
+	# scratch folder for benchmark files, deleted by `run`
+	global _temp
+	if _temp is None:
+		_temp = tempfile.mkdtemp(prefix='mufat_bench')
+	return _temp
+
+def run(pattern=None, min_time=MIN_TIME, repeat=REPEAT):
+	"""
+	Runs all benchmarks, or the ones whose names match a regex.
+
+	:param pattern: Regular expression to filter benchmark names with
+	:param min_time: Minimum number of seconds for each measurement
+	:param repeat: Number of measurements per benchmark
+	:rtype: Results dictionary
+	"""
+
+	from . import mvrt
+	global _temp
+
+	# keep caches written by the benchmarks out of the user's cache
+	cache = os.environ.get('MUFAT_CACHE')
+	os.environ['MUFAT_CACHE'] = os.path.join(_tempdir(), 'cache')
+
+	results = {}
+	try:
+		for name in sorted(BENCHMARKS):
+			if pattern and not re.search(pattern, name):
+				continue
+			with _quiet():
+				try:
+					op = BENCHMARKS[name]()
+					if isinstance(op, dict):
+						results[name] = op
+					else:
+						results[name] = measure(op, min_time, repeat)
+				except Skipped, e:
+					results[name] = { 'skipped': str(e) }
+	finally:
+		if cache is None:
+			del os.environ['MUFAT_CACHE']
+		else:
+			os.environ['MUFAT_CACHE'] = cache
+		shutil.rmtree(_temp, ignore_errors=True)
+		_temp = None
+
+	return {
+		'format': FORMAT,
+		'python': sys.version.split()[0],
+		'platform': sys.platform,
+		'runtime': mvrt.__name__,
+		'results': results,
+	}
+
+def compare(results, baseline, tolerance=0.25):
+	"""
+	Compares results against a baseline of earlier results, by the best time
+	of each benchmark.
+
+	:param results: Results dictionary, as returned by `run`
+	:param baseline: Results dictionary to compare against
+	:param tolerance: Slowdown ratio above which a benchmark has regressed
+	:rtype: List of (name, baseline seconds, seconds, ratio, regressed) tuples,
+		for all benchmarks measured in both
+	"""
+
+	assert baseline.get('format') == FORMAT, "Unsupported baseline format"
+	for key in ('platform', 'runtime'):
+		if results[key] != baseline[key]:
+			print "Warning: baseline %s is %s, not %s" % (key, baseline[key], results[key])
+
+	rows = []
+	for name, result in sorted(results['results'].iteritems()):
+		old = baseline['results'].get(name, {})
+		if 'best' in result and 'best' in old:
+			ratio = result['best'] / old['best']
+			rows.append((name, old['best'], result['best'], ratio, ratio > 1 + tolerance))
+	return rows
+
+def report(results, rows=None):
+	"""Prints results, and their comparison against a baseline if given"""
+
+	for name, result in sorted(results['results'].iteritems()):
+		if 'skipped' in result:
+			print "%-32s skipped: %s" % (name, result['skipped'])
+		else:
+			print "%-32s %12.2f us %12.2f us (median)" % (name,
+					result['best'] * 1e6, result['median'] * 1e6)
+
+	if rows:
+		print
+		print "%-32s %15s %15s %8s" % ('Compared to baseline', 'before', 'after', 'change')
+		for name, before, after, ratio, regressed in rows:
+			print "%-32s %12.2f us %12.2f us %+7.1f%%%s" % (name, before * 1e6,
+					after * 1e6, (ratio - 1) * 100, regressed and '  REGRESSED' or '')
+
+
+if __name__ == "__main__":
+	import argparse
+	p = argparse.ArgumentParser()
+	p.add_argument("-o", "--output", help="File to write results to")
+	p.add_argument("-b", "--baseline", help="Results file to compare against")
+	p.add_argument("-t", "--tolerance", type=float, default=0.25,
+		help="Slowdown ratio above which a benchmark has regressed")
+	p.add_argument("-f", "--filter", help="Only run benchmarks matching this regex")
+	p.add_argument("--min-time", type=float, default=MIN_TIME,
+		help="Minimum number of seconds for each measurement")
+	p.add_argument("--import-budget", type=float, default=IMPORT_BUDGET,
+		help="Maximum number of seconds `import muvee` may take")
+	args = p.parse_args()
+
+	results = run(args.filter, args.min_time)
+	rows = None
+	if args.baseline:
+		with open(args.baseline) as f:
+			rows = compare(results, json.load(f), args.tolerance)
+	report(results, rows)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+	imported = results['results'].get('import.muvee', {})
+	if imported.get('best', 0) > args.import_budget:
+		print "Importing muvee took %.3f s, over the budget of %.3f s" % \
+				(imported['best'], args.import_budget)
+		sys.exit(1)
+	if rows and any(row[-1] for row in rows):
+		sys.exit(1)
@@ -0,0 +1,168 @@
+"""
+Local on-disk cache folders shared by muFAT runs on the same machine
+"""
+
+import marshal, os, sys
+from hashlib import sha1
+
+def cache_root():
+	"""
+	Returns the root folder for muFAT's persistent caches. Can be overridden
+	with the MUFAT_CACHE environment variable.
+	"""
+
+	if os.environ.get('MUFAT_CACHE'):
+		return os.environ['MUFAT_CACHE']
+	if sys.platform == 'cli' or sys.platform.startswith('win'):
+		base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+		return os.path.join(base, 'muFAT', 'cache')
+	return os.path.expanduser('~/.mufat/cache')
+
+def cache_dir(*parts):
+	"""
+	Returns (and creates if needed) a sub-folder inside the cache root.
+
+	Example:
+		cache_dir('stubs') -> ~/.mufat/cache/stubs
+
+	:param parts: Path components relative to the cache root
+	"""
+
+	path = os.path.join(cache_root(), *parts)
+	if not os.path.isdir(path):
+		try:
+			os.makedirs(path)
+		except OSError:
+			# created concurrently by another process
+			if not os.path.isdir(path):
+				raise
+	return path
+
+def load(path, default=None):
+	"""
+	Reads a value stored by `dump`, or returns `default` if the file is
+	missing or unreadable.
+
+	:param path: Path to the cache file
+	:param default: Value to return if nothing could be read
+	"""
+
+	try:
+		with open(path, 'rb') as f:
+			return marshal.load(f)
+	except (IOError, EOFError, ValueError, TypeError):
+		return default
+
+def dump(value, path):
+	"""
+	Stores a value of plain Python types in a cache file. The file is written
+	under a temporary name first, so that concurrent readers never see a
+	partially written file. Writing is best-effort: if the file cannot be
+	replaced, e.g. because another process is replacing it at the same time,
+	the value is not stored.
+
+	:param value: Value to store
+	:param path: Path to the cache file
+	:rtype: Whether the value was stored
+	"""
+
+	return _replace(path, marshal.dumps(value))
+
+def _replace(path, data):
+	# writes a file through a temporary file, see `dump`
+	temp = '%s.%d.tmp' % (path, os.getpid())
+	try:
+		with open(temp, 'wb') as f:
+			f.write(data)
+		if os.name == 'nt' and os.path.exists(path):
+			# Windows cannot rename onto an existing file
+			os.remove(path)
+		os.rename(temp, path)
+		return True
+	except (IOError, OSError):
+		try:
+			os.remove(temp)
+		except OSError:
+			pass
+		return False
+
+def _load_digests(path):
+	"""Reads the (key, digest) records appended by `file_digest`"""
+
+	digests = {}
+	try:
+		with open(path, 'rb') as f:
+			while f.read(1):
+				f.seek(-1, os.SEEK_CUR)
+				key, digest = marshal.load(f)
+				digests[key] = digest
+	except IOError:
+		pass
+	except (EOFError, ValueError, TypeError):
+		# a record was cut off while being written, rewrite the index without
+		# it so that records appended after it can be read
+		_replace(path, ''.join(marshal.dumps(record) for record in digests.iteritems()))
+	return digests
+
+# digests of file contents, keyed by (path, size, mtime)
+_digests = None
+
+def _digest_index():
+	return os.path.join(cache_dir(), 'digests.log')
+
+def evict_digests():
+	"""
+	Rewrites the digest index without the digests of files that have changed
+	or no longer exist, which would otherwise accumulate forever.
+
+	:rtype: Number of digests evicted
+	"""
+
+	global _digests
+	index = _digest_index()
+	digests = _load_digests(index)
+	kept = {}
+	for key, digest in digests.iteritems():
+		path, size, mtime = key
+		try:
+			st = os.stat(path)
+		except OSError:
+			continue
+		if (st.st_size, repr(st.st_mtime)) == (size, mtime):
+			kept[key] = digest
+	if len(kept) < len(digests):
+		_replace(index, ''.join(marshal.dumps(record) for record in kept.iteritems()))
+	_digests = kept
+	return len(digests) - len(kept)
+
+def file_digest(path):
+	"""
+	Returns the sha1 hex digest of a file's contents. Digests are remembered
+	on disk per path, size and modification time, so that unchanged media is
+	only read once per machine. New digests are appended to the on-disk index
+	rather than rewriting it.
+
+	:param path: Path to the file
+	"""
+
+	global _digests
+	path = os.path.realpath(path)
+	st = os.stat(path)
+	key = (path, st.st_size, repr(st.st_mtime))
+	index = _digest_index()
+	if _digests is None:
+		_digests = _load_digests(index)
+
+	if key not in _digests:
+		digest = sha1()
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), ''):
+				digest.update(block)
+		_digests[key] = digest.hexdigest()
+
+		try:
+			with open(index, 'ab') as f:
+				f.write(marshal.dumps((key, _digests[key])))
+		except IOError:
+			pass
+	return _digests[key]
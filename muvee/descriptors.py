@@ -0,0 +1,251 @@
+"""
+Persistent store of analysis descriptors, shared across muFAT runs.
+
+Analysis results depend only on the analysed media and the runtime build, so
+each media file gets its own descriptor folder under the local muFAT cache,
+keyed by the runtime build and the content hash of the file. Before analysis,
+the descriptors of all media of a run are copied into a working folder that is
+handed to the runtime, so that it can reuse descriptors from earlier runs
+instead of analysing unchanged media again. Descriptors the runtime wrote are
+stored back afterwards.
+
+The runtime does not tell which descriptor files belong to which media. New
+files are assigned by name, assuming the runtime names descriptors after the
+media file they describe, or to the only media file that had no descriptors
+yet. Files that cannot be assigned are not stored, and their media is analysed
+again by the next run.
+"""
+
+import atexit, os, shutil, time
+from . import cache
+from .cache import cache_dir, file_digest
+
+# default eviction limits, can be overridden with environment variables
+MAX_SIZE = int(os.environ.get('MUFAT_DSCRP_MAX_MB', 10240)) * 1024 * 1024
+MAX_AGE = float(os.environ.get('MUFAT_DSCRP_MAX_DAYS', 14)) * 24 * 3600
+# working folders older than this were left behind by killed runs
+WORK_AGE = 24 * 3600
+
+def _folder_size(path):
+	"""Gets the total size of all files in a folder"""
+
+	size = 0
+	for root, dirs, files in os.walk(path): #@UnusedVariable
+		for f in files:
+			try:
+				size += os.path.getsize(os.path.join(root, f))
+			except OSError:
+				pass
+	return size
+
+def _files(path):
+	"""
+	Lists the files in a folder with their size and modification time.
+
+	:rtype: Dictionary of (size, mtime) tuples by path relative to the folder
+	"""
+
+	files = {}
+	for root, dirs, names in os.walk(path): #@UnusedVariable
+		for name in names:
+			full = os.path.join(root, name)
+			try:
+				st = os.stat(full)
+			except OSError:
+				continue
+			files[os.path.relpath(full, path)] = (st.st_size, st.st_mtime)
+	return files
+
+def _copy(src, dst, names):
+	# copies files by relative path from one folder to another
+	for name in names:
+		target = os.path.join(dst, name)
+		if not os.path.isdir(os.path.dirname(target)):
+			os.makedirs(os.path.dirname(target))
+		shutil.copy2(os.path.join(src, name), target)
+
+
+class DescriptorStore(object):
+	"""
+	Descriptor folders keyed by runtime build and media content hash.
+
+	Example:
+		store = DescriptorStore(build=Core.GetRuntimeSpecialBuild())
+		Core.DescriptorFolder = store.checkout([r'c:\\mufat_repo\\a.jpg'])
+		... analyse ...
+		store.checkin()
+	"""
+
+	def __init__(self, build=0, root=None):
+		"""
+		:param build: Build number of the muvee runtime
+		:param root: Folder to store descriptors in. Default: the 'dscrp'
+			folder in the local muFAT cache
+		"""
+
+		self.build = build
+		self.root = root or cache_dir('dscrp')
+		self.work_root = os.path.join(os.path.dirname(self.root),
+				os.path.basename(self.root) + '_work')
+		self.work = None
+		# descriptor folders of the checked out media, by media path
+		self.media = {}
+		# descriptor folder the working folder was filled from, by file
+		self.origins = {}
+		# media folders that had no descriptors before the checkout
+		self.new = []
+		self.checked_out = {}
+
+	def key(self, path):
+		"""
+		Gets the key identifying a media file by its contents
+
+		:param path: Path to the media file
+		"""
+
+		return file_digest(path)
+
+	def folder(self, path):
+		"""
+		Gets (and creates if needed) the descriptor folder of a media file,
+		and marks it as recently used.
+
+		:param path: Path to the media file
+		"""
+
+		folder = os.path.join(self.root, str(self.build), self.key(path))
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+		os.utime(folder, None)
+		return folder
+
+	def checkout(self, media):
+		"""
+		Fills a working folder of this process with the stored descriptors of
+		the media files. The folder is deleted when the process exits.
+
+		:param media: List of paths to media files
+		:rtype: Path of the working folder, for `IMVCore.DescriptorFolder`
+		"""
+
+		if self.work is None:
+			self.work = os.path.join(self.work_root, str(os.getpid()))
+			atexit.register(shutil.rmtree, self.work, True)
+		shutil.rmtree(self.work, ignore_errors=True)
+		os.makedirs(self.work)
+
+		self.media = dict((path, self.folder(path)) for path in media)
+		provided = {}
+		self.new = []
+		for folder in sorted(set(self.media.values())):
+			names = _files(folder)
+			if not names:
+				self.new.append(folder)
+			for name in names:
+				provided.setdefault(name, []).append(folder)
+
+		self.origins = {}
+		for name, folders in provided.iteritems():
+			# same-named descriptors of different media would overwrite each
+			# other, leave those to be analysed again
+			if len(folders) == 1:
+				_copy(folders[0], self.work, [name])
+				self.origins[name] = folders[0]
+		self.checked_out = _files(self.work)
+		return self.work
+
+	def owner(self, name):
+		"""
+		Finds the descriptor folder of the media a new descriptor file belongs
+		to: the media whose file name (or name without extension) the
+		descriptor's file name starts with, the longest match winning.
+		Otherwise, if only one media file had no descriptors, that one.
+
+		:param name: Path of the descriptor file relative to the working folder
+		:rtype: Descriptor folder, or None if no single media matches
+		"""
+
+		base = os.path.basename(name).lower()
+		matches = {}
+		for path, folder in self.media.iteritems():
+			filename = os.path.basename(path).lower()
+			for prefix in (filename, os.path.splitext(filename)[0]):
+				if prefix and base.startswith(prefix):
+					matches.setdefault(len(prefix), set()).add(folder)
+					break
+		if matches:
+			folders = matches[max(matches)]
+			return len(folders) == 1 and folders.pop() or None
+		if len(self.new) == 1:
+			return self.new[0]
+		return None
+
+	def checkin(self):
+		"""
+		Stores the descriptors the runtime wrote to the working folder since
+		`checkout`. Changed files are stored back where they came from, new
+		files with the media `owner` assigns them to.
+		"""
+
+		if self.work is None:
+			return
+		for name, stat in _files(self.work).iteritems():
+			if self.checked_out.get(name) == stat:
+				continue
+			folder = self.origins.get(name) or self.owner(name)
+			if folder is None:
+				# unknown media, stored descriptors must not mix media
+				continue
+			try:
+				_copy(self.work, folder, [name])
+			except (IOError, OSError):
+				# e.g. evicted concurrently, the media is analysed again
+				pass
+
+	def folders(self):
+		"""
+		Lists all descriptor folders of all builds.
+
+		:rtype: List of (last used timestamp, path) tuples, least recently
+			used first
+		"""
+
+		folders = []
+		for build in os.listdir(self.root):
+			if not os.path.isdir(os.path.join(self.root, build)):
+				continue
+			for key in os.listdir(os.path.join(self.root, build)):
+				path = os.path.join(self.root, build, key)
+				folders.append((os.path.getmtime(path), path))
+		return sorted(folders)
+
+	def evict(self, max_size=MAX_SIZE, max_age=MAX_AGE):
+		"""
+		Deletes descriptor folders that have not been used for `max_age`
+		seconds, then the least recently used ones until the store is no larger
+		than `max_size` bytes. Also deletes working folders left behind by
+		killed runs, and the digests of media files that have changed or are
+		gone (see `cache.evict_digests`).
+
+		:param max_size: Maximum total size of the store in bytes
+		:param max_age: Maximum number of seconds since a folder was last used
+		:rtype: List of deleted folders
+		"""
+
+		folders = [(used, path, _folder_size(path)) for used, path in self.folders()]
+		total = sum(size for used, path, size in folders)
+		now = time.time()
+		evicted = []
+		cache.evict_digests()
+		if os.path.isdir(self.work_root):
+			for name in os.listdir(self.work_root):
+				path = os.path.join(self.work_root, name)
+				if now - os.path.getmtime(path) > WORK_AGE:
+					shutil.rmtree(path, ignore_errors=True)
+		for used, path, size in folders:
+			if now - used <= max_age and total <= max_size:
+				break
+			shutil.rmtree(path, ignore_errors=True)
+			total -= size
+			evicted.append(path)
+		return evicted
@@ -1,54 +1,217 @@
 """
 Miscellaneous enumerators
+
+On .NET, the enumerators are defined from tables of their members, which are
+generated from MVRuntimeLib once per runtime build and stored in the local
+muFAT cache (see `generate`), instead of searching the runtime's enum types on
+every import. Tables are keyed by the runtime build (`GetRuntimeSpecialBuild`)
+together with the interop assembly version, as enum values can change between
+runtime builds without a new interop assembly version. The tables can also be loaded without the runtime being
+present, e.g. to decode values from logs on another machine.
+
+Every enumerator supports membership checks and reverse lookups:
+
+	assert SourceType.IMAGE in SourceType
+	print SourceType.name(SourceType.IMAGE)		# 'IMAGE'
 """
 
-def enum(cls):
+import imp, os, pprint, sys
+from . import cache
+
+# enumerators: name -> (MVRuntimeLib enum type, prefix of member names)
+SOURCES = {
+	'SourceType': ('MV_SRC_TYPE_ENUM', 'SRC_TYPE_'),
+	'InitFlags': ('MV_INIT_ENUM', 'INIT_'),
+	'LoadFlags': ('MV_LOAD_FLAGS', 'LOAD_'),
+	'MakeFlags': ('MV_MAKE_ENUM', 'MAKE_'),
+	'TimelineType': ('MV_TL_TYPE_ENUM', 'TL_TYPE_'),
+	'ArType': ('MV_AR_TYPE_ENUM', 'AR_TYPE'),
+}
+
+__all__ = SOURCES.keys()
+
+
+class EnumType(type):
 	"""
-	Decorator that generates a dummy Python class with static members imported
-	from MVRuntimeLib's enumerator flags. Example usage:
-	
-	@enum
-	class SourceType:
-		# imports all MV_SRC_TYPE_ENUM flags which names are prefixed with "SRC_TYPE_"
-		_src = MV_SRC_TYPE_ENUM
-		_prefix = 'SRC_TYPE_'
+	Metaclass of enumerators, adding membership checks and reverse lookups by
+	value
 	"""
 
-	for name in filter(lambda n: n.startswith(cls._prefix), dir(cls._src)):
-		setattr(cls, name.replace(cls._prefix, ''), getattr(cls._src, name))
-	return cls
+	def __contains__(cls, value):
+		try:
+			return int(value) in cls._names
+		except (TypeError, ValueError):
+			return False
+
+	def name(cls, value):
+		"""
+		Gets the name of a member by its value, or None if there is no such
+		member (e.g. combined flags)
+		"""
+
+		try:
+			return cls._names.get(int(value))
+		except (TypeError, ValueError):
+			return None
+
+class Enum(object):
+	__metaclass__ = EnumType
+
+	# member names, keyed by integer value
+	_names = {}
+
+def define(name, members, convert=None):
+	"""
+	Creates an enumerator class.
+
+	Example:
+		ArType = define('ArType', { '_4_3': 0, '_16_9': 1 })
+
+	:param name: Name of the enumerator
+	:param members: Dictionary of member names to values
+	:param convert: Function to convert values with before they are assigned
+		to the members, e.g. to the runtime's enum type
+	"""
+
+	attrs = { '_names': {} }
+	# aliases of the same value are looked up by the first name alphabetically
+	for member, value in sorted(members.iteritems(), reverse=True):
+		attrs['_names'][int(value)] = member
+		attrs[member] = convert(value) if convert is not None else value
+	return EnumType(name, (Enum,), attrs)
+
+def from_class(cls):
+	"""
+	Creates an enumerator from a class of constants, e.g. one defined by the
+	native bindings on MacOS
+	"""
+
+	if isinstance(cls, EnumType):
+		return cls
+	members = dict((name, getattr(cls, name)) for name in dir(cls)
+			if not name.startswith('__') and isinstance(getattr(cls, name), (int, long)))
+	return define(cls.__name__, members)
+
+#==== tables
+
+def snapshot():
+	"""
+	Reads the members of all enumerators from MVRuntimeLib.
+
+	:rtype: Dictionary of enumerator names to dictionaries of member names to
+		integer values
+	"""
+
+	import MVRuntimeLib
+	tables = {}
+	for name, (source, prefix) in SOURCES.iteritems():
+		enum = getattr(MVRuntimeLib, source)
+		tables[name] = dict((member.replace(prefix, ''), int(getattr(enum, member)))
+				for member in dir(enum) if member.startswith(prefix))
+	return tables
+
+def interop_version():
+	"""Gets the version of the loaded MVRuntimeLib interop assembly"""
+
+	import clr, MVRuntimeLib
+	enum = getattr(MVRuntimeLib, SOURCES['SourceType'][0])
+	return str(clr.GetClrType(enum).Assembly.GetName().Version)
+
+def runtime_build():
+	"""Gets the build number of the loaded muvee runtime"""
+
+	from .mvrt import Core
+	return Core.GetRuntimeSpecialBuild()
+
+def current_version():
+	"""
+	Gets the version the tables of the loaded runtime are stored under, e.g.
+	"1.0.0.0-5123" for interop assembly version 1.0.0.0 and runtime build 5123
+	"""
+
+	return '%s-%s' % (interop_version(), runtime_build())
+
+def _path(version):
+	return os.path.join(cache.cache_dir('enums'), 'enums_%s.py' % version.replace('.', '_'))
+
+def generate(version=None):
+	"""
+	Generates the module of enumerator tables for the loaded MVRuntimeLib.
+
+	:param version: Version to store the tables for. Default:
+		`current_version`
+	:rtype: Path to the generated module
+	"""
+
+	version = version or current_version()
+	path = _path(version)
+	temp = '%s.%d.tmp' % (path, os.getpid())
+	with open(temp, 'w') as f:
+		f.write('# Generated by muvee.enums from MVRuntimeLib %s, do not edit\n\n' % version)
+		f.write('VERSION = %r\n\n' % version)
+		f.write('TABLES = %s\n' % pprint.pformat(snapshot()))
+	if os.path.exists(path):
+		os.remove(path)
+	os.rename(temp, path)
+	return path
+
+def versions():
+	"""Lists the versions that enumerator tables have been generated for"""
+
+	folder = cache.cache_dir('enums')
+	return sorted(f[len('enums_'):-len('.py')].replace('_', '.')
+			for f in os.listdir(folder) if f.startswith('enums_') and f.endswith('.py'))
+
+def load_tables(version=None):
+	"""
+	Loads generated enumerator tables, without needing the runtime.
+
+	:param version: Version to load the tables of, see `current_version`.
+		Default: the most recently generated version
+	:rtype: Dictionary of enumerator names to dictionaries of member names to
+		integer values
+	"""
+
+	if version is None:
+		available = versions()
+		assert available, "No enumerator tables generated yet"
+		version = max(available, key=lambda v: os.path.getmtime(_path(v)))
+	return imp.load_source('muvee._enums_' + version.replace('.', '_'),
+			_path(version)).TABLES
+
+def load(version=None):
+	"""
+	Same as `load_tables`, but returns the enumerator classes.
+
+	Example:
+		print load().SourceType.name(2)
+
+	:rtype: Object with the enumerators as attributes
+	"""
+
+	class Enumerators(object):
+		pass
+	for name, members in load_tables(version).iteritems():
+		setattr(Enumerators, name, define(name, members))
+	return Enumerators
 
 #==== Start definitions ====
 
-from MVRuntimeLib import *
-
-@enum
-class SourceType:
-	# imports all MV_SRC_TYPE_ENUM flags which names are prefixed with "SRC_TYPE_"
-	_src = MV_SRC_TYPE_ENUM
-	_prefix = 'SRC_TYPE_'
-
-@enum
-class InitFlags:
-	_src = MV_INIT_ENUM
-	_prefix = 'INIT_'
-
-@enum
-class LoadFlags:
-	_src = MV_LOAD_FLAGS
-	_prefix = 'LOAD_'
-
-@enum
-class MakeFlags:
-	_src = MV_MAKE_ENUM
-	_prefix = 'MAKE_'
-
-@enum
-class TimelineType:
-	_src = MV_TL_TYPE_ENUM
-	_prefix = 'TL_TYPE_'
-
-@enum
-class ArType:
-	_src = MV_AR_TYPE_ENUM
-	_prefix = 'AR_TYPE'
+if sys.platform == 'cli':
+	import MVRuntimeLib
+	from System import Enum as _ClrEnum
+
+	_version = current_version()
+	if not os.path.isfile(_path(_version)):
+		generate(_version)
+	for _name, _members in load_tables(_version).iteritems():
+		_type = getattr(MVRuntimeLib, SOURCES[_name][0])
+		globals()[_name] = define(_name, _members,
+				lambda value, t=_type: _ClrEnum.ToObject(t, value))
+
+
+if __name__ == "__main__":
+	if sys.platform == 'cli':
+		print "Generated", generate()
+	for version in versions():
+		print version
@@ -0,0 +1,119 @@
+"""
+Early termination of muFAT children whose output shows that the run cannot
+succeed any more, e.g. after a known crash signature or a storm of runtime
+assertions, instead of waiting for the watchdog or a progress timeout.
+
+Rules are regular expressions matched against each line of output, with the
+number of matching lines within a time window that makes the run fatal. The
+default `RULES` only match crash signatures. They can be replaced with a JSON
+list of rules in the MUFAT_FATAL_RULES environment variable, either inline or
+as a path to a file, e.g. to also stop on storms of runtime assertions:
+
+	[{ "name": "crash", "pattern": "Segmentation fault|EXC_BAD_ACCESS", "count": 1, "window": 60 },
+	 { "name": "assert storm", "pattern": "ASSERT FAILED", "count": 100, "window": 60 }]
+"""
+
+import json, os, re, signal, time
+from collections import deque
+from .resources import process_tree
+
+RULES = [
+	# crash signatures after which the child can only hang
+	{ 'name': 'crash', 'pattern': r"Segmentation fault|EXC_BAD_ACCESS|Fatal Python error|"
+			r"Unhandled Exception: System\.(AccessViolation|StackOverflow)Exception",
+			'count': 1, 'window': 60 },
+]
+
+def load_rules():
+	"""Reads the rules from MUFAT_FATAL_RULES, or returns the default `RULES`"""
+
+	value = os.environ.get('MUFAT_FATAL_RULES', '').strip()
+	if value and not value.startswith('['):
+		with open(value) as f:
+			value = f.read()
+	return value and json.loads(value) or RULES
+
+
+class Rule(object):
+	"""
+	A pattern that is fatal once it matched `count` lines within `window`
+	seconds.
+	"""
+
+	def __init__(self, name, pattern, count=1, window=60):
+		self.name = name
+		self.pattern = re.compile(pattern)
+		self.count = count
+		self.window = window
+		# times of recent matches
+		self.matches = deque()
+
+	def match(self, line, now):
+		"""
+		Checks a line of output against the rule.
+
+		:rtype: True if the rule's threshold has been reached
+		"""
+
+		if not self.pattern.search(line):
+			return False
+		self.matches.append(now)
+		while now - self.matches[0] > self.window:
+			self.matches.popleft()
+		return len(self.matches) >= self.count
+
+
+class FatalMonitor(object):
+	"""
+	Evaluates rules against the output of a child.
+
+	Example:
+		fatal = FatalMonitor()
+		for line in output:
+			if fatal.feed(line):
+				p.kill()
+		result["fatal"] = fatal.reason
+	"""
+
+	def __init__(self, rules=None):
+		"""
+		:param rules: List of rule dictionaries of 'name', 'pattern', 'count'
+			and 'window'. Default: `load_rules()`
+		"""
+
+		self.rules = [Rule(**rule) for rule in (rules or load_rules())]
+		self.reason = None
+
+	def feed(self, line, now=None):
+		"""
+		Checks a line of output against all rules.
+
+		:rtype: Reason the child should be terminated, only the first time a
+			rule's threshold is reached, otherwise None
+		"""
+
+		if self.reason is not None:
+			return None
+		now = now or time.time()
+		for rule in self.rules:
+			if rule.match(line, now):
+				self.reason = "%s: %d matching line(s) within %ss, last: %s" % \
+					(rule.name, len(rule.matches), rule.window, line.strip())
+				return self.reason
+
+def terminate(process):
+	"""
+	Kills a child process and all processes it started, e.g. the runner's
+	child when started through a shell.
+
+	:param process: `subprocess.Popen` object
+	"""
+
+	for pid in process_tree(process.pid):
+		if pid != process.pid:
+			try:
+				os.kill(pid, signal.SIGKILL)
+			except OSError:
+				pass
+	if process.poll() is None:
+		process.kill()
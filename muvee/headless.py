@@ -0,0 +1,95 @@
+import Queue, threading, time
+
+
+class HeadlessWindow(object):
+	def __init__(self, width=320, height=240, setup=None, teardown=None):
+		"""
+		Creates a window-less stand-in for the native windows, for running
+		preview and render stubs on hosts without a GUI session. There is no
+		native window handle, so `hwnd` is None, which renderers take as a null
+		target and render offscreen (as the simulated runtime does).
+
+		:param width: Width of the window
+		:param height: Height of the window
+		:param setup: Function callback to call when the window has been created
+		:param teardown: Function delegate to call when the window is closed.
+			Default: `__exit__`
+		"""
+
+		self.width = width
+		self.height = height
+		self.teardown = teardown or self.__exit__
+		self.events = Queue.Queue()
+		self.closed = threading.Event()
+		if setup is not None:
+			setup.__call__()
+
+	def __enter__(self):
+		"""
+		Override this function to specify what happens when the window is initialized
+		"""
+		return self
+
+	def __exit__(self, *args):
+		"""
+		Override this function to specify what happens when the window is closed
+		or closing.
+		"""
+		pass
+
+	def call_soon(self, func, *args):
+		"""
+		Schedules a function to be called from the event loop, i.e. the thread
+		running `show`.
+		"""
+		self.events.put((func, args))
+
+	def show(self):
+		"""
+		Runs the event loop until the window is closed, or returns immediately
+		if it already was.
+		"""
+
+		print time.ctime(), "Headless: Starting event loop..."
+		try:
+			while not self.closed.isSet():
+				try:
+					func, args = self.events.get(timeout=0.1)
+				except Queue.Empty:
+					continue
+				func(*args)
+		except KeyboardInterrupt:
+			print time.ctime(), "Interrupted."
+		finally:
+			print time.ctime(), "Headless: Event loop ended."
+
+	def resize(self, width, height):
+		"""
+		Changes the size of the window, and calls `resized` from the event
+		loop if the subclass defines it, like a native window's resize event.
+		"""
+
+		self.width = width
+		self.height = height
+		if hasattr(self, 'resized'):
+			self.call_soon(self.resized, self, None)
+
+	def _closing(self):
+		# same as a native window's closing event, runs in the event loop
+		if not self.closed.isSet():
+			self.teardown(self, None)
+			self.closed.set()
+
+	def close(self):
+		"""
+		Closes the window from the event loop, which calls the teardown
+		delegate and then ends the loop.
+		"""
+
+		if not self.closed.isSet():
+			self.call_soon(self._closing)
+
+	@property
+	def hwnd(self):
+		# no native window, render offscreen
+		return None
@@ -0,0 +1,108 @@
+"""
+Journal of the progress of a muFAT night, for resuming it after the runner
+was interrupted.
+
+Every database key gets an append-only file in the local muFAT cache, with a
+line of JSON for the arguments the night was started with, and for every run
+that was started or finished. Lines are flushed to disk as they are written,
+so the journal survives the runner being killed or the host rebooting.
+
+Example:
+	journal = Journal(DBKEY)
+	if not journal.is_finished(suite, run):
+		journal.start(suite, run)
+		...
+		journal.finish(suite, run)
+"""
+
+import json, os, time
+from . import cache
+
+
+class Journal(object):
+	"""
+	Progress of the runs of one database key.
+	"""
+
+	def __init__(self, dbkey, path=None):
+		"""
+		:param dbkey: Database key of the night
+		:param path: File to store the journal in. Default: a file per key in
+			the 'journal' folder of the local muFAT cache
+		"""
+
+		self.dbkey = dbkey
+		self.path = path or os.path.join(cache.cache_dir('journal'),
+				'%s.log' % dbkey.replace(':', '-').replace(',', '_'))
+		self.args = None
+		self.started = set()
+		self.finished = set()
+		if os.path.isfile(self.path):
+			self._read()
+
+	def _read(self):
+		line = '\n'
+		with open(self.path) as f:
+			for line in f:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					# last line was cut off while being written
+					continue
+				if entry['event'] == 'args':
+					self.args = entry['args']
+				elif entry['event'] == 'start':
+					self.started.add((entry['suite'], entry['run']))
+				elif entry['event'] == 'finish':
+					self.finished.add((entry['suite'], entry['run']))
+		# terminate a cut off line, so that it does not corrupt the next one
+		if not line.endswith('\n'):
+			with open(self.path, 'a') as f:
+				f.write('\n')
+
+	def _write(self, event, **values):
+		values.update({ 'event': event, 'time': time.time() })
+		with open(self.path, 'a') as f:
+			f.write(json.dumps(values) + '\n')
+			f.flush()
+			os.fsync(f.fileno())
+
+	def exists(self):
+		"""Checks whether anything has been journalled for the key yet"""
+
+		return os.path.isfile(self.path)
+
+	def begin(self, args):
+		"""
+		Records the suites or runs the night was started with.
+
+		:param args: List of suite names or run names
+		"""
+
+		self.args = list(args)
+		self._write('args', args=self.args)
+
+	def start(self, suite, run):
+		"""Records that a run has been started"""
+
+		self.started.add((suite, run))
+		self._write('start', suite=suite, run=run)
+
+	def finish(self, suite, run):
+		"""Records that a run has finished and its results were submitted"""
+
+		self.finished.add((suite, run))
+		self._write('finish', suite=suite, run=run)
+
+	def is_finished(self, suite, run):
+		return (suite, run) in self.finished
+
+	def in_flight(self):
+		"""
+		Lists the runs that were started but never finished, e.g. because
+		the runner was interrupted during them.
+
+		:rtype: Set of (suite, run) tuples
+		"""
+
+		return self.started - self.finished
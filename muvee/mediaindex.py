@@ -0,0 +1,77 @@
+"""
+Persistent index of media metadata, so that verifying the same media again
+does not require creating runtime sources.
+
+Entries are keyed by the media's path, size and modification time, and stored
+per runtime build in the local muFAT cache.
+"""
+
+import os
+from . import cache
+
+# metadata stored for every media file
+FIELDS = ('width', 'height', 'aspect_ratio', 'aspect_ratio_x', 'aspect_ratio_y',
+	'duration', 'type')
+
+
+class MediaIndex(object):
+	"""
+	Media metadata for a single runtime build.
+
+	Example:
+		index = MediaIndex(Core.GetRuntimeSpecialBuild())
+		index.update(paths, probe)
+		print index.get(paths[0])['width']
+	"""
+
+	def __init__(self, build=0, path=None):
+		"""
+		:param build: Build number of the muvee runtime
+		:param path: File to store the index in. Default: a file per build in
+			the 'media' folder of the local muFAT cache
+		"""
+
+		self.path = path or os.path.join(cache.cache_dir('media'), '%s.bin' % build)
+		self.entries = cache.load(self.path, {})
+
+	@staticmethod
+	def key(path):
+		"""Gets the index key for a media file"""
+
+		path = os.path.realpath(path)
+		st = os.stat(path)
+		return (path, st.st_size, repr(st.st_mtime))
+
+	def get(self, path):
+		"""
+		Looks up the metadata of a media file.
+
+		:param path: Path to the media file
+		:rtype: Dictionary of `FIELDS`, or None if not indexed
+		"""
+
+		values = self.entries.get(self.key(path))
+		if values is not None:
+			return dict(zip(FIELDS, values))
+
+	def update(self, paths, probe):
+		"""
+		Indexes all media files that are not indexed yet, and saves the index
+		once done, merged with entries other processes saved in the meantime.
+
+		:param paths: List of paths to media files
+		:param probe: Function called with a list of paths of unindexed media,
+			which must return a list of metadata dictionaries in the same order
+		:rtype: List of metadata dictionaries for all `paths`
+		"""
+
+		missing = [path for path in set(paths) if self.key(path) not in self.entries]
+		if missing:
+			added = dict((self.key(path), tuple(metadata.get(f) for f in FIELDS))
+					for path, metadata in zip(missing, probe(missing)))
+			# re-read just before writing, so that concurrent runs do not drop
+			# each other's entries
+			self.entries = cache.load(self.path, {})
+			self.entries.update(added)
+			cache.dump(self.entries, self.path)
+		return [self.get(path) for path in paths]
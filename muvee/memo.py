@@ -0,0 +1,94 @@
+"""
+Cache of muFAT run results, to avoid repeating runs whose outcome cannot have
+changed.
+
+A result is keyed by the content hash of the run file, the runtime build and
+the platform, and stored in the local muFAT cache together with the content
+hashes of the media the run used (as found by `testing.detect_media`) and of
+the helper modules it imported from beside the run file. It is only reused
+while all of those files are unchanged.
+
+Fields that describe the night a result was submitted in rather than the run
+itself, such as its new assertions and timing regressions, are not stored.
+
+Example:
+	memo = ResultCache(build)
+	result = memo.get(runfile)
+	if result is None:
+		result = ...
+		memo.put(runfile, result, result["media"] + result["modules"])
+"""
+
+import json, os, sys, time
+from hashlib import sha1
+from . import cache
+
+# result fields that only hold for the night a result was submitted in
+NIGHTLY = ('new_asserts', 'regressions', 'cached')
+
+
+class ResultCache(object):
+	"""
+	Results of runs on one runtime build and platform.
+	"""
+
+	def __init__(self, build, platform=sys.platform, root=None):
+		"""
+		:param build: Build number of the muvee runtime
+		:param platform: Platform the runs are made on
+		:param root: Folder to store results in. Default: the 'results'
+			folder in the local muFAT cache
+		"""
+
+		self.build = build
+		self.platform = platform
+		self.root = root or cache.cache_dir('results')
+
+	def path(self, runfile, build=None):
+		"""Gets the file storing the result of a run file"""
+
+		key = "|".join([cache.file_digest(runfile), str(build or self.build), self.platform])
+		return os.path.join(self.root, sha1(key).hexdigest() + '.bin')
+
+	def get(self, runfile):
+		"""
+		Looks up the result of a run.
+
+		:param runfile: Path to the run file
+		:rtype: Copy of the stored result with a 'cached' entry describing its
+			origin, or None if there is none or its media has changed
+		"""
+
+		entry = cache.load(self.path(runfile))
+		if entry is None:
+			return None
+		for path, digest in entry['media'].iteritems():
+			try:
+				if cache.file_digest(path) != digest:
+					return None
+			except OSError:
+				return None
+		result = json.loads(entry['result'])
+		result['cached'] = { 'dbkey': entry['dbkey'], 'time': entry['time'] }
+		return result
+
+	def put(self, runfile, result, media=(), build=None, dbkey=None):
+		"""
+		Stores the result of a run.
+
+		:param runfile: Path to the run file
+		:param result: Result dictionary, as submitted
+		:param media: Paths to the media and helper modules the run used
+		:param build: Runtime build the run was made with. Default: `build`
+		:param dbkey: Database key the result was submitted under
+		"""
+
+		entry = {
+			'media': dict((path, cache.file_digest(path)) for path in media
+					if os.path.isfile(path)),
+			'result': json.dumps(dict((key, value) for key, value in result.iteritems()
+					if key not in NIGHTLY)),
+			'dbkey': dbkey,
+			'time': time.time(),
+		}
+		cache.dump(entry, self.path(runfile, build))
@@ -0,0 +1,261 @@
+"""
+Placement of concurrently running muFAT children on CPU cores, and limits on
+their memory and file sizes, so that one runaway child cannot starve the
+others.
+
+Every child is given whole physical cores of one package where possible.
+Runners on the same machine coordinate through lock files per logical CPU in
+the local muFAT cache, so that each CPU is used by one child at a time. A
+runner waits for a free set of cores if all are taken.
+
+Children are confined with a cgroup v2 group per CPU set (or per child, if
+only memory is limited) where the runner is allowed to create one (Linux,
+usually as root), which limits both the CPUs and memory. Otherwise the CPUs
+are set with `taskset` where available, and memory is limited with
+`setrlimit(RLIMIT_DATA)`. macOS mostly does not enforce RLIMIT_DATA, so a
+'memory_limit' of 'rlimit' recorded there names a limit that is not actually
+applied. File sizes are always limited with `setrlimit`. Placement is not
+supported on Windows.
+
+Example:
+	placement = Placement(cores=2, memory_mb=4096, file_mb=8192)
+	slot = placement.acquire()
+	p = subprocess.Popen(slot.command(cmd), shell=True, preexec_fn=slot.preexec)
+	p.communicate()
+	slot.release()
+	result["placement"] = slot.info
+"""
+
+import itertools, os, time
+from distutils.spawn import find_executable
+from . import cache
+
+try:
+	import fcntl, resource
+except ImportError:
+	# e.g. on Windows
+	fcntl = resource = None
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+MB = 1024 * 1024
+
+# numbers the cgroups of children that are not placed on CPUs
+_groups = itertools.count(1)
+
+def _read(path):
+	with open(path) as f:
+		return f.read().strip()
+
+def _write(path, value):
+	with open(path, 'w') as f:
+		f.write(value)
+
+def parse_cpus(value):
+	"""Parses a list of CPUs, e.g. "0-3,8" -> [0, 1, 2, 3, 8]"""
+
+	cpus = []
+	for part in value.split(','):
+		if '-' in part:
+			first, last = part.split('-')
+			cpus.extend(range(int(first), int(last) + 1))
+		elif part.strip():
+			cpus.append(int(part))
+	return cpus
+
+def allowed_cpus():
+	"""Lists the logical CPUs this process may run on"""
+
+	try:
+		for line in _read('/proc/self/status').splitlines():
+			if line.startswith('Cpus_allowed_list:'):
+				return parse_cpus(line.split(':', 1)[1].strip())
+	except (IOError, OSError):
+		pass
+	import multiprocessing
+	return range(multiprocessing.cpu_count())
+
+def topology():
+	"""
+	Groups the allowed logical CPUs by physical core.
+
+	:rtype: List of lists of logical CPUs, one per physical core, ordered by
+		package and core
+	"""
+
+	cores = {}
+	for cpu in allowed_cpus():
+		path = '/sys/devices/system/cpu/cpu%d/topology/' % cpu
+		try:
+			key = int(_read(path + 'physical_package_id')), int(_read(path + 'core_id'))
+		except (IOError, OSError, ValueError):
+			# unknown topology, e.g. on MacOS
+			key = 0, cpu
+		cores.setdefault(key, []).append(cpu)
+	return [sorted(cores[key]) for key in sorted(cores)]
+
+def cpu_sets(cores):
+	"""
+	Splits the allowed CPUs into sets of whole physical cores.
+
+	:param cores: Number of physical cores per set
+	:rtype: List of lists of logical CPUs
+	"""
+
+	physical = topology()
+	sets = [sum(physical[i:i + cores], []) for i in xrange(0, len(physical) - cores + 1, cores)]
+	return sets or [sum(physical, [])]
+
+def _cgroup(name, cpus, memory_mb):
+	"""
+	Creates (or updates) a cgroup v2 group limiting CPUs and memory.
+
+	:rtype: Path of the group, or None if cgroups cannot be used
+	"""
+
+	if not os.path.isfile(os.path.join(CGROUP_ROOT, 'cgroup.controllers')):
+		return None
+	try:
+		base = os.path.join(CGROUP_ROOT, 'mufat')
+		path = os.path.join(base, name)
+		for folder in (base, path):
+			if not os.path.isdir(folder):
+				os.mkdir(folder)
+		for parent in (CGROUP_ROOT, base):
+			_write(os.path.join(parent, 'cgroup.subtree_control'), '+cpuset +memory')
+		if cpus is not None:
+			_write(os.path.join(path, 'cpuset.cpus'), ','.join(map(str, cpus)))
+		_write(os.path.join(path, 'memory.max'), memory_mb and str(memory_mb * MB) or 'max')
+		if os.access(os.path.join(path, 'cgroup.procs'), os.W_OK):
+			return path
+	except (IOError, OSError):
+		pass
+	return None
+
+
+class Slot(object):
+	"""
+	CPUs and limits of one child, reserved until released.
+	"""
+
+	def __init__(self, cpus, locks, memory_mb=None, file_mb=None):
+		self.cpus = cpus
+		self.locks = locks
+		self.memory_mb = memory_mb
+		self.file_mb = file_mb
+		self.cgroup = None
+		# a CPU set is only used by one child at a time, but otherwise the
+		# memory limit must not be shared with other children
+		self.shared = cpus is not None
+		if cpus is not None or memory_mb:
+			if self.shared:
+				name = 'cpus_' + '_'.join(map(str, cpus))
+			else:
+				name = 'child_%d_%d' % (os.getpid(), next(_groups))
+			self.cgroup = _cgroup(name, cpus, memory_mb)
+		self.taskset = cpus is not None and not self.cgroup and find_executable('taskset')
+
+	@property
+	def info(self):
+		"""Dictionary describing the placement, for recording with the result"""
+
+		affinity = memory_limit = None
+		if self.cpus is not None:
+			affinity = self.cgroup and 'cgroup' or self.taskset and 'taskset' or None
+		if self.memory_mb:
+			memory_limit = self.cgroup and 'cgroup' or 'rlimit'
+		return {
+			'cpus': self.cpus,
+			'affinity': affinity,
+			'memory_mb': self.memory_mb,
+			'memory_limit': memory_limit,
+			'file_mb': self.file_mb,
+		}
+
+	def command(self, cmd):
+		"""
+		Wraps a shell command line to run on the slot's CPUs.
+
+		:param cmd: Command line string
+		"""
+
+		if self.taskset:
+			return "%s -c %s %s" % (self.taskset, ','.join(map(str, self.cpus)), cmd)
+		return cmd
+
+	def preexec(self):
+		"""Applies the limits, inside the child before it is executed"""
+
+		if self.cgroup:
+			_write(os.path.join(self.cgroup, 'cgroup.procs'), str(os.getpid()))
+		elif self.memory_mb:
+			resource.setrlimit(resource.RLIMIT_DATA, (self.memory_mb * MB,) * 2)
+		if self.file_mb:
+			resource.setrlimit(resource.RLIMIT_FSIZE, (self.file_mb * MB,) * 2)
+
+	def release(self):
+		"""Frees the slot's CPUs for other children"""
+
+		for lock in self.locks:
+			lock.close()
+		self.locks = []
+		if self.cgroup and not self.shared:
+			try:
+				os.rmdir(self.cgroup)
+			except OSError:
+				# e.g. processes of the child are still alive
+				pass
+
+
+class Placement(object):
+	"""
+	Placement policy of the children of a runner.
+	"""
+
+	def __init__(self, cores=None, memory_mb=None, file_mb=None):
+		"""
+		:param cores: Number of physical cores per child. Default: no CPU
+			placement
+		:param memory_mb: Memory limit per child in megabytes
+		:param file_mb: Limit on the size of files written by a child in
+			megabytes
+		"""
+
+		assert fcntl is not None, "Placement of children is not supported on this platform"
+		self.sets = cores and cpu_sets(cores) or None
+		self.memory_mb = memory_mb
+		self.file_mb = file_mb
+		self.folder = cache.cache_dir('cpus')
+
+	def _lock(self, cpus):
+		# locks all CPUs of a set, or none if any of them is taken
+		locks = []
+		for cpu in cpus:
+			lock = open(os.path.join(self.folder, 'cpu%d.lock' % cpu), 'a')
+			# children must not inherit the lock and hold it after release
+			fcntl.fcntl(lock, fcntl.F_SETFD, fcntl.fcntl(lock, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+			try:
+				fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except IOError:
+				lock.close()
+				for lock in locks:
+					lock.close()
+				return None
+			locks.append(lock)
+		return locks
+
+	def acquire(self, poll=5):
+		"""
+		Reserves the first free set of CPUs, waiting until one is free.
+
+		:param poll: Seconds between attempts while all sets are taken
+		:rtype: `Slot`
+		"""
+
+		if self.sets is None:
+			return Slot(None, [], self.memory_mb, self.file_mb)
+		while True:
+			for cpus in self.sets:
+				locks = self._lock(cpus)
+				if locks is not None:
+					return Slot(cpus, locks, self.memory_mb, self.file_mb)
+			time.sleep(poll)
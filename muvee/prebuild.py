@@ -0,0 +1,162 @@
+"""
+Ahead-of-time generation of the wrappers used by `muvee.gen_stub`.
+
+All interfaces cast with `gen_stub` in `stubs.py` and the `stub__*` modules are
+compiled into a single assembly (or on non-.NET platforms, a generated Python
+module of casting functions) stored in the local muFAT cache. `gen_stub` loads
+it on first use and registers each wrapper when it is first asked for, so test
+runs never have to wait for the Roslyn compiler.
+
+Run this as part of the build, or let the first test run generate it:
+
+	ipy -m muvee.prebuild
+"""
+
+import logging, os, re, sys
+from hashlib import sha1
+from .cache import cache_dir
+
+# interfaces that are only casted to under an alias on some platforms
+EXTRA_INTERFACES = ['IMVVideoInfo2', 'IMVVideoInfo3']
+# version of the generated code, part of the cache key
+VERSION = 2
+
+def find_interfaces():
+	"""
+	Scans `stubs.py` and the `stub__*` modules for interface names passed
+	to `gen_stub`.
+
+	:rtype: Sorted list of interface names
+	"""
+
+	folder = os.path.dirname(os.path.realpath(__file__))
+	pattern = re.compile(r"gen_stub\(\s*(IMV\w+)\s*\)")
+	names = set(EXTRA_INTERFACES)
+	for f in os.listdir(folder):
+		if f == 'stubs.py' or (f.startswith('stub__') and f.endswith('.py')):
+			with open(os.path.join(folder, f)) as fp:
+				names.update(pattern.findall(fp.read()))
+	return sorted(names)
+
+def resolve(names):
+	"""
+	Looks up the original interface classes for the given names, skipping
+	interfaces that are not available in this runtime.
+
+	:param names: List of interface names
+	:rtype: List of classes
+	"""
+
+	import muvee
+	classes = []
+	for name in names:
+		# once replaced by a wrapper, the original class is kept as _[name]
+		cls = getattr(muvee, '_' + name, None) or getattr(muvee, name, None)
+		if cls is not None:
+			classes.append(cls)
+	return classes
+
+def _path(classes):
+	"""Gets the location of the prebuilt wrappers for the given classes"""
+
+	if sys.platform == 'cli':
+		from MVRuntimeLib import StubGenerator
+		keys = [StubGenerator(cls).CacheKey for cls in classes]
+		ext = '.dll'
+	else:
+		# key generated functions by the native bindings they were made for
+		from . import mvrt
+		keys = [cls.__name__ for cls in classes]
+		binary = getattr(mvrt, '__file__', '')
+		if binary and os.path.exists(binary):
+			keys.append('%s:%d' % (binary, os.stat(binary).st_mtime))
+		ext = '.py'
+	key = sha1('|'.join([str(VERSION)] + keys)).hexdigest()
+	return os.path.join(cache_dir('stubs'), 'prebuilt_' + key + ext)
+
+def build(classes=None):
+	"""
+	Generates the wrappers for all given classes at once, if not already
+	generated.
+
+	:param classes: List of classes to generate wrappers for. Default: all
+		interfaces used by the stubs.
+	:rtype: Path to the generated assembly or module
+	"""
+
+	if classes is None:
+		classes = resolve(find_interfaces())
+	path = _path(classes)
+	if os.path.isfile(path):
+		return path
+
+	logging.info('Generating stubs for %d interfaces', len(classes))
+	if sys.platform == 'cli':
+		from System import Array, Type
+		from MVRuntimeLib import StubGenerator
+		import clr
+		types = Array[Type]([clr.GetClrType(cls) for cls in classes])
+		StubGenerator.CompileAll(types, path)
+	else:
+		temp = '%s.%d.tmp' % (path, os.getpid())
+		with open(temp, 'w') as f:
+			print >> f, '# generated by muvee.prebuild, do not edit'
+			for cls in classes:
+				# same as `muvee.Castor`
+				print >> f, '\ndef %s(obj):' % cls.__name__
+				print >> f, '\tfunc = getattr(obj, %r, None)' % ('To' + cls.__name__)
+				print >> f, '\tif func is None:'
+				print >> f, '\t\traise NotImplementedError'
+				print >> f, '\treturn func()'
+			print >> f, '\nCASTS = {'
+			for cls in classes:
+				print >> f, '\t%r: %s,' % (cls.__name__, cls.__name__)
+			print >> f, '}'
+		if os.path.exists(path):
+			os.remove(temp)
+		else:
+			os.rename(temp, path)
+	return path
+
+def load(generate=None):
+	"""
+	Loads the prebuilt wrappers, generating them first if needed.
+
+	:param generate: Whether to generate missing wrappers now instead of
+		leaving it to `gen_stub`. Default: true, unless the MUFAT_PREBUILD
+		environment variable is set to 0.
+	:rtype: Dictionary mapping original classes to their wrappers
+	"""
+
+	if generate is None:
+		generate = os.environ.get('MUFAT_PREBUILD', '1') != '0'
+
+	path = None
+	try:
+		classes = resolve(find_interfaces())
+		path = _path(classes)
+		if not os.path.isfile(path):
+			if not generate:
+				return {}
+			build(classes)
+
+		if sys.platform == 'cli':
+			from System.Reflection import Assembly
+			import clr
+			assembly = Assembly.LoadFrom(path)
+			clr.AddReference(assembly)
+			stubs = dict((cls, assembly.GetType('MVRuntimeLib.%sWrapper' % cls.__name__))
+					for cls in classes)
+		else:
+			import imp
+			module = imp.load_source('muvee._prebuilt_stubs', path)
+			stubs = dict((cls, module.CASTS[cls.__name__]) for cls in classes)
+	except Exception:
+		# fall back to generating wrappers one at a time
+		logging.exception('Could not load prebuilt stubs from %s', path)
+		return {}
+	return dict((cls, stub) for cls, stub in stubs.iteritems() if stub is not None)
+
+
+if __name__ == "__main__":
+	print "Prebuilt stubs:", build()
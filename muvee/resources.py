@@ -0,0 +1,256 @@
+"""
+Resource usage accounting of muFAT child processes.
+
+While a run executes, its process and all processes it started are sampled
+periodically for memory, thread and handle usage, from /proc on Linux or `ps`
+on other POSIX systems. CPU time is taken from the resource usage of reaped
+children (see `resource.getrusage`) where available, so that it also covers
+processes that exited between samples. The `ps` processes used for sampling
+are children too, so their own usage is left out.
+"""
+
+import os, subprocess, sys, threading, time
+
+try:
+	import resource
+except ImportError:
+	# e.g. on Windows
+	resource = None
+
+def children_usage():
+	"""
+	Gets the resource usage of all reaped child processes so far.
+
+	:rtype: Tuple of (CPU seconds, peak RSS in bytes), or None if unavailable
+	"""
+
+	if resource is None:
+		return None
+	return _usage(resource.getrusage(resource.RUSAGE_CHILDREN))
+
+def _usage(usage):
+	# converts a resource.struct_rusage to (CPU seconds, peak RSS in bytes)
+	# ru_maxrss is in bytes on MacOS, in kilobytes elsewhere
+	scale = sys.platform == 'darwin' and 1 or 1024
+	return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * scale
+
+# total CPU seconds and peak RSS of the ps processes run for sampling, which are
+# included in `children_usage`
+_sampler_usage = [0.0, 0]
+_sampler_lock = threading.Lock()
+
+def _ps(*fields):
+	"""Lists all processes with ps, recording the usage of ps itself"""
+
+	p = subprocess.Popen(['ps', '-A', '-o', ','.join(field + '=' for field in fields)],
+			stdout=subprocess.PIPE)
+	if not hasattr(os, 'wait4'):
+		return p.communicate()[0]
+	output = p.stdout.read()
+	p.stdout.close()
+	# reap ps here instead of in Popen to get its resource usage
+	status, usage = os.wait4(p.pid, 0)[1:]
+	p.returncode = status
+	cpu, rss = _usage(usage)
+	with _sampler_lock:
+		_sampler_usage[0] += cpu
+		_sampler_usage[1] = max(_sampler_usage[1], rss)
+	return output
+
+def _read(path):
+	with open(path) as f:
+		return f.read()
+
+def _sample_proc(root):
+	"""Samples a process tree from /proc"""
+
+	page_size = os.sysconf('SC_PAGE_SIZE')
+	ticks = float(os.sysconf('SC_CLK_TCK'))
+	stats = {}
+	for pid in os.listdir('/proc'):
+		if not pid.isdigit():
+			continue
+		try:
+			# fields after the executable name, which may contain spaces
+			stat = _read('/proc/%s/stat' % pid).rpartition(')')[2].split()
+		except (IOError, OSError):
+			continue
+		stats[int(pid)] = stat
+
+	sample = { 'rss': 0, 'cpu': 0.0, 'threads': 0, 'handles': 0 }
+	for pid in _descendants(root, dict((pid, int(stat[1])) for pid, stat in stats.iteritems())):
+		stat = stats[pid]
+		sample['rss'] += int(stat[21]) * page_size
+		sample['cpu'] += (int(stat[11]) + int(stat[12])) / ticks
+		sample['threads'] += int(stat[17])
+		try:
+			sample['handles'] += len(os.listdir('/proc/%d/fd' % pid))
+		except OSError:
+			pass
+	return sample
+
+def _cpu_seconds(value):
+	# parses ps cpu times, e.g. "1-02:03:04", "02:03:04" or "3:04.56"
+	days, _, value = value.rpartition('-')
+	seconds = 0.0
+	for part in value.split(':'):
+		seconds = seconds * 60 + float(part)
+	return seconds + int(days or 0) * 86400
+
+def _sample_ps(root):
+	"""Samples a process tree with ps, without thread or handle counts"""
+
+	rows = {}
+	for line in _ps('pid', 'ppid', 'rss', 'time').splitlines():
+		fields = line.split()
+		if len(fields) == 4:
+			rows[int(fields[0])] = fields
+
+	sample = { 'rss': 0, 'cpu': 0.0, 'threads': None, 'handles': None }
+	for pid in _descendants(root, dict((pid, int(row[1])) for pid, row in rows.iteritems())):
+		sample['rss'] += int(rows[pid][2]) * 1024
+		sample['cpu'] += _cpu_seconds(rows[pid][3])
+	return sample
+
+def _descendants(root, parents):
+	"""
+	Lists a process and all of its descendants.
+
+	:param root: Process ID to start from
+	:param parents: Dictionary of parent process IDs, keyed by process ID
+	"""
+
+	children = {}
+	for pid, ppid in parents.iteritems():
+		children.setdefault(ppid, []).append(pid)
+	pids = []
+	pending = root in parents and [root] or []
+	while pending:
+		pid = pending.pop()
+		pids.append(pid)
+		pending.extend(children.get(pid, []))
+	return pids
+
+def process_tree(pid):
+	"""
+	Lists a process and all of its descendants.
+
+	:param pid: Process ID
+	:rtype: List of process IDs, empty if the platform cannot be inspected
+	"""
+
+	parents = {}
+	if os.path.isdir('/proc/self'):
+		for child in os.listdir('/proc'):
+			if child.isdigit():
+				try:
+					parents[int(child)] = int(_read('/proc/%s/stat' % child).rpartition(')')[2].split()[1])
+				except (IOError, OSError):
+					pass
+	elif os.name == 'posix':
+		for line in _ps('pid', 'ppid').splitlines():
+			fields = line.split()
+			if len(fields) == 2:
+				parents[int(fields[0])] = int(fields[1])
+	return _descendants(pid, parents)
+
+def sample(pid):
+	"""
+	Samples the resource usage of a process and all of its descendants.
+
+	:param pid: Process ID
+	:rtype: Dictionary of total 'rss' (bytes), 'cpu' (seconds), 'threads' and
+		'handles' (None if unavailable), or None if the platform cannot be
+		sampled
+	"""
+
+	if os.path.isdir('/proc/self'):
+		return _sample_proc(pid)
+	elif os.name == 'posix':
+		return _sample_ps(pid)
+	return None
+
+
+class ResourceMonitor(threading.Thread):
+	"""
+	Thread sampling the resource usage of a child process and its descendants
+	until stopped.
+
+	Example:
+		p = subprocess.Popen(...)
+		monitor = ResourceMonitor(p.pid)
+		monitor.start()
+		p.communicate()
+		result['resources'] = monitor.stop()
+	"""
+
+	def __init__(self, pid, interval=2.0):
+		"""
+		:param pid: Process ID of the child process
+		:param interval: Seconds between samples
+		"""
+
+		super(ResourceMonitor, self).__init__()
+		self.daemon = True
+		self.pid = pid
+		self.interval = interval
+		self.samples = []
+		self.started = time.time()
+		self.usage = children_usage()
+		self.sampler_cpu = _sampler_usage[0]
+		self.stopped = threading.Event()
+
+	def run(self):
+		while not self.stopped.isSet():
+			try:
+				s = sample(self.pid)
+			except Exception, e:
+				print "Could not sample resource usage:", e
+				return
+			if not s:
+				return
+			self.samples.append(s)
+			self.stopped.wait(self.interval)
+
+	def stop(self):
+		"""
+		Stops sampling once the child process has exited and been reaped.
+
+		:rtype: Summary dictionary of peak and mean memory usage (MB), CPU time
+			(seconds) and utilization (percent of one core), and peak thread and
+			handle counts, with None for anything unavailable
+		"""
+
+		self.stopped.set()
+		self.join()
+		wall = time.time() - self.started
+		samples = [s for s in self.samples if s['rss']]
+
+		def peak(key):
+			values = [s[key] for s in samples if s[key] is not None]
+			if values:
+				return max(values)
+
+		rss = peak('rss')
+		cpu = peak('cpu')
+		usage = children_usage()
+		if usage is not None and self.usage is not None:
+			# without the CPU time of sampling with ps
+			cpu = usage[0] - self.usage[0] - (_sampler_usage[0] - self.sampler_cpu)
+			# the peak of all children ever, only meaningful if raised by this one
+			if usage[1] > max(self.usage[1], _sampler_usage[1]):
+				rss = max(rss or 0, usage[1])
+
+		def mb(value):
+			if value is not None:
+				return round(value / 1048576.0, 1)
+
+		return {
+			'rss_peak_mb': mb(rss),
+			'rss_mean_mb': mb(samples and sum(s['rss'] for s in samples) / len(samples) or None),
+			'cpu_s': cpu if cpu is None else round(cpu, 2),
+			'cpu_pct': cpu if cpu is None or not wall else round(100 * cpu / wall, 1),
+			'threads_peak': peak('threads'),
+			'handles_peak': peak('handles'),
+			'samples': len(samples),
+		}
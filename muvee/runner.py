@@ -1,9 +1,20 @@
 import codecs, json, os, re, requests, shutil, socket, subprocess, sys, time
 from hashlib import sha1
 from lxml import etree
+from artifacts import ArtifactStore
+from assertindex import AssertIndex
+from descriptors import DescriptorStore
+from failfast import FatalMonitor, load_rules, terminate
+from journal import Journal
+from memo import ResultCache
+from placement import Placement
 from queue import RedisQueue
-from testing import normalize
+from resources import ResourceMonitor
+import rvl
+from testing import detected_media, normalize
+from timings import TimingHistory, parse_summary
 from watchdog import Watchdog
+from workqueue import Heartbeat, LocalBackend, RedisBackend, WorkQueue, platform_tags
 import boto
 
 DB = "dailygrid_MacSDK"
@@ -68,6 +79,45 @@ def load_suite(name, from_file="runconfig.xml"):
 	return runs
 
 
+def runfile(runname):
+	"""Gets the path of a muFAT run's script"""
+
+	return normalize(os.path.join(r"Y:\mufat\testruns\regressionpaths", runname))
+
+
+def runtime_build(cmd):
+	"""
+	Gets the build number of the muvee runtime, from a child process so that
+	the runtime is not loaded into the parent.
+
+	:param cmd: Command to launch a child process with
+	"""
+
+	output = subprocess.Popen(" ".join(cmd + ["--runtime-build"]), shell=True,
+			stdout=subprocess.PIPE).communicate()[0]
+	lines = output.strip().splitlines()
+	assert lines, "Could not get the runtime build"
+	return lines[-1].strip()
+
+
+def submit(suite, run, result):
+	"""
+	Uploads a run's results to the muFAT server.
+
+	:param suite: Name of the suite the run belongs to
+	:param run: Name of the run
+	:param result: Result dictionary
+	"""
+
+	print "Uploading intermediate results..."
+	r = requests.post(SERVER_URL + "%s/%s/%s/submit" % (DB, DBKEY, HOST), {
+		'suite': suite,
+		'runname': run,
+		'results': json.dumps(result)
+	}, headers={ "X-NO-LOGIN": "1" })
+	r.raise_for_status()
+
+
 def do_child(runname, debug=False):
 	"""
 	Run a test inside the child process.
@@ -85,10 +135,17 @@ def do_child(runname, debug=False):
 		print "Cleaning folder:", Core.UserDataFolder
 		shutil.rmtree(Core.UserDataFolder)
 
-	path = normalize(os.path.join(r"Y:\mufat\testruns\regressionpaths", runname))
+	path = runfile(runname)
 	sys.path.append(os.path.dirname(path))
 	results = run_path(path, run_name="__main__")
 
+	# helper modules imported from beside the run file, e.g. 'include'
+	modules = set()
+	for module in sys.modules.values():
+		source = getattr(module, "__file__", None)
+		if source and os.path.dirname(os.path.abspath(source)) == os.path.dirname(path):
+			modules.add(os.path.splitext(os.path.abspath(source))[0] + ".py")
+
 	# return results to parent for processing
 	if not debug:
 		q = RedisQueue("_".join(["Q", DBKEY, HOST]))
@@ -102,25 +159,75 @@ def do_child(runname, debug=False):
 			'retained_samples': [],
 			'return_code': 0,
 			'timeout': False,
-			'svn_rev': Core.GetRuntimeSpecialBuild()
+			'svn_rev': Core.GetRuntimeSpecialBuild(),
+			'media': sorted(detected_media),
+			'modules': sorted(modules)
 		})
 
 	Core.Release()
 	sys.exit(0)
 
 
-def main(suites_or_runs, debug=False):
+def suite_tags(name, from_file="runconfig.xml"):
+	"""
+	Gets the platform tags of hosts that a suite's runs may be executed on,
+	from the comma-separated 'platforms' attribute of the suite. Runs given by
+	filename belong to the "mac" suite, which is restricted to Macs.
+
+	:param name: Name of muFAT suite
+	:rtype: List of tags, empty if the suite may run anywhere
+	"""
+
+	if os.path.exists(from_file):
+		xml = etree.parse(from_file).getroot()
+		platforms = xml.xpath("suite[@name='%s']/@platforms" % name)
+		if platforms:
+			return [tag.strip() for tag in platforms[0].split(",") if tag.strip()]
+	return name == "mac" and ["mac"] or []
+
+
+def main(suites_or_runs, debug=False, shared=None, tags=None, resume=False,
+		memoize=False, rerun=False, cores=None, memory_mb=None, file_mb=None):
 	"""
 	Runs a list of suites of runs inside the parent process.
 
 	:param suites_or_runs: A list of suite names or run names to be executed
 	:param debug: Whether to actually store results
+	:param shared: Backend of a queue shared with other hosts under the same
+		`DBKEY` to pull runs from, either "redis" or "local" (for testing on
+		one machine). Default: execute all runs on this host
+	:param tags: Platform tags of this host, restricting which shared runs
+		it executes. Default: the current platform, e.g. "mac"
+	:param resume: Whether to continue an interrupted night under `DBKEY`,
+		skipping the runs it has finished. `suites_or_runs` defaults to the
+		ones the night was started with
+	:param memoize: Whether to reuse the results of earlier runs of the same
+		run file, media, runtime build and platform instead of running them
+	:param rerun: Whether to run and store results again even if memoized
+	:param cores: Number of physical cores to pin each child to, shared with
+		other runners on this machine. Default: no pinning
+	:param memory_mb: Memory limit of each child in megabytes
+	:param file_mb: Limit on the size of files written by each child in
+		megabytes
 	"""
 
+	global DBKEY
+	DBKEY = DBKEY or time.strftime("%Y-%m-%d,%H-%M-%S")
+
+	# checkpoint finished runs, to be able to resume after an interruption
+	journal = Journal(DBKEY)
+	if resume:
+		assert journal.exists(), "Nothing to resume for key %s!" % DBKEY
+		suites_or_runs = suites_or_runs or journal.args
+		for suite, run in journal.in_flight():
+			print "Rerunning interrupted run %s (%s)." % (run, suite)
+
 	suites = {}
 	# argument is just a single string
 	if isinstance(suites_or_runs, basestring):
 		suites_or_runs = [suites_or_runs]
+	if journal.args is None:
+		journal.begin(suites_or_runs)
 	for arg in suites_or_runs:
 		if os.path.splitext(arg)[1] != ".py":
 			if not suites.has_key(arg):
@@ -131,15 +238,19 @@ def main(suites_or_runs, debug=False):
 				suites["mac"] = set()
 			suites["mac"].add(arg)
 
-	global DBKEY
-	DBKEY = DBKEY or time.strftime("%Y-%m-%d,%H-%M-%S")
-
 	# cleanup/create necessary folders
 	if not os.path.exists(MUVEEDEBUG):
 		os.makedirs(MUVEEDEBUG)
 	cachedir = os.path.expanduser("~/Library/Application\ Support/muvee\ Technologies/071203")
 	if os.path.exists(cachedir):
 		shutil.rmtree(cachedir)
+	for path in DescriptorStore().evict():
+		print "Evicted descriptors:", path
+	evicted = rvl.evict()
+	if evicted:
+		print "Evicted %d parsed projects." % evicted
+	asserts_seen = AssertIndex()
+	timings = TimingHistory()
 
 	# python command to launch the child process
 	svn_rev = 0
@@ -147,101 +258,201 @@ def main(suites_or_runs, debug=False):
 	if sys.platform == "darwin":
 		cmd = ["arch -i386"] + cmd
 
-	# prepare to upload logfiles to Amazon S3
-	new_key = boto.connect_s3(AWS_ACCESS_KEY, AWS_SECRET_KEY) \
-			.get_bucket("mufat").new_key
-	subkey = time.strftime("%Y-%m-%d_%H_%M", time.strptime(DBKEY, "%Y-%m-%d,%H-%M-%S"))
+	# cores and limits of children, when several run on this machine at once
+	placement = None
+	if cores or memory_mb or file_mb:
+		placement = Placement(cores, memory_mb, file_mb)
+
+	# output patterns that end a child early
+	fatal_rules = load_rules()
+
+	# results of unchanged runs on this runtime build
+	memo = None
+	if memoize and not debug:
+		memo = ResultCache(runtime_build(cmd))
+		print "Memoizing results of runtime build", memo.build
+
+	# prepare to upload logfiles to Amazon S3, once per unique content
+	artifacts = ArtifactStore(boto.connect_s3(AWS_ACCESS_KEY, AWS_SECRET_KEY) \
+			.get_bucket("mufat"))
+
+	# pull runs from a queue shared with other hosts, or run all of them here
+	if shared:
+		tags = tags or platform_tags()
+		work = WorkQueue(DBKEY, shared == "local" and LocalBackend() or RedisBackend())
+		work.register(HOST, tags)
+		for suite, runs in suites.iteritems():
+			suite_tags_ = suite_tags(suite)
+			work.add([(suite, run, suite_tags_) for run in runs])
+		jobs = ((lease.suite, lease.run, lease) for lease in work.leases(HOST, tags))
+	else:
+		jobs = ((suite, run, None) for suite, runs in suites.iteritems() for run in runs)
 
 	global PRINT_OUTPUT
-	for suite, runs in suites.iteritems():
-		for run in runs:
-			shortname = os.path.splitext(os.path.basename(run))[0]
-			start = time.time()
-			logfile = os.path.join(MUVEEDEBUG, "(%s)%s_Log.txt" % \
-					(time.strftime("%Y%m%d%H%M%S", time.localtime(start)), shortname))
-
-			# run child process
-			print "Starting muFAT process for %s (%s)." % (run, suite)
-			p = subprocess.Popen(" ".join(cmd + ['"' + run + '"', "--child", "--key", DBKEY]),
-								shell=True,
-								stdout=subprocess.PIPE,
-								stderr=subprocess.STDOUT)
-
-			# start a watchdog to kill the child if it takes too long
-			Watchdog(p, 3600).start()
-
-			# collect output text for processing later
-			with codecs.open(logfile, "w+", "utf-8") as f:
-				while True:
-					line = unicode(p.stdout.readline(), errors="replace")
-					if not line:
-						break
-					f.write(line)
-					if PRINT_OUTPUT:
-						print line.encode("ascii", errors="replace"),
-
-			# block until process completes and record running time
-			p.communicate()
-			minutes, seconds = divmod(time.time() - start, 60)
-			hours, minutes = divmod(minutes, 60)
-
-			# read results from child
+	for suite, run, lease in jobs:
+		if resume and journal.is_finished(suite, run):
+			print "Skipping finished run %s (%s)." % (run, suite)
+			if lease is not None:
+				lease.complete()
+			continue
+		journal.start(suite, run)
+
+		# reuse the result of an identical earlier run
+		result = None
+		if memo is not None and not rerun:
 			try:
-				q = RedisQueue("_".join(["Q", DBKEY, HOST]))
-				result = q.get_nowait()
-			except RedisQueue.Empty:
-				# no results - child probably died?
-				result = {
-					'pass': 0,
-					'fail': 0,
-					'untested': 0,
-					'summary': '',
-					'shutdown': False,
-					'crash': True,
-					'retained_samples': [],
-					'return_code':-1,
-					'timeout': False
-				}
-
-			# parse log file for assertions and upload to Amazon S3
+				result = memo.get(runfile(run))
+			except OSError, e:
+				# e.g. the run file cannot be read, leave that to the child
+				print "Not reusing a result for %s: %s" % (run, e)
+		if result:
+			print "Reusing result of %s (%s) from %s." % (run, suite, result["cached"]["dbkey"])
+			# its assertions were hit again tonight; its timings were not measured
+			result["new_asserts"] = asserts_seen.record(result.get("unique_asserts", {}),
+					result.get("svn_rev"), HOST, run, DBKEY)
+			submit(suite, run, result)
+			journal.finish(suite, run)
+			if lease is not None:
+				lease.complete()
+			continue
+
+		shortname = os.path.splitext(os.path.basename(run))[0]
+		start = time.time()
+		logfile = os.path.join(MUVEEDEBUG, "(%s)%s_Log.txt" % \
+				(time.strftime("%Y%m%d%H%M%S", time.localtime(start)), shortname))
+
+		# run child process
+		slot = placement and placement.acquire()
+		command = " ".join(cmd + ['"' + run + '"', "--child", "--key", DBKEY])
+		print "Starting muFAT process for %s (%s)." % (run, suite)
+		if slot and slot.cpus is not None:
+			print "Placed on CPUs", ",".join(map(str, slot.cpus))
+		p = subprocess.Popen(slot and slot.command(command) or command,
+							shell=True,
+							stdout=subprocess.PIPE,
+							stderr=subprocess.STDOUT,
+							preexec_fn=slot and slot.preexec or None,
+							close_fds=bool(slot))
+
+		# start a watchdog to kill the child if it takes too long
+		Watchdog(p, 3600).start()
+
+		# keep the run leased while the child is alive
+		heartbeat = lease and Heartbeat(lease)
+		if heartbeat:
+			heartbeat.start()
+
+		# sample the child's memory and CPU usage while it runs
+		monitor = ResourceMonitor(p.pid)
+		monitor.start()
+
+		# collect output text for processing later, stopping the child if it
+		# cannot succeed any more
+		fatal = FatalMonitor(fatal_rules)
+		with codecs.open(logfile, "w+", "utf-8") as f:
+			while True:
+				line = unicode(p.stdout.readline(), errors="replace")
+				if not line:
+					break
+				f.write(line)
+				if PRINT_OUTPUT:
+					print line.encode("ascii", errors="replace"),
+				if fatal.feed(line):
+					print "Terminating process %d early, %s" % (p.pid, fatal.reason)
+					terminate(p)
+
+		# block until process completes and record running time
+		p.communicate()
+		resources = monitor.stop()
+		if slot:
+			slot.release()
+		if heartbeat:
+			heartbeat.stop()
+		elapsed = time.time() - start
+		minutes, seconds = divmod(elapsed, 60)
+		hours, minutes = divmod(minutes, 60)
+
+		# read results from child
+		try:
+			q = RedisQueue("_".join(["Q", DBKEY, HOST]))
+			result = q.get_nowait()
+		except RedisQueue.Empty:
+			# no results - child probably died?
+			result = {
+				'pass': 0,
+				'fail': 0,
+				'untested': 0,
+				'summary': '',
+				'shutdown': False,
+				'crash': True,
+				'retained_samples': [],
+				'return_code':-1,
+				'timeout': False
+			}
+
+			# give another host a chance to run it, unless it failed for good
+			if lease is not None and not fatal.reason and lease.release():
+				print "Returned %s to the shared queue after a crash." % run
+				os.remove(logfile)
+				continue
+
+		if fatal.reason:
+			result["fatal"] = fatal.reason
+		if slot:
+			result["placement"] = slot.info
+
+		# parse log file for assertions and upload to Amazon S3
+		try:
+			with open(logfile, "r") as f:
+				asserts, assertdict = get_asserts(f.read())
+			result.update({
+				'assert': asserts,
+				'unique_asserts': assertdict,
+				'time': (hours, minutes, seconds),
+				'resources': resources
+			})
+			result["log"] = artifacts.upload(logfile)
+		finally:
+			os.remove(logfile)
+
+		# upload summary file to Amazon S3
+		tests = []
+		if result.get("summary"):
+			summary = result["summary"]
 			try:
-				with open(logfile, "r") as f:
-					asserts, assertdict = get_asserts(f.read())
-					result.update({
-						'assert': asserts,
-						'unique_asserts': assertdict,
-						'time': (hours, minutes, seconds)
-					})
-					key = new_key("%s/%s/(%s)%s_Log.txt" % (HOST.upper(), subkey, \
-						time.strftime("%Y%m%d%H%M%S", time.localtime(start)), shortname))
-					key.set_contents_from_file(f, reduced_redundancy=True, rewind=True)
-					key.make_public()
-					result["log"] = "https://mufat.s3.amazonaws.com/" + key.key
+				tests = parse_summary(summary)
+				result["summary"] = artifacts.upload(summary)
 			finally:
-				os.remove(logfile)
-
-			# upload summary file to Amazon S3
-			if result.get("summary"):
-				summary = result["summary"]
+				os.remove(summary)
+
+		if result.get("svn_rev"):
+			svn_rev = result["svn_rev"]
+
+		if not debug:
+			# remember assertions across runs, and flag ones new to this build
+			result["new_asserts"] = asserts_seen.record(result.get("unique_asserts", {}),
+					svn_rev, HOST, run, DBKEY)
+			# compare timings of completed runs against earlier builds
+			if result.get("return_code") == 0 and not result.get("timeout"):
+				result["regressions"] = timings.check_run(run, HOST, svn_rev,
+						elapsed, tests, DBKEY)
+				for regression in result["regressions"]:
+					print "Slower than earlier builds: %s took %ss, median %ss" % \
+						(regression["test"] or run, regression["seconds"], regression["median"])
+
+			submit(suite, run, result)
+
+			if memo is not None and result.get("return_code") == 0 and not result.get("timeout"):
 				try:
-					key = new_key("%s/%s/%s" % (HOST.upper(), subkey, shortname + ".txt"))
-					key.set_contents_from_filename(summary, reduced_redundancy=True)
-					key.make_public()
-					result["summary"] = "https://mufat.s3.amazonaws.com/" + key.key
-				finally:
-					os.remove(summary)
-
-			if result.get("svn_rev"):
-				svn_rev = result["svn_rev"]
-
-			if not debug:
-				print "Uploading intermediate results..."
-				r = requests.post(SERVER_URL + "%s/%s/%s/submit" % (DB, DBKEY, HOST), {
-					'suite': suite,
-					'runname': run,
-					'results': json.dumps(result)
-				}, headers={ "X-NO-LOGIN": "1" })
-				r.raise_for_status()
+					memo.put(runfile(run), result,
+							result.get("media", []) + result.get("modules", []),
+							result.get("svn_rev"), DBKEY)
+				except OSError, e:
+					print "Not memoizing the result of %s: %s" % (run, e)
+
+		journal.finish(suite, run)
+		if lease is not None:
+			lease.complete()
 
 
 if __name__ == "__main__":
@@ -250,13 +461,37 @@ if __name__ == "__main__":
 	p.add_argument("-c", "--child", action="store_true")
 	p.add_argument("-d", "--debug", action="store_true")
 	p.add_argument("--key", help="Database key to use")
-	p.add_argument("suites_or_runs", help="Suites or runs to run")
+	p.add_argument("--shared", choices=["redis", "local"],
+			help="Pull runs from a queue shared by all hosts using the same key")
+	p.add_argument("--tags", help="Comma-separated platform tags of this host, for --shared")
+	p.add_argument("--memoize", action="store_true",
+			help="Reuse results of unchanged runs on the same runtime build")
+	p.add_argument("--rerun", action="store_true",
+			help="Run memoized runs again and replace their results")
+	p.add_argument("--cores", type=int,
+			help="Pin each child to this many physical cores not used by other runners")
+	p.add_argument("--memory", type=int, metavar="MB", help="Memory limit of each child")
+	p.add_argument("--file-size", type=int, metavar="MB",
+			help="Size limit of files written by each child")
+	p.add_argument("--runtime-build", action="store_true", help=argparse.SUPPRESS)
+	p.add_argument("--resume", metavar="KEY",
+			help="Resume an interrupted run of suites under the given database key")
+	p.add_argument("suites_or_runs", nargs="?", help="Suites or runs to run")
 	args = p.parse_args()
 
-	if not args.suites_or_runs:
+	if args.runtime_build:
+		from .mvrt import Core
+		print Core.GetRuntimeSpecialBuild()
+		Core.Release()
+		sys.exit(0)
+	if not args.suites_or_runs and not args.resume:
 		p.error("No suites or runs defined!")
-	if args.key:
+	if args.resume:
+		DBKEY = args.resume
+	elif args.key:
 		DBKEY = args.key
+	elif args.shared:
+		p.error("--shared requires a --key common to all hosts!")
 
 	import logging
 	logging.getLogger("boto").setLevel(logging.CRITICAL)
@@ -265,4 +500,7 @@ if __name__ == "__main__":
 	if args.child:
 		do_child(args.suites_or_runs, debug=args.debug)
 	else:
-		main(args.suites_or_runs, debug=args.debug)
+		main(args.suites_or_runs, debug=args.debug, shared=args.shared,
+				tags=args.tags and args.tags.split(","), resume=bool(args.resume),
+				memoize=args.memoize, rerun=args.rerun, cores=args.cores,
+				memory_mb=args.memory, file_mb=args.file_size)
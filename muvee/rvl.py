@@ -0,0 +1,261 @@
+"""
+Parser for .rvl project files.
+
+Projects are read in a single streaming pass, and every source node is reduced
+to a compact record of plain Python values as soon as it has been read, so
+that projects with thousands of sources load in bounded memory. Records are
+consumed by `muvee.stubs.LoadRvlProject`, and cached on disk by `load` so that
+repeat loads of an unchanged project skip parsing altogether. Cached projects
+that are no longer loaded are deleted by `evict`.
+
+Record layouts:
+- image:	(path, rects, caption, rotation, min_duration)
+			rects is None without a magic spot, else a tuple of (x1, x2, y1, y2)
+			caption is None or (text, font, color, x, y, height, width,
+			horizontal_align, vertical_align)
+- music:	(path, start, stop)
+- video:	(path, captions, highlights, excludes, start, stop)
+			captions is a tuple of (text, start, end, font, color, x, y,
+			height, width, horizontal_align, vertical_align)
+			highlights and excludes are tuples of (start, stop)
+- settings:	dictionary, see `read_settings`
+"""
+
+import os, sys, time
+from hashlib import sha1
+from xml.etree import ElementTree as etree
+from . import cache
+
+# version of the record layouts, bump whenever they change
+VERSION = 1
+# limits of the cache of parsed projects
+MAX_SIZE = int(os.environ.get('MUFAT_RVL_MAX_MB', 1024)) * 1024 * 1024
+MAX_AGE = float(os.environ.get('MUFAT_RVL_MAX_DAYS', 14)) * 24 * 3600
+
+def translate_alignment(align):
+	"""
+	Decodes an integer into a tuple for horizontal and vertical height
+
+	:param align: alignment integer to decode
+	"""
+
+	h = v = 0
+	bits = (align & 0x38) >> 3
+	if bits & 0x4 == bits:
+		v = 0x1 # top
+	elif bits & 0x2 == bits:
+		v = 0x10 # center
+	elif bits & 0x1 == bits:
+		v = 0x2 # bottom
+	else:
+		return h, v
+	bits = align & 0x7
+	if bits & 0x4 == bits:
+		h = 0x4 # left
+	elif bits & 0x2 == bits:
+		h = 0x10 # center
+	elif bits & 0x1 == bits:
+		h = 0x8 # right
+	else:
+		return h, v
+	return h, v
+
+def read_image(xml):
+	"""Reads an image record from a .rvl <image><file> node"""
+
+	rects = None
+	magicspot = xml.find('magicSpot')
+	if magicspot is not None:
+		rects = ()
+		if int(magicspot.attrib.get('activetype', 0)) > 0:
+			rects = tuple((float(r.attrib['X1']), float(r.attrib['X2']),
+					float(r.attrib['Y1']), float(r.attrib['Y2']))
+					for r in magicspot.findall('targetrects/rect'))
+
+	caption = xml.find('caption')
+	if caption is not None:
+		attrib = caption.attrib
+		caption = (attrib['string'], attrib['font'], long(attrib['fontcolor']),
+				float(attrib['offsetX']), float(attrib['offsetY']),
+				float(attrib['height']), float(attrib['width'])) + \
+				translate_alignment(long(attrib['align']))
+
+	return (xml.findtext('name'), rects, caption,
+			float(xml.findtext('rotation')), float(xml.findtext('minDur')))
+
+def read_music(xml):
+	"""Reads a music record from a .rvl <audio><file> node"""
+
+	cliprange = xml.find('cliprange').attrib
+	return (xml.findtext('name'), float(cliprange['start']), float(cliprange['stop']))
+
+def read_video(xml):
+	"""Reads a video record from a .rvl <video><file> node"""
+
+	captions = tuple((c.findtext('string'),
+			float(c.findtext('timeStart')), float(c.findtext('timeEnd')),
+			c.findtext('font'), long(c.findtext('fontcolor')),
+			float(c.findtext('offsetX')), float(c.findtext('offsetY')),
+			float(c.findtext('height')), float(c.findtext('width'))) + \
+			translate_alignment(long(c.findtext('align')))
+			for c in xml.findall('captions/caption'))
+	highlights = tuple((float(h.findtext('start')), float(h.findtext('stop')))
+			for h in xml.findall('highlights/highlight'))
+	excludes = tuple((float(e.findtext('start')), float(e.findtext('stop')))
+			for e in xml.findall('excludes/exclude'))
+	cliprange = xml.find('cliprange').attrib
+	return (xml.findtext('name'), captions, highlights, excludes,
+			float(cliprange['start']), float(cliprange['stop']))
+
+def _read_text(xml, prefix):
+	"""Reads the title or credits settings, or None if disabled"""
+
+	if xml.findtext('Enable' + prefix) != '1':
+		return None
+	bgtype = int(xml.findtext(prefix + 'BackgroundType'))
+	if bgtype == 1:
+		background = long(xml.findtext(prefix + 'BackgroundColor'))
+	elif bgtype == 2:
+		background = xml.findtext(prefix + 'BackgroundImage')
+	else:
+		background = None
+	return (xml.findtext(prefix + 'Text'), xml.findtext(prefix + 'Font'),
+			long(xml.findtext(prefix + 'Color')), bgtype, background)
+
+def read_settings(xml):
+	"""
+	Reads the project settings from a .rvl <settings> node, as a dictionary of:
+	- style:		name of the selected style
+	- params:		tuple of (name, value) style parameters, or None if the
+					style uses its default parameters
+	- text_params:	tuple of (name, value) style parameter strings
+	- title, credits:	None if disabled, else (text, font, color,
+					background_type, background)
+	- levels:		(voiceover, sound effects, video, music) audio levels
+	"""
+
+	params = None
+	if xml.find('SuperStyles[@default="0"]/parameter') is not None:
+		params = tuple((p.attrib['name'], float(p.attrib['value']))
+				for p in xml.findall('SuperStyles/parameter'))
+
+	return {
+		'style': xml.findtext('SelectedStyle'),
+		'params': params,
+		'text_params': tuple((p.attrib['name'], p.attrib['value'])
+				for p in xml.findall('StyleTextParams/parameter')),
+		'title': _read_text(xml, 'Title'),
+		'credits': _read_text(xml, 'Credits'),
+		'levels': tuple(float(xml.findtext('AudioMix/' + name))
+				for name in ('Voiceover', 'SoundFx', 'Video', 'Music')),
+	}
+
+# source groups in a .rvl project: group tag -> (source kind, reader)
+SOURCES = {
+	'image': ('image', read_image),
+	'audio': ('music', read_music),
+	'video': ('video', read_video),
+}
+
+# sources with equal indexes are added in this order
+ORDER = { 'image': 0, 'music': 1, 'video': 2 }
+
+def parse(path):
+	"""
+	Reads a .rvl project file in a single pass.
+
+	:param path: Path to .rvl project file
+	:rtype: A tuple containing a list of (kind, record) sources, where kind is
+		one of 'image', 'music' or 'video', sorted in the order they should be
+		added, and the settings dictionary (or None if missing)
+	"""
+
+	sources = []
+	settings = None
+	# elements from the root down to the current one
+	parents = []
+	for event, elem in etree.iterparse(path, events=('start', 'end')):
+		if event == 'start':
+			parents.append(elem)
+			continue
+
+		parents.pop()
+		depth = len(parents)
+		if depth == 2 and elem.tag == 'file' and parents[1].tag in SOURCES:
+			kind, reader = SOURCES[parents[1].tag]
+			# sources without an index go first, then by index
+			index = elem.findtext('index')
+			key = (index is not None, index is not None and int(index) or 0,
+					ORDER[kind], len(sources))
+			sources.append((key, kind, reader(elem)))
+			# release the finished source, detached from its group
+			parents[-1].remove(elem)
+		elif depth == 1:
+			if elem.tag == 'settings':
+				settings = read_settings(elem)
+			# release the finished top-level node
+			parents[-1].remove(elem)
+
+	sources.sort()
+	return [(kind, record) for key, kind, record in sources], settings
+
+def load(path):
+	"""
+	Same as `parse`, but the result is cached in the local muFAT cache, keyed by
+	the project's path, size and modification time.
+
+	:param path: Path to .rvl project file
+	"""
+
+	st = os.stat(path)
+	key = sha1('|'.join([os.path.realpath(path), str(st.st_size),
+			repr(st.st_mtime), sys.version])).hexdigest()
+	cached = os.path.join(cache.cache_dir('rvl'), key + '.bin')
+	version, project = cache.load(cached, (None, None))
+	if version == VERSION:
+		try:
+			# mark as recently used for `evict`
+			os.utime(cached, None)
+		except OSError:
+			pass
+		return project
+
+	project = parse(path)
+	cache.dump((VERSION, project), cached)
+	return project
+
+def evict(max_size=MAX_SIZE, max_age=MAX_AGE):
+	"""
+	Deletes cached projects that have not been loaded for `max_age` seconds,
+	then the least recently loaded ones until the cache is no larger than
+	`max_size` bytes.
+
+	:param max_size: Maximum total size of the cache in bytes
+	:param max_age: Maximum number of seconds since a project was last loaded
+	:rtype: Number of deleted projects
+	"""
+
+	folder = cache.cache_dir('rvl')
+	files = []
+	for name in os.listdir(folder):
+		path = os.path.join(folder, name)
+		try:
+			st = os.stat(path)
+		except OSError:
+			continue
+		files.append((st.st_mtime, path, st.st_size))
+	files.sort()
+
+	total = sum(size for used, path, size in files)
+	now = time.time()
+	evicted = 0
+	for used, path, size in files:
+		if now - used <= max_age and total <= max_size:
+			break
+		try:
+			os.remove(path)
+		except OSError:
+			continue
+		total -= size
+		evicted += 1
+	return evicted
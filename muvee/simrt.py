@@ -0,0 +1,617 @@
+"""
+Simulated muvee runtime, a pure-Python stand-in for the native `mvrt`
+bindings. Setting the MUFAT_SIMRT environment variable to 1 makes `muvee` load
+this module instead, so that the harness itself can be run and measured on
+hosts without MVRuntimeLib (e.g. Linux build hosts).
+
+Only what `muvee.stubs` relies on is simulated: sources load any existing file,
+and analysis, making and rendering report progress over a simulated duration.
+Objects implement every interface at once, so casting with the "To[Class]"
+functions returns the object itself. Anything that is not simulated raises
+AttributeError, so that stubs relying on it fail the same way everywhere.
+
+For load-testing the harness, latencies, failure rates and the runtime's log
+output are configured with a JSON object (or the path to a JSON file) in the
+MUFAT_SIMRT_CONFIG environment variable, see `DEFAULTS`. Child processes
+started by `muvee.runner` inherit the environment, so whole suites can be run
+against the simulation. Example:
+
+	MUFAT_SIMRT=1 MUFAT_SIMRT_CONFIG='{"latency": {"analysis": {"dist":
+		"lognormal", "mu": 3, "sigma": 0.5}}, "failure": {"LoadFile": 0.01}}'
+"""
+
+import itertools, json, os, random, sys, tempfile, threading, time
+from functools import wraps
+
+# build number reported by the simulated runtime
+BUILD = int(os.environ.get('MUFAT_SIMRT_BUILD', 0))
+
+# properties reported for every loaded video: duration in seconds, frame size
+# and aspect ratio
+VIDEO_INFO = {
+	'Duration': 10.0,
+	'width': 640,
+	'height': 480,
+	'AspectRatio': 0,
+	'AspectRatioX': 4,
+	'AspectRatioY': 3,
+}
+
+# default simulation settings:
+# - seed:		seed for all random decisions, or None to seed from the clock
+# - scale:		factor applied to all latencies
+# - latency:	seconds a call takes, by method name. The entries 'analysis',
+#				'make' and 'render' set how long those operations run for
+#				instead. Values are a number of seconds, or a distribution:
+#				{"dist": "uniform", "min": a, "max": b}
+#				{"dist": "normal", "mean": m, "stddev": s}
+#				{"dist": "lognormal", "mu": m, "sigma": s}
+#				{"dist": "exponential", "mean": m}
+# - failure:	probability of a call failing, by method name
+# - log:		runtime log lines printed per second of simulated work
+# - asserts:	probability of a call printing a runtime assertion, and the
+#				messages to pick assertions from
+DEFAULTS = {
+	'seed': None,
+	'scale': 1.0,
+	'latency': {},
+	'failure': {},
+	'log': 0,
+	'asserts': { 'rate': 0.0, 'messages': ['Simulated assertion'] },
+}
+
+def _load_config():
+	"""Reads the simulation settings from MUFAT_SIMRT_CONFIG"""
+
+	config = dict(DEFAULTS)
+	value = os.environ.get('MUFAT_SIMRT_CONFIG', '').strip()
+	if value and not value.startswith('{'):
+		with open(value) as f:
+			value = f.read()
+	if value:
+		config.update(json.loads(value))
+	return config
+
+class SimulatedError(Exception):
+	"""Raised by simulated calls that fail by raising instead of returning"""
+	pass
+
+
+class Simulation(object):
+	"""
+	Latency, failure and log output model of the simulated runtime
+	"""
+
+	def __init__(self, config):
+		self.config = config
+		self.random = random.Random(config['seed'])
+		# random.Random and stdout are shared by concurrently loading sources
+		self.lock = threading.Lock()
+		self.last_error = ''
+		self.pending_lines = 0.0
+
+	def sample(self, spec):
+		"""Draws a number of seconds from a latency setting"""
+
+		if isinstance(spec, (int, long, float)):
+			return float(spec)
+		dist = spec['dist']
+		with self.lock:
+			if dist == 'uniform':
+				return self.random.uniform(spec['min'], spec['max'])
+			elif dist == 'normal':
+				return self.random.normalvariate(spec['mean'], spec['stddev'])
+			elif dist == 'lognormal':
+				return self.random.lognormvariate(spec['mu'], spec['sigma'])
+			elif dist == 'exponential':
+				return self.random.expovariate(1.0 / spec['mean'])
+		raise ValueError("Unknown latency distribution: %s" % dist)
+
+	def latency(self, name):
+		"""Draws how many seconds a call or operation takes"""
+
+		spec = self.config['latency'].get(name, 0)
+		return max(0.0, self.sample(spec) * self.config['scale'])
+
+	def chance(self, rate):
+		with self.lock:
+			return rate > 0 and self.random.random() < rate
+
+	def call(self, name):
+		"""
+		Simulates a runtime call: waits for its latency and prints log output.
+
+		:rtype: Whether the call fails
+		"""
+
+		seconds = self.latency(name)
+		if seconds:
+			time.sleep(seconds)
+		self.log(seconds)
+		if self.chance(self.config['asserts']['rate']):
+			with self.lock:
+				message = self.random.choice(self.config['asserts']['messages'])
+			self.write('simrt_%s.cpp(1)  ASSERT FAILED : %s' % (name.lower(), message))
+		if self.chance(self.config['failure'].get(name, 0)):
+			self.last_error = 'Simulated failure in %s' % name
+			return True
+		return False
+
+	def log(self, seconds):
+		"""Prints the log lines of `seconds` of runtime work"""
+
+		self.pending_lines += seconds * self.config['log']
+		while self.pending_lines >= 1:
+			self.pending_lines -= 1
+			self.write('simrt.cpp(1)  Working...')
+
+	def write(self, line):
+		# prints a line the way the runtime logs to the console
+		now = time.time()
+		with self.lock:
+			sys.stdout.write('%s.%03d  %s\n' % (time.strftime('%H:%M:%S',
+					time.localtime(now)), int(now * 1000) % 1000, line))
+
+simulation = Simulation(_load_config())
+
+def configure(**settings):
+	"""
+	Replaces the simulation settings, e.g. for load tests driving the runtime
+	in-process.
+
+	Example:
+		simrt.configure(latency={ 'make': 10 }, failure={ 'AddSource': 0.1 })
+
+	:param settings: Settings to override, see `DEFAULTS`
+	"""
+
+	global simulation
+	config = _load_config()
+	config.update(settings)
+	simulation = Simulation(config)
+
+def _simulated(failed=False):
+	"""
+	Method decorator that applies the simulation's latency, failures and log
+	output to a runtime call.
+
+	:param failed: Value to return when the call fails, or an exception class
+		to raise instead
+	"""
+
+	def _f(f):
+		name = f.__name__
+
+		@wraps(f)
+		def wrapped(*args):
+			if simulation.call(name):
+				if isinstance(failed, type) and issubclass(failed, Exception):
+					raise failed(simulation.last_error)
+				return failed
+			return f(*args)
+		return wrapped
+	return _f
+
+#==== enumerators
+
+class SourceType:
+	UNKNOWN = 0
+	IMAGE = 1
+	VIDEO = 2
+	MUSIC = 3
+	TEXT = 4
+	COLOR = 5
+	OPERATOR = 6
+
+class InitFlags:
+	DEFAULT = 0
+	NO_ANALYSIS = 1
+
+class LoadFlags:
+	NULL = 0
+	VERIFYSUPPORT = 1
+	CONTEXT = 2
+	DISABLE_LOREZPROXY = 4
+
+class MakeFlags:
+	DEFAULT = 0
+	THREADED = 1
+	FORSAVING = 2
+
+class TimelineType:
+	MUVEE = 0
+	FINALPREV = 1
+	SOURCE = 2
+
+class ArType:
+	_4_3 = 0
+	_16_9 = 1
+	_3_2 = 2
+
+#==== interfaces, all implemented by `_Object`
+
+class _Object(object):
+	"""Base for all simulated runtime objects"""
+
+	def __getattr__(self, name):
+		# only called for attributes that are not simulated
+		if name.startswith('To') and name[2:] in _INTERFACES:
+			# cast to another interface
+			return lambda: self
+		raise AttributeError("%s has no simulated attribute %s" % (type(self).__name__, name))
+
+	def Release(self):
+		pass
+
+_INTERFACES = ('IMVCaptionHighlight', 'IMVCore', 'IMVCoreFactory', 'IMVExclude',
+		'IMVHighlight', 'IMVImageInfo', 'IMVOperatorInfo', 'IMVPrimaryCaption',
+		'IMVProductionOverlay', 'IMVSource', 'IMVSource2', 'IMVSourceCaption',
+		'IMVStyleEx', 'IMVStyleEx3', 'IMVSupportMultiCaptions', 'IMVTargetRect',
+		'IMVTitleCredits', 'IMVVideoInfo2', 'IMVVideoInfo3')
+for _name in _INTERFACES:
+	globals()[_name] = type(_name, (_Object,), {})
+del _name
+
+class IMVTextFormat(_Object):
+	def __init__(self):
+		self.LogFontStr = ''
+		self.Color = self.BackgroundColor = 0
+		self.TextRectXCoord = self.TextRectYCoord = 0.0
+		self.TextRectWidth = self.TextRectHeight = 1.0
+		self.VertAlign = self.HorAlign = 0
+
+class IMVCaption(_Object):
+	def __init__(self, text, start=0.0, stop=0.0):
+		self.Text = text
+		self.Start = start
+		self.Stop = stop
+		self.TextDisplayFormat = IMVTextFormat()
+
+class IMVCaptionCollection(_Object):
+	def __init__(self):
+		self.captions = []
+
+	def __getitem__(self, i):
+		return self.captions[i]
+
+	def Count(self):
+		return len(self.captions)
+
+	def AddCaption(self, text, start=0.0, stop=0.0):
+		self.captions.append(IMVCaption(text, start, stop))
+		return True
+
+	def RemoveCaption(self, i):
+		del self.captions[i]
+		return True
+
+	def Clear(self):
+		del self.captions[:]
+		return True
+
+	def VerifyUserDscrp(self):
+		return True
+
+	def ToXML(self):
+		return '<captions>%s</captions>' % ''.join(
+			'<caption start="%r" stop="%r" />' % (c.Start, c.Stop)
+			for c in self.captions)
+
+	def FromXML(self, xml):
+		from xml.etree import ElementTree as etree
+		for c in etree.fromstring(xml).findall('caption'):
+			self.AddCaption('', float(c.attrib['start']), float(c.attrib['stop']))
+		return True
+
+class IMVStyle(_Object):
+	def __init__(self, name):
+		self.InternalName = name
+
+class IMVStyleCollection(_Object):
+	def __init__(self, names):
+		self.styles = [IMVStyle(name) for name in names]
+		self.ActiveMVStyle = names[0]
+		self.params = {}
+		# IMVTitleCredits
+		self.TitleString = self.CreditsString = ''
+		self.TitleTextFormat = self.CreditsTextFormat = None
+		self.TitleBackgroundColor = self.CreditsBackgroundColor = 0
+		self.TitleBackgroundImage = self.CreditsBackgroundImage = ''
+
+	def __getitem__(self, i):
+		return self.styles[i]
+
+	@property
+	def Count(self):
+		return len(self.styles)
+
+	def GetActiveMVStyle(self):
+		return self.ActiveMVStyle
+
+	def SetActiveMVStyle(self, name):
+		self.ActiveMVStyle = name
+		return True
+
+	def SetParam(self, style, name, value):
+		self.params[style, name] = value
+		return True
+
+	SetStringParam = SetParam
+
+class IMVSourceCollection(_Object):
+	def __init__(self, sources):
+		self.sources = sources
+
+	def __getitem__(self, i):
+		return self.sources[i]
+
+	@property
+	def Count(self):
+		return len(self.sources)
+
+_unique_ids = itertools.count(1)
+
+class Source(_Object):
+	def __init__(self, srctype):
+		self.Type = srctype
+		self.Path = None
+		self.UniqueID = next(_unique_ids)
+		self.Captions = IMVCaptionCollection()
+		self.Start = self.Stop = 0.0
+		self.MinImgSegDuration = 0.0
+		self.params = {}
+		self.highlights = []
+		self.excludes = []
+		self.target_rects = []
+		self.render = _Proc('render')
+		# IMVSourceCaption
+		self.Caption = None
+		self.TextDisplayFormat = None
+		# IMVVideoInfo2/3
+		for name, value in VIDEO_INFO.iteritems():
+			setattr(self, name, srctype == SourceType.VIDEO and value or 0)
+
+	@_simulated()
+	def LoadFile(self, path, flags):
+		self.Path = path
+		return os.path.exists(path)
+
+	@_simulated()
+	def Load(self, data, flags):
+		self.Path = data
+		return True
+
+	def SetCaptionHighlight(self, text, start, stop, fmt):
+		caption = IMVCaption(text, start, stop)
+		caption.TextDisplayFormat = fmt
+		self.highlights.append(caption)
+		return True
+
+	def SetHighlight(self, start, stop):
+		self.highlights.append((start, stop))
+		return True
+
+	def SetExclusion(self, start, stop):
+		self.excludes.append((start, stop))
+		return True
+
+	SetIMVExclude = SetExclusion
+
+	def VerifyUserDescriptors(self):
+		return True
+
+	def SetParam(self, name, value):
+		self.params[name] = value
+		return True
+
+	def SetOrientation(self, rotation, verify):
+		self.params['ORIENTATION'] = rotation
+		return True
+
+	def AddTargetRect(self, *coords):
+		self.target_rects.append(coords)
+		return True
+
+	# previews of single sources
+
+	def SetupRender(self, hwnd, x, y, width, height, callback):
+		return True
+
+	RefreshRender = SetupRender
+
+	@_simulated()
+	def StartRenderProc(self):
+		return self.render.start()
+
+	@_simulated(-1.0)
+	def GetRenderProgress(self):
+		return self.render.poll()
+
+	def StopRenderProc(self):
+		self.render.stop()
+
+	def ShutdownRender(self):
+		return True
+
+#==== core
+
+class _Proc(object):
+	"""Simulated long-running runtime operation"""
+
+	def __init__(self, name):
+		self.name = name
+		self.started = None
+
+	def start(self):
+		self.started = self.polled = time.time()
+		self.duration = simulation.latency(self.name)
+		return True
+
+	def poll(self):
+		if self.started is None:
+			return -1.0
+		now = time.time()
+		simulation.log(now - self.polled)
+		self.polled = now
+		if self.duration <= 0:
+			return 1.0
+		return min(1.0, (now - self.started) / self.duration)
+
+	def wait(self):
+		# blocks until the operation is done
+		if self.started is not None:
+			time.sleep(max(0, self.started + self.duration - time.time()))
+			self.poll()
+
+	def stop(self):
+		self.started = None
+
+class _Core(_Object):
+	def __init__(self):
+		self._reset()
+
+	def _reset(self):
+		self.sources = []
+		self.Styles = IMVStyleCollection(['S00505_Reflections', 'S00509_Cuts',
+				'S00518_Jump', 'S10000_BlankStyle'])
+		self.AspectRatio = ArType._4_3
+		self.DescriptorFolder = self.CommonDataFolder = \
+				os.path.join(tempfile.gettempdir(), 'simrt')
+		self.UserDataFolder = os.path.join(self.CommonDataFolder, 'user')
+		self.ModuleLocation = __file__
+		self.MusicLevel = self.SyncSoundLevel = 1.0
+		self.SoundEffectLevel = self.AudioExtLevel = 1.0
+		# IMVPrimaryCaption
+		self.PrimaryCaption = IMVCaption('')
+		# IMVProductionOverlay
+		self.OverlaySourceFile = ''
+		self.OverlayOpacity = 1.0
+		self.overlay_placement = self.overlay_crop = None
+		self.render_path = None
+		self.analysis = _Proc('analysis')
+		self.make = _Proc('make')
+		self.render = _Proc('render')
+		self.duration = 0.0
+
+	@_simulated()
+	def Init(self, flags=InitFlags.DEFAULT):
+		self._reset()
+		return True
+
+	def GetRuntimeSpecialBuild(self):
+		return BUILD
+
+	def GetLastErrorDescription(self):
+		return simulation.last_error
+
+	@_simulated(SimulatedError)
+	def CreateMVSource(self, srctype):
+		return Source(srctype)
+
+	@_simulated()
+	def AddSource(self, srctype, src, flags):
+		self.sources.append(src)
+		return True
+
+	@property
+	def MusicSources(self):
+		return IMVSourceCollection([src for src in self.sources
+				if src.Type == SourceType.MUSIC])
+
+	def CreateMVTextFormatObj(self):
+		return IMVTextFormat()
+
+	def SetOverlayPlacement(self, *placement):
+		self.overlay_placement = placement
+		return True
+
+	def SetOverlayCropRect(self, *crop):
+		self.overlay_crop = crop
+		return True
+
+	def GetStyleCollection(self):
+		return self.Styles
+
+	def GetActiveMVStyle(self):
+		return self.Styles.ActiveMVStyle
+
+	@_simulated()
+	def SetActiveMVStyle(self, name):
+		return self.Styles.SetActiveMVStyle(name)
+
+	ActiveMVStyle = property(GetActiveMVStyle, lambda self, name: self.Styles.SetActiveMVStyle(name))
+
+	@_simulated()
+	def StartAnalysisProc(self, flags):
+		return self.analysis.start()
+
+	@_simulated(-1.0)
+	def GetAnalysisProgress(self):
+		return self.analysis.poll()
+
+	def StopAnalysisProc(self):
+		self.analysis.stop()
+
+	@_simulated()
+	def MakeMuveeTimeline(self, mode, duration):
+		self.duration = float(duration)
+		self.make.start()
+		if not mode & MakeFlags.THREADED:
+			self.make.wait()
+		return True
+
+	@_simulated(-1.0)
+	def GetMakeProgress(self):
+		return self.make.poll()
+
+	def CancelMake(self):
+		self.make.stop()
+
+	def GetTimelineDuration(self, timeline):
+		return self.duration
+
+	def ConfigRenderTL2File(self, path):
+		self.render_path = path
+		return True
+
+	@_simulated()
+	def StartRenderTL2FileProc(self, path, *args):
+		return self.render.start()
+
+	@_simulated(-1.0)
+	def GetRenderTL2FileProgress(self):
+		return self.render.poll()
+
+	def StopRenderTL2FileProc(self):
+		self.render.stop()
+
+	def RefreshTL2File(self, hwnd, x, y, width, height, callback):
+		return True
+
+	def SetupRenderTL2Wnd(self, timeline, hwnd, x, y, width, height, callback):
+		return True
+
+	def RefreshTL2Wnd(self, timeline, hwnd, x, y, width, height, callback):
+		return True
+
+	def ShutdownRenderTL2Wnd(self, timeline):
+		return True
+
+	@_simulated()
+	def StartRenderTL2WndProc(self, timeline):
+		return self.render.start()
+
+	@_simulated(-1.0)
+	def GetRenderTL2WndProgress(self, timeline):
+		return self.render.poll()
+
+	def StopRenderTL2WndProc(self, timeline):
+		self.render.stop()
+
+# the runtime's IMVCore instance
+Core = _Core()
+
+def Release():
+	"""Same as the native bindings' Release"""
+
+	Core._reset()
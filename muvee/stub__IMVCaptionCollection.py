@@ -1,32 +1,47 @@
 from xml.etree import ElementTree as etree
-from . import stub_class, ProxyMixin
+from . import stub_class, ProxyCollectionMixin
+
+# caption attributes compared by VerifyUserDscrp
+TIME_FIELDS = ('Start', 'Stop')
+FORMAT_FIELDS = tuple('TextDisplayFormat.' + f for f in ('LogFontStr', 'Color',
+	'TextRectXCoord', 'TextRectYCoord', 'TextRectWidth', 'TextRectHeight',
+	'VertAlign', 'HorAlign'))
 
 @stub_class
-class IMVCaptionCollection(ProxyMixin):
+class IMVCaptionCollection(ProxyCollectionMixin):
 	"""Pythonic wrapper for MVRuntimeLib.IMVCaptionCollection"""
 
 	def __init__(self, proxyobj, *args, **kwargs):
 		super(IMVCaptionCollection, self).__init__(proxyobj, *args, **kwargs)
 
-	def __len__(self):
-		return self.Count()
-
-	def __getitem__(self, key):
-		obj = object.__getattribute__(self, '_proxyobj')
-		return obj[key]
+	def _fetch_len(self):
+		return self._proxyobj.Count()
 
 	def __delitem__(self, key):
 		return self.RemoveCaption(key)
 
-	def __iter__(self):
-		for i in xrange(len(self)):
-			yield self.__getitem__(i)
-
 	def __setitem__(self, *args, **kwargs):
 		raise NotImplementedError
 
+	def AddCaption(self, *args):
+		self.invalidate()
+		return self._proxyobj.AddCaption(*args)
+
+	def RemoveCaption(self, *args):
+		self.invalidate()
+		return self._proxyobj.RemoveCaption(*args)
+
+	def Clear(self):
+		self.invalidate()
+		return self._proxyobj.Clear()
+
+	def FromXML(self, *args):
+		self.invalidate()
+		return self._proxyobj.FromXML(*args)
+
 	def VerifyUserDscrp(self):
-		oldcaptions = list(self)
+		fields = TIME_FIELDS + FORMAT_FIELDS
+		oldcaptions = self.snapshot(*fields)
 		xml = self.ToXML()
 		assert etree.fromstring(xml) is not None, \
 			"ToXML returned invalid XML: " + str(xml)
@@ -38,22 +53,13 @@ class IMVCaptionCollection(ProxyMixin):
 		assert len(self) == len(oldcaptions), \
 			"Captions count mismatched"
 
-		for older, newer in zip(oldcaptions, self):
+		split = len(TIME_FIELDS)
+		for older, newer in zip(oldcaptions, self.snapshot(*fields)):
 			#assert older.Text == newer.Text, \
 			#	"Caption text mismatched: %s != %s" % (older.Text, newer.Text)
-			assert older.Start == newer.Start and older.Stop == newer.Stop, \
+			assert older[:split] == newer[:split], \
 				"Caption highlight time mismatched"
-
-			fmt1 = older.TextDisplayFormat
-			fmt2 = newer.TextDisplayFormat
-			assert fmt1.LogFontStr == fmt2.LogFontStr and \
-				fmt1.Color == fmt2.Color and \
-				fmt1.TextRectXCoord == fmt2.TextRectXCoord and \
-				fmt1.TextRectYCoord == fmt2.TextRectYCoord and \
-				fmt1.TextRectWidth == fmt2.TextRectWidth and \
-				fmt1.TextRectHeight == fmt2.TextRectHeight and \
-				fmt1.VertAlign == fmt2.VertAlign and \
-				fmt1.HorAlign == fmt2.HorAlign, \
+			assert older[split:] == newer[split:], \
 				"TextDisplayFormat mismatched"
 
 		return True
@@ -1,26 +1,18 @@
-from . import stub_class, ProxyMixin
+from . import stub_class, ProxyCollectionMixin
 
 @stub_class
-class IMVStyleCollection(ProxyMixin):
+class IMVStyleCollection(ProxyCollectionMixin):
 	"""Pythonic wrapper for MVRuntimeLib.IMVStyleCollection"""
 
 	def __init__(self, *args, **kwargs):
 		super(IMVStyleCollection, self).__init__(*args, **kwargs)
 
-	def __len__(self):
-		return self.Count
-
-	def __getitem__(self, key):
-		obj = object.__getattribute__(self, '_proxyobj')
-		return obj[key]
+	def _fetch_len(self):
+		return self._proxyobj.Count
 
 	def __delitem__(self, key):
 		raise NotImplementedError
 
-	def __iter__(self):
-		for i in xrange(len(self)):
-			yield self.__getitem__(i)
-
 	def __setitem__(self, *args, **kwargs):
 		raise NotImplementedError
 
@@ -12,15 +12,16 @@ Example stubs:
 - muvee.AddSourceImage
 """
 
-import inspect, os, re, sys, threading, time
+import inspect, os, re, sys, threading, time, Queue
 from functools import wraps
 from xml.etree import ElementTree as etree
-from . import gen_stub, ArType, InitFlags, LoadFlags, MakeFlags, SourceType, \
+from . import gen_stub, track, ProxyScope, ArType, InitFlags, LoadFlags, MakeFlags, SourceType, \
 	TimelineType, IMVExclude, IMVHighlight, IMVImageInfo, IMVOperatorInfo, \
 	IMVPrimaryCaption, IMVSource, IMVSource2, IMVStyleCollection, IMVStyleEx, \
 	IMVSupportMultiCaptions, IMVTargetRect, IMVTitleCredits
+from . import rvl
+from .rvl import translate_alignment
 from .testing import detect_media, generate_test, normalize
-from .window import Window
 
 
 def is_a_stub(f):
@@ -45,6 +46,14 @@ def is_true_or_non_zero(ret):
 	return ret == None or ret == True or \
 		(type(ret) in [ int, float ] and ret >= 0)
 
+# state of the current session, reset by `Init`:
+# - media: paths of all media files added as sources
+# - loaded: paths of media files loaded by `CreateSource` but not added yet, by
+#   id of the source
+# - cold: whether analysis must not reuse descriptors from earlier runs
+# - descriptors: whether the run chose its own descriptor folder
+_session = { 'media': [], 'loaded': {}, 'cold': False, 'descriptors': False }
+
 
 @is_a_stub
 def Init(flags=InitFlags.DEFAULT):
@@ -52,6 +61,7 @@ def Init(flags=InitFlags.DEFAULT):
 
 	from .mvrt import Core
 	Core.Init(flags)
+	_session.update(media=[], loaded={}, cold=False, descriptors=False)
 
 @is_a_stub
 def Release():
@@ -68,7 +78,11 @@ def AddSource(src, srctype=SourceType.UNKNOWN, loadtype=LoadFlags.VERIFYSUPPORT)
 	if srctype == SourceType.UNKNOWN:
 		srctype = int(src.Type)
 	assert Core.AddSource(srctype, src, loadtype), \
-			'AddSource failed: ' + GetLastErrorDescription()
+			'AddSource failed for %s source: %s' % (SourceType.name(srctype),
+			GetLastErrorDescription())
+	path = _session['loaded'].pop(id(src), None)
+	if path is not None:
+		_session['media'].append(path)
 
 def CreateSource(path, srctype):
 	"""
@@ -79,12 +93,14 @@ def CreateSource(path, srctype):
 	"""
 
 	from .mvrt import Core
-	src = Core.CreateMVSource(srctype)
+	src = track(Core.CreateMVSource(srctype))
 	if srctype in [ SourceType.IMAGE, SourceType.MUSIC, SourceType.VIDEO ]:
 		path = normalize(path)
 		assert os.path.exists(path), "File %s does not exist" % path
 		assert src.LoadFile(path, LoadFlags.VERIFYSUPPORT), \
 			'LoadFile failed: ' + GetLastErrorDescription()
+		# only media that is added is analysed, not media that is just probed
+		_session['loaded'][id(src)] = path
 	elif srctype == SourceType.OPERATOR:
 		assert os.path.exists(path), "File %s does not exist" % path
 		assert src.LoadFile(path, LoadFlags.NULL), \
@@ -95,6 +111,100 @@ def CreateSource(path, srctype):
 		src2.Load(path, int(LoadFlags.CONTEXT))
 	return src
 
+# how many sources batch functions create and load at the same time. Sources
+# are created one at a time unless opted in with MUFAT_SOURCE_WORKERS, as the
+# runtime's objects are not known to be safe to call from worker threads (e.g.
+# apartment-threaded COM objects on Windows).
+SOURCE_WORKERS = int(os.environ.get('MUFAT_SOURCE_WORKERS', 1))
+
+def map_concurrent(func, items, workers=None):
+	"""
+	Same as `map`, but calls `func` on a pool of threads. Results are returned
+	in the order of `items`, and the first exception raised (in that order) is
+	re-raised in the calling thread once all items have been processed.
+
+	:param func: Function to call for every item
+	:param items: List of items to process
+	:param workers: Maximum number of concurrent calls. Default: SOURCE_WORKERS
+	"""
+
+	items = list(items)
+	if workers is None:
+		workers = SOURCE_WORKERS
+	workers = min(workers, len(items))
+	if workers <= 1:
+		return map(func, items)
+
+	results = [None] * len(items)
+	errors = [None] * len(items)
+	pending = Queue.Queue()
+	for i, item in enumerate(items):
+		pending.put((i, item))
+
+	def work():
+		while True:
+			try:
+				i, item = pending.get_nowait()
+			except Queue.Empty:
+				return
+			try:
+				results[i] = func(item)
+			except:
+				errors[i] = sys.exc_info()
+
+	threads = [threading.Thread(target=work) for _ in xrange(workers)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	for error in errors:
+		if error is not None:
+			raise error[0], error[1], error[2]
+	return results
+
+def CreateSources(sources, workers=None):
+	"""
+	Same as `CreateSource`, but creates and loads many sources, concurrently if
+	more than one worker is allowed.
+
+	:param sources: List of (path, srctype) tuples
+	:param workers: Maximum number of sources to load at the same time.
+		Default: SOURCE_WORKERS
+	:rtype: List of IMVSource objects, in the same order as `sources`
+	"""
+
+	return map_concurrent(lambda source: CreateSource(*source), sources, workers)
+
+def _load_flags(srctype):
+	"""Gets the flags `AddSource` should be called with for a source type"""
+
+	if srctype in [ SourceType.IMAGE, SourceType.MUSIC, SourceType.VIDEO ]:
+		return LoadFlags.VERIFYSUPPORT
+	elif srctype == SourceType.OPERATOR:
+		return LoadFlags.NULL
+	return LoadFlags.CONTEXT
+
+@is_a_stub
+def AddSources(sources, workers=None):
+	"""
+	Creates and loads many sources (concurrently if more than one worker is
+	allowed), then adds them in the given order.
+
+	Example:
+		AddSources([(r'c:\mufat_repo\a.jpg', SourceType.IMAGE),
+			(r'c:\mufat_repo\b.mp3', SourceType.MUSIC)])
+
+	:param sources: List of (path, srctype) tuples
+	:param workers: Maximum number of sources to load at the same time.
+		Default: SOURCE_WORKERS
+	"""
+
+	sources = list(sources)
+	detect_media(*[path for path, srctype in sources])
+	for src, (path, srctype) in zip(CreateSources(sources, workers), sources):
+		AddSource(src, srctype, _load_flags(srctype))
+
 @is_a_stub
 def EnumAndSetMVStyle(sty):
 	from .mvrt import Core
@@ -160,7 +270,7 @@ def AddSourceVideo(path):
 @is_a_stub
 def AddSourceVideoNoProxy(path):
 	from .mvrt import Core
-	src = Core.CreateMVSource(SourceType.VIDEO)
+	src = track(Core.CreateMVSource(SourceType.VIDEO))
 	path = normalize(path)
 	assert os.path.exists(path), "File %s does not exist" % path
 	assert src.LoadFile(path, int(LoadFlags.VERIFYSUPPORT)|int(LoadFlags.DISABLE_LOREZPROXY)), \
@@ -295,7 +405,7 @@ def SetActiveMVStyle(style, check=False):
 	if check:
 		assert Core.Styles.Count > 0, "No styles found!"
 		# check if style name is valid
-		assert style in map(lambda s: s.InternalName, IMVStyleCollection(Core.Styles))
+		assert style in IMVStyleCollection(Core.Styles).snapshot('InternalName')
 	if hasattr(Core, "ActiveMVStyle"):
 		Core.ActiveMVStyle = style
 	else:
@@ -318,7 +428,7 @@ def PutTitleString(title):
 @is_a_stub
 def PutAspectRatio(ratio):
 	from .mvrt import Core
-	assert ratio in ArType.__dict__.values()
+	assert ratio in ArType, "Unknown aspect ratio: %s" % ratio
 	Core.AspectRatio = ratio
 
 @is_a_stub
@@ -328,6 +438,7 @@ def PutDescriptorFolder(path):
 	if not os.path.exists(path):
 		os.makedirs(path)
 	Core.DescriptorFolder = path
+	_session['descriptors'] = True
 
 @is_a_stub
 def PutSyncSoundLevel(level):
@@ -397,25 +508,55 @@ def StartCheckProgress(poll_func, poll_flag=None, timeout=3600, sleep=1, onStop=
 	threading.Thread(target=CheckProgress, \
 		args=(poll_func, poll_flag, timeout, sleep, onStop)).start()
 
+def checkout_descriptors(cold=False):
+	"""
+	Hands the stored descriptors of the session's media to the runtime before
+	analysis, unless the analysis must be cold or the run set its own
+	descriptor folder.
+
+	:param cold: Whether to analyse from scratch, see `AnalyseTillDone`
+	:rtype: `muvee.descriptors.DescriptorStore` to check the descriptors in
+		with after analysis, or None
+	"""
+
+	from .mvrt import Core
+	cold = cold or _session['cold'] or os.environ.get('MUFAT_COLD_ANALYSIS') == '1'
+	if cold or _session['descriptors'] or not _session['media']:
+		return None
+	from .descriptors import DescriptorStore
+	store = DescriptorStore(Core.GetRuntimeSpecialBuild())
+	Core.DescriptorFolder = store.checkout(_session['media'])
+	return store
+
 @is_a_stub
-def AnalyseTillDone(resolution=1000, timeout=1800):
+def AnalyseTillDone(resolution=1000, timeout=1800, cold=False):
 	"""
 	Starts analyzing all added sources in a separate thread and polls its
 	progress until analysis is done. The function will timeout after
 	`resolution` x `timeout` milliseconds.
+
+	Unless the run set its own descriptor folder, descriptors are kept in a
+	`muvee.descriptors.DescriptorStore` so unchanged media is only analysed
+	once per runtime build.
 	
 	:param resolution: Frequency to poll for progress updates in milliseconds.
 		Default: 1000 milliseconds.
 	:param timeout: How many polls until the function is considered timed out.
 		Default: 1800 polls.
+	:param cold: Whether to analyse from scratch instead of reusing stored
+		descriptors. Also enabled by `ClearDescriptors`, or by setting the
+		MUFAT_COLD_ANALYSIS environment variable to 1.
 	"""
 
 	from .mvrt import Core
 
+	store = checkout_descriptors(cold)
 	assert is_true_or_non_zero(Core.StartAnalysisProc(0)), \
 		("StartAnalysisProc failed: ", GetLastErrorDescription())
 	CheckProgress(lambda: Core.GetAnalysisProgress(), timeout=timeout,
 			sleep=resolution/1000.0, onStop=lambda: Core.StopAnalysisProc())
+	if store is not None:
+		store.checkin()
 
 @is_a_stub
 def MakeTillDone(mode, duration):
@@ -477,6 +618,7 @@ def PreviewTillDone(timeline=TimelineType.MUVEE, width=320, height=240):
 	"""
 
 	from .mvrt import Core
+	from .window import Window
 	assert width > 0
 	assert height > 0
 	flag = threading.Event()
@@ -557,6 +699,7 @@ def SaveTillDoneWithPreview(filename, resolution=1000, timeout=1800, width=320,
 	"""
 
 	from .mvrt import Core
+	from .window import Window
 	assert width > 0
 	assert height > 0
 	caller = inspect.getouterframes(inspect.currentframe())[-1][1]
@@ -605,6 +748,7 @@ def PreviewSourceTillDone(src, width=320, height=240):
 	:param height: Height of created window in pixels
 	"""
 
+	from .window import Window
 	assert width > 0
 	assert height > 0
 	flag = threading.Event()
@@ -654,238 +798,260 @@ def AddSourceVideoWithPreviewTillDone(path, height=320, width=240):
 	AddSource(src, SourceType.VIDEO, LoadFlags.VERIFYSUPPORT)
 	PreviewSourceTillDone(src, height, width)
 
-def translate_alignment(align):
+def _text_format(factory, font, color, x=None, y=None, height=None, width=None,
+		halign=None, valign=None):
 	"""
-	Decodes an integer into a tuple for horizontal and vertical height
-	
-	:param align: alignment integer to decode
+	Creates an IMVTextFormat object for captions, titles or credits
 	"""
 
-	h = v = 0
-	bits = (align & 0x38) >> 3
-	if bits & 0x4 == bits:
-		v = 0x1 # top
-	elif bits & 0x2 == bits:
-		v = 0x10 # center
-	elif bits & 0x1 == bits:
-		v = 0x2 # bottom
-	else:
-		return h, v
-	bits = align & 0x7
-	if bits & 0x4 == bits:
-		h = 0x4 # left
-	elif bits & 0x2 == bits:
-		h = 0x10 # center
-	elif bits & 0x1 == bits:
-		h = 0x8 # right
-	else:
-		return h, v
-	return h, v
+	fmt = track(factory.CreateMVTextFormatObj())
+	fmt.LogFontStr = font
+	fmt.Color = color
+	if x is not None:
+		fmt.TextRectXCoord = x
+		fmt.TextRectYCoord = y
+		fmt.TextRectHeight = height
+		fmt.TextRectWidth = width
+		fmt.HorAlign, fmt.VertAlign = halign, valign
+	return fmt
 
-def add_image(xml):
+def add_image(image, factory=None, src=None):
 	"""
-	Adds an image from a .rvl project file XML node
+	Adds an image from a .rvl project image record (see `muvee.rvl`)
+
+	:param image: Image record
+	:param factory: IMVCoreFactory cast of the core, to share between sources
+	:param src: The image's IMVSource, if already created
 	"""
 
 	from . import IMVCoreFactory, IMVSourceCaption
 	from .mvrt import Core
 
 	# create image source
-	path = xml.find('name').text
+	path, rects, caption, rotation, duration = image
 	assert os.path.isfile(path)
-	src = CreateSource(path, SourceType.IMAGE)
+	if src is None:
+		src = CreateSource(path, SourceType.IMAGE)
 
 	# add magic spot rectangles
-	magicspot = xml.find('magicSpot')
-	if magicspot is not None:
+	if rects is not None:
 		rect = gen_stub(IMVTargetRect)(src)
-		if int(magicspot.attrib.get('activetype', 0)) > 0:
-			for r in magicspot.findall('targetrects/rect'):
-				rect.AddTargetRect(float(r.attrib['X1']), float(r.attrib['X2']), \
-						float(r.attrib['Y1']), float(r.attrib['Y2']))
+		for r in rects:
+			rect.AddTargetRect(*r)
 
 	# captions
-	caption = xml.find('caption')
 	if caption is not None:
-		factory = gen_stub(IMVCoreFactory)(Core)
-		fmt = factory.CreateMVTextFormatObj()
-		fmt.LogFontStr = caption.attrib['font']
-		fmt.Color = long(caption.attrib['fontcolor'])
-		fmt.TextRectXCoord = float(caption.attrib['offsetX'])
-		fmt.TextRectYCoord = float(caption.attrib['offsetY'])
-		fmt.TextRectHeight = float(caption.attrib['height'])
-		fmt.TextRectWidth = float(caption.attrib['width'])
-		fmt.HorAlign, fmt.VertAlign = translate_alignment(long(caption.attrib['align']))
+		factory = factory or gen_stub(IMVCoreFactory)(Core)
 		cap = gen_stub(IMVSourceCaption)(src)
-		cap.Caption = caption.attrib['string']
-		cap.TextDisplayFormat = fmt
+		cap.Caption = caption[0]
+		cap.TextDisplayFormat = _text_format(factory, *caption[1:])
 
 	# orientation and duration
 	info = gen_stub(IMVImageInfo)(src)
-	info.SetOrientation(float(xml.find('rotation').text), True)
-	info.MinImgSegDuration = float(xml.find('minDur').text)
+	info.SetOrientation(rotation, True)
+	info.MinImgSegDuration = duration
 
 	AddSource(src, SourceType.IMAGE, LoadFlags.VERIFYSUPPORT)
 
-def add_music(xml):
+def add_music(music, factory=None, src=None):
 	"""
-	Adds a music file from a .rvl project file XML node
+	Adds a music file from a .rvl project music record (see `muvee.rvl`)
+
+	:param music: Music record
+	:param factory: Unused, for consistency with `add_image` and `add_video`
+	:param src: The music's IMVSource, if already created
 	"""
 
-	path = xml.find('name').text
+	path, start, stop = music
 	assert os.path.isfile(path)
-	src = CreateSource(path, SourceType.MUSIC)
-	start = float(xml.find('cliprange').attrib['start'])
-	stop = float(xml.find('cliprange').attrib['stop'])
+	if src is None:
+		src = CreateSource(path, SourceType.MUSIC)
 	if start != stop:
 		src.Start, src.Stop = start, stop
 	AddSource(src, SourceType.MUSIC, LoadFlags.VERIFYSUPPORT)
 
-def add_video(xml):
+def add_video(video, factory=None, src=None):
 	"""
-	Adds a video file from a .rvl project file XML node
+	Adds a video file from a .rvl project video record (see `muvee.rvl`)
+
+	:param video: Video record
+	:param factory: IMVCoreFactory cast of the core, to share between sources
+	:param src: The video's IMVSource, if already created
 	"""
 
 	from . import IMVCoreFactory, IMVCaptionHighlight
 	from .mvrt import Core
 
 	# create video source
-	path = xml.find('name').text
+	path, captions, highlights, excludes, start, stop = video
 	assert os.path.isfile(path)
-	src = CreateSource(path, SourceType.VIDEO)
+	if src is None:
+		src = CreateSource(path, SourceType.VIDEO)
 
 	# captions
-	for caption in xml.findall('captions/caption'):
-		factory = gen_stub(IMVCoreFactory)(Core)
-		fmt = factory.CreateMVTextFormatObj()
-		fmt.LogFontStr = caption.find('font').text
-		fmt.Color = long(caption.find('fontcolor').text)
-		fmt.TextRectXCoord = float(caption.find('offsetX').text)
-		fmt.TextRectYCoord = float(caption.find('offsetY').text)
-		fmt.TextRectHeight = float(caption.find('height').text)
-		fmt.TextRectWidth = float(caption.find('width').text)
-		fmt.HorAlign, fmt.VertAlign = translate_alignment(long(caption.find('align').text))
+	if captions:
+		factory = factory or gen_stub(IMVCoreFactory)(Core)
 		cap = gen_stub(IMVCaptionHighlight)(src)
-		cap.SetCaptionHighlight(caption.find('string').text,
-				float(caption.find('timeStart').text),
-				float(caption.find('timeEnd').text),
-				fmt)
+		for caption in captions:
+			cap.SetCaptionHighlight(caption[0], caption[1], caption[2],
+					_text_format(factory, *caption[3:]))
 
 	# highlights
-	for hilite in xml.findall('highlights/highlight'):
+	if highlights:
 		h = gen_stub(IMVHighlight)(src)
-		h.SetHighlight(float(hilite.find('start').text), float(hilite.find('stop').text))
+		for hilite in highlights:
+			h.SetHighlight(*hilite)
 
 	# exclusions
-	for exclude in xml.findall('excludes/exclude'):
+	if excludes:
 		e = gen_stub(IMVExclude)(src)
-		e.SetIMVExclude(float(exclude.find('start').text), float(exclude.find('stop').text))
+		for exclude in excludes:
+			e.SetIMVExclude(*exclude)
 
 	# clipping
-	start = float(xml.find('cliprange').attrib['start'])
-	stop = float(xml.find('cliprange').attrib['stop'])
 	if start != stop:
 		src.Start, src.Stop = start, stop
 
 	AddSource(src, SourceType.VIDEO, LoadFlags.VERIFYSUPPORT)
 
-def add_settings(xml):
+def add_settings(settings, factory=None):
 	"""
-	Load project configuration from a .rvl project file XML node
+	Load project configuration from a .rvl project settings record (see
+	`muvee.rvl.read_settings`)
+
+	:param settings: Settings dictionary
+	:param factory: IMVCoreFactory cast of the core, to share between sources
 	"""
 
-	from . import IMVCoreFactory
+	from . import IMVCoreFactory, IMVStyleEx3
 	from .mvrt import Core
-	Core.SetActiveMVStyle(xml.find('SelectedStyle').text)
-	factory = gen_stub(IMVCoreFactory)(Core)
+	style = settings['style']
+	Core.SetActiveMVStyle(style)
+	factory = factory or gen_stub(IMVCoreFactory)(Core)
 
 	# style parameters
-	if xml.find('SuperStyles[@default="0"]/parameter') is not None:
+	if settings['params'] is not None:
 		ex = gen_stub(IMVStyleEx)(Core.GetStyleCollection())
-		style = xml.find('SelectedStyle').text
-		for p in xml.findall('SuperStyles/parameter'):
-			ex.SetParam(style, p.attrib['name'], float(p.attrib['value']))
+		for name, value in settings['params']:
+			ex.SetParam(style, name, value)
 
 	# style parameter strings
-	if xml.find('StyleTextParams/parameter') is not None:
+	if settings['text_params']:
 		ex = gen_stub(IMVStyleEx3)(Core.GetStyleCollection())
-		style = xml.find('SelectedStyle').text
-		for p in xml.findall('StyleTextParams/parameter'):
-			ex.SetStringParam(style, p.attrib['name'], p.attrib['value'])
+		for name, value in settings['text_params']:
+			ex.SetStringParam(style, name, value)
 
 	# titles
 	tc = gen_stub(IMVTitleCredits)(Core.Styles)
-	if xml.find('EnableTitle').text == '1':
-		fmt = factory.CreateMVTextFormatObj()
-		fmt.LogFontStr = xml.find('TitleFont').text
-		fmt.Color = long(xml.find('TitleColor').text)
-		tc.TitleString = xml.find('TitleText').text
-		tc.TitleTextFormat = fmt
-		type = int(xml.find('TitleBackgroundType').text)
-		if type == 1:
-			tc.TitleBackgroundColor = long(xml.find('TitleBackgroundColor').text)
-		elif type == 2:
-			tc.TitleBackgroundImage = xml.find('TitleBackgroundImage').text
+	if settings['title'] is not None:
+		text, font, color, bgtype, background = settings['title']
+		tc.TitleString = text
+		tc.TitleTextFormat = _text_format(factory, font, color)
+		if bgtype == 1:
+			tc.TitleBackgroundColor = background
+		elif bgtype == 2:
+			tc.TitleBackgroundImage = background
 
 	# credits
-	if xml.find('EnableCredits').text == '1':
-		fmt = factory.CreateMVTextFormatObj()
-		fmt.LogFontStr = xml.find('CreditsFont').text
-		fmt.Color = long(xml.find('CreditsColor').text)
-		tc.CreditsString = xml.find('CreditsText').text
-		tc.CreditsTextFormat = fmt
-		type = int(xml.find('CreditsBackgroundType').text)
-		if type == 1:
-			tc.CreditsBackgroundColor = long(xml.find('CreditsBackgroundColor').text)
-		elif type == 2:
-			tc.CreditsBackgroundImage = xml.find('CreditsBackgroundImage').text
+	if settings['credits'] is not None:
+		text, font, color, bgtype, background = settings['credits']
+		tc.CreditsString = text
+		tc.CreditsTextFormat = _text_format(factory, font, color)
+		if bgtype == 1:
+			tc.CreditsBackgroundColor = background
+		elif bgtype == 2:
+			tc.CreditsBackgroundImage = background
 
 	# volume control
-	Core.AudioExtLevel = float(xml.find('AudioMix/Voiceover').text)
-	Core.SoundEffectLevel = float(xml.find('AudioMix/SoundFx').text)
-	Core.SyncSoundLevel = float(xml.find('AudioMix/Video').text)
-	Core.MusicLevel = float(xml.find('AudioMix/Music').text)
+	Core.AudioExtLevel, Core.SoundEffectLevel, Core.SyncSoundLevel, \
+		Core.MusicLevel = settings['levels']
 
 @is_a_stub
 def LoadRvlProject(path):
 	"""
 	Loads any image, music or video sources from a .rvl project file as well as
-	relevant project settings.
+	relevant project settings. All runtime objects created while loading are
+	released once done (see `muvee.ProxyScope`).
 
 	:param path: Path to .rvl project file
 	"""
 
+	from . import IMVCoreFactory
+	from .mvrt import Core
+
 	path = normalize(path)
 	assert os.path.isfile(path) and os.path.splitext(path)[1] == ".rvl"
-	xml = etree.parse(path)
-
-	# find all source files
-	sources = [(f, SourceType.IMAGE) for f in xml.findall('image/file')] + \
-				[(f, SourceType.MUSIC) for f in xml.findall('audio/file')] + \
-				[(f, SourceType.VIDEO) for f in xml.findall('video/file')]
-
-	# sort sources by predefined indexes
-	def cmp_index(x, y):
-		if x[0].find('index') is None:
-			return -1
-		if y[0].find('index') is None:
-			return 1
-		return cmp(int(x[0].find('index').text), int(y[0].find('index').text))
-	sources.sort(cmp=cmp_index)
-	detect_media(*[s[0].find('name').text for s in sources])
-
-	for src, type in sources:
-		if type == SourceType.IMAGE:
-			add_image(src)
-		elif type == SourceType.MUSIC:
-			add_music(src)
-		elif type == SourceType.VIDEO:
-			add_video(src)
-		else:
-			raise NotImplementedError(str(type))
-
-	# process settings
-	add_settings(xml.find('settings'))
+	sources, settings = rvl.load(path)
+	detect_media(*[record[0] for kind, record in sources])
+
+	with ProxyScope():
+		# load all sources (concurrently if enabled), but add them in order
+		types = { 'image': SourceType.IMAGE, 'music': SourceType.MUSIC, 'video': SourceType.VIDEO }
+		srcs = CreateSources([(record[0], types[kind]) for kind, record in sources])
+
+		# one factory is shared by all captions, titles and credits
+		factory = gen_stub(IMVCoreFactory)(Core)
+		loaders = { 'image': add_image, 'music': add_music, 'video': add_video }
+		for (kind, record), src in zip(sources, srcs):
+			loaders[kind](record, factory, src)
+
+		# process settings
+		add_settings(settings, factory)
+
+# media metadata indexes, keyed by runtime build
+_media_indexes = {}
+
+def _media_index():
+	"""Gets the `muvee.mediaindex.MediaIndex` of the current runtime build"""
+
+	from .mediaindex import MediaIndex
+	from .mvrt import Core
+	build = Core.GetRuntimeSpecialBuild()
+	if build not in _media_indexes:
+		_media_indexes[build] = MediaIndex(build)
+	return _media_indexes[build]
+
+def probe_videos(paths):
+	"""
+	Reads the metadata of video files by loading them as runtime sources.
+
+	:param paths: List of paths to video files
+	:rtype: List of dictionaries of `muvee.mediaindex.FIELDS`
+	"""
+
+	try:
+		from . import IMVVideoInfo3
+	except:
+		# mac doesn't have IMVVideoInfo3
+		from . import IMVVideoInfo2 as IMVVideoInfo3
+
+	metadata = []
+	for src in CreateSources([(path, SourceType.VIDEO) for path in paths]):
+		vid_info = gen_stub(IMVVideoInfo3)(src)
+		duration = getattr(src, 'Duration', None)
+		metadata.append({
+			'width': int(vid_info.width),
+			'height': int(vid_info.height),
+			'aspect_ratio': int(vid_info.AspectRatio),
+			'aspect_ratio_x': int(vid_info.AspectRatioX),
+			'aspect_ratio_y': int(vid_info.AspectRatioY),
+			'duration': float(duration) if duration is not None else None,
+			'type': int(SourceType.VIDEO),
+		})
+		# probed sources are never added
+		_session['loaded'].pop(id(src), None)
+	return metadata
+
+@is_a_stub
+def IndexVideos(*paths):
+	"""
+	Reads the metadata of many video files at once into the media index, so
+	that `VerifyVideo` can check them without loading them again.
+
+	:param paths: Paths to video files
+	"""
+
+	_media_index().update(map(normalize, paths), probe_videos)
 
 @is_a_stub
 def VerifyVideo(src_file, expected_width, \
@@ -893,20 +1059,18 @@ def VerifyVideo(src_file, expected_width, \
 				expected_aspect_ratio, \
 				expected_aspect_ratio_x, \
 				expected_aspect_ratio_y):
+	# use indexed metadata if this video has been seen by this runtime build
+	path = normalize(src_file)
 	try:
-		from . import IMVVideoInfo3
-	except:
-		# mac doesn't have IMVVideoInfo3
-		from . import IMVVideoInfo2 as IMVVideoInfo3
-
-	src = CreateSource(src_file, SourceType.VIDEO)
-	vid_info = gen_stub(IMVVideoInfo3)(src)
-	assert vid_info.width == expected_width and vid_info.height == expected_height, \
+		vid_info = _media_index().update([path], probe_videos)[0]
+	except OSError, e:
+		assert False, "Media verification failed, cannot read %s: %s" % (src_file, e)
+	assert vid_info['width'] == expected_width and vid_info['height'] == expected_height, \
 			"Media width/height verification failed: %s" % src_file
-	assert vid_info.AspectRatio == int(expected_aspect_ratio), \
+	assert vid_info['aspect_ratio'] == int(expected_aspect_ratio), \
 			"Media aspect ratio verification failed: %s" % src_file
-	assert vid_info.AspectRatioX == expected_aspect_ratio_x and \
-			vid_info.AspectRatioY == expected_aspect_ratio_y, \
+	assert vid_info['aspect_ratio_x'] == expected_aspect_ratio_x and \
+			vid_info['aspect_ratio_y'] == expected_aspect_ratio_y, \
 			"Media aspect ratio verification failed: %s" % src_file
 
 @is_a_stub
@@ -921,6 +1085,8 @@ def CheckLastTimelineForRange(floor, ceiling):
 @is_a_stub
 def ClearDescriptors():
 	from .mvrt import Core
+	# the run wants a cold analysis, don't use stored descriptors either
+	_session['cold'] = True
 	path = os.path.join(Core.CommonDataFolder, "dscrp")
 	if os.path.isdir(path):
 		for root, dirs, files in os.walk(path):
@@ -0,0 +1,402 @@
+"""
+Cooperative scheduling of long-running runtime operations on a single thread.
+
+IronPython 2.7 has no asyncio, so operations are written as generators and
+driven by a small event loop instead. Any number of operations (e.g. rendering
+a muvee while uploading results and prefetching media for the next run) can be
+overlapped in one process without extra threads, with timeouts and
+cancellation.
+
+A task is a generator that may yield:
+- a number:		sleep for that many seconds
+- a generator:	run it as a sub-task, resuming with its result
+- a `Task`:		wait for it to finish, resuming with its result
+- a list of `Task`s:	wait for any of them to finish
+- None:			let other tasks run first
+and returns a value with `raise Return(value)`.
+
+Example:
+	from muvee import tasks
+
+	def upload(path):
+		...
+		yield 0
+
+	tasks.run(tasks.save(r"c:\\muveedebug\\out.mp4"), upload(logfile), timeout=3600)
+
+Cancelling a task raises `Cancelled` inside it, so that the runtime operation
+is stopped by its `finally` clause (e.g. `CancelMake`).
+"""
+
+import heapq, inspect, os, sys, time, types
+from collections import deque
+
+
+class Return(Exception):
+	"""Raised inside a task to finish it with a result"""
+
+	def __init__(self, value=None):
+		super(Return, self).__init__(value)
+		self.value = value
+
+class Cancelled(Exception):
+	"""Raised inside a task when it has been cancelled"""
+	pass
+
+class Timeout(Cancelled):
+	"""Raised inside a task when it has been cancelled for taking too long"""
+	pass
+
+
+class Task(object):
+	"""
+	A generator scheduled on a `Loop`. Create tasks with `Loop.spawn`.
+	"""
+
+	def __init__(self, loop, gen, name=None):
+		self.loop = loop
+		self.name = name or getattr(gen, '__name__', 'task')
+		self.stack = [gen]
+		self.done = False
+		self.result = None
+		self.error = None
+		self.waiters = []
+		# increased whenever the task is resumed, to discard stale wakeups
+		self.token = 0
+
+	def __repr__(self):
+		return '<Task %s%s>' % (self.name, self.done and ' (done)' or '')
+
+	def cancel(self, error=None):
+		"""
+		Cancels the task by raising `error` (default: `Cancelled`) inside it.
+		Does nothing if the task has already finished.
+		"""
+
+		if not self.done:
+			error = error or Cancelled(self.name)
+			self.loop._resume(self, exc=(type(error), error, None))
+
+	def get(self):
+		"""Returns the task's result, or raises its exception"""
+
+		assert self.done, "%s has not finished yet" % self.name
+		if self.error is not None:
+			raise self.error[0], self.error[1], self.error[2]
+		return self.result
+
+
+class Loop(object):
+	"""
+	Event loop running tasks until they are all complete.
+	"""
+
+	def __init__(self):
+		self.ready = deque()
+		self.timers = []
+		self.count = 0
+
+	def spawn(self, gen, timeout=None, name=None):
+		"""
+		Schedules a generator to run as a task.
+
+		:param gen: Generator, or an already spawned `Task`
+		:param timeout: Seconds after which the task is cancelled with a
+			`Timeout` error. Default: no timeout
+		:param name: Name of the task, for logging
+		"""
+
+		if isinstance(gen, Task):
+			return gen
+		assert isinstance(gen, types.GeneratorType), "%r is not a generator" % gen
+		task = Task(self, gen, name)
+		self._resume(task)
+		if timeout is not None:
+			self.call_later(timeout, task.cancel,
+					Timeout("%s timed out after %s seconds" % (task.name, timeout)))
+		return task
+
+	def call_later(self, delay, func, *args):
+		"""Calls a function from the loop after `delay` seconds"""
+
+		self.count += 1
+		heapq.heappush(self.timers, (time.time() + delay, self.count, func, args))
+
+	def run(self, gen, timeout=None):
+		"""
+		Runs the loop until the given task is complete.
+
+		:param gen: Generator or `Task` to run
+		:param timeout: Seconds after which the task is cancelled
+		:rtype: The task's result
+		"""
+
+		global _loop
+		task = self.spawn(gen, timeout)
+		previous, _loop = _loop, self
+		try:
+			while not task.done:
+				assert self.ready or self.timers, \
+					"Deadlock: all tasks are waiting for each other"
+				self._tick()
+		finally:
+			_loop = previous
+		return task.get()
+
+	def _tick(self):
+		# fire due timers, then run all tasks that are ready
+		now = time.time()
+		while self.timers and self.timers[0][0] <= now:
+			when, count, func, args = heapq.heappop(self.timers) #@UnusedVariable
+			func(*args)
+
+		ready, self.ready = self.ready, deque()
+		for task, token, value, exc in ready:
+			if token == task.token and not task.done:
+				self._step(task, value, exc)
+
+		if not self.ready and self.timers:
+			time.sleep(max(0, min(self.timers[0][0] - time.time(), 1)))
+
+	def _resume(self, task, value=None, exc=None):
+		# schedule the task to continue with a value or exception
+		task.token += 1
+		self.ready.append((task, task.token, value, exc))
+
+	def _wakeup(self, task, token):
+		# resume a sleeping task, unless it has been resumed otherwise since
+		if token == task.token:
+			self._resume(task)
+
+	def _step(self, task, value, exc):
+		gen = task.stack[-1]
+		try:
+			if exc is not None:
+				yielded = gen.throw(*exc)
+			else:
+				yielded = gen.send(value)
+		except StopIteration:
+			return self._finish(task, None, None)
+		except Return, r:
+			return self._finish(task, r.value, None)
+		except:
+			return self._finish(task, None, sys.exc_info())
+
+		if isinstance(yielded, types.GeneratorType):
+			task.stack.append(yielded)
+			self._resume(task)
+		elif isinstance(yielded, Task):
+			if yielded.done:
+				self._resume(task, yielded.result, yielded.error)
+			else:
+				yielded.waiters.append((task, task.token, True))
+		elif isinstance(yielded, (list, tuple)):
+			if not yielded or any(t.done for t in yielded):
+				self._resume(task)
+			else:
+				for t in yielded:
+					t.waiters.append((task, task.token, False))
+		elif yielded is None:
+			self._resume(task)
+		else:
+			self.call_later(yielded, self._wakeup, task, task.token)
+
+	def _finish(self, task, value, exc):
+		# return from the current generator to its caller, or end the task
+		task.stack.pop()
+		if task.stack:
+			return self._resume(task, value, exc)
+		task.done = True
+		task.result, task.error = value, exc
+		for waiter, token, forward in task.waiters:
+			# skip waiters that have been resumed otherwise since
+			if token == waiter.token:
+				if forward:
+					self._resume(waiter, value, exc)
+				else:
+					self._resume(waiter)
+
+# loop that is currently running
+_loop = None
+
+def spawn(gen, timeout=None, name=None):
+	"""
+	Schedules a generator to run as a task on the running loop.
+
+	:rtype: `Task`
+	"""
+
+	assert _loop is not None, "No event loop running"
+	return _loop.spawn(gen, timeout, name)
+
+def gather(*jobs):
+	"""
+	Runs generators or tasks concurrently and waits for all of them. If any
+	of them fails (or gather itself is cancelled), the others are cancelled
+	and the error is raised once they have finished.
+
+	:rtype: List of results, in the same order as `jobs`
+	"""
+
+	tasks = [spawn(job) for job in jobs]
+	try:
+		while True:
+			for task in tasks:
+				if task.done and task.error is not None:
+					task.get()
+			pending = [task for task in tasks if not task.done]
+			if not pending:
+				break
+			yield pending
+	except:
+		error = sys.exc_info()
+		for task in tasks:
+			task.cancel()
+		pending = [task for task in tasks if not task.done]
+		while pending:
+			try:
+				yield pending
+			except Cancelled:
+				pass
+			pending = [task for task in tasks if not task.done]
+		raise error[0], error[1], error[2]
+	raise Return([task.result for task in tasks])
+
+def run(*jobs, **kwargs):
+	"""
+	Runs generators concurrently in a new event loop until all of them are
+	complete.
+
+	:param jobs: Generators to run
+	:param timeout: Seconds after which all jobs are cancelled
+	:rtype: List of results, in the same order as `jobs`
+	"""
+
+	return Loop().run(gather(*jobs), kwargs.get('timeout'))
+
+def sleep(seconds):
+	"""Waits for `seconds` without blocking other tasks"""
+
+	yield seconds
+
+#=== runtime operations
+
+def progress(poll_func, timeout=3600, sleep=1, stall=300):
+	"""
+	Same as `muvee.CheckProgress`, but yields to other tasks in between polls.
+
+	:param poll_func: Function callback to use to fetch the current progress.
+		Must return a number.
+	:param timeout: How many polls before the task is considered to have
+		timed out.
+	:param sleep: How many seconds to wait in between polls.
+	:param stall: How many seconds without progress before the task is
+		considered to be stuck.
+	"""
+
+	last_prog = prog = -1
+	last_changed = time.time()
+	count = timeout
+	while prog < 1.0:
+		prog = poll_func.__call__()
+		print r"Progress: %.2f" % prog
+
+		if prog <= 0.0 or (prog - last_prog) < 0.01:
+			assert time.time() - last_changed < stall, \
+				("Progress stuck at %.2f%% for over %d seconds!" % (prog, stall))
+		else:
+			last_prog = prog
+			last_changed = time.time()
+
+		count -= 1
+		assert count >= 0, "Timed out after %d repetitions." % timeout
+		yield sleep
+	raise Return(prog)
+
+def analyse(resolution=1000, timeout=1800, cold=False):
+	"""
+	Task version of `muvee.AnalyseTillDone`.
+
+	:param resolution: Frequency to poll for progress updates in milliseconds.
+	:param timeout: How many polls until analysis is considered timed out.
+	:param cold: Whether to analyse from scratch instead of reusing stored
+		descriptors.
+	"""
+
+	from .mvrt import Core
+	from .stubs import GetLastErrorDescription, checkout_descriptors, is_true_or_non_zero
+
+	store = checkout_descriptors(cold)
+	assert is_true_or_non_zero(Core.StartAnalysisProc(0)), \
+		("StartAnalysisProc failed: " + GetLastErrorDescription())
+	try:
+		yield progress(lambda: Core.GetAnalysisProgress(), timeout=timeout,
+				sleep=resolution/1000.0)
+	finally:
+		Core.StopAnalysisProc()
+	if store is not None:
+		store.checkin()
+
+def make(mode, duration, timeout=600):
+	"""
+	Task version of `muvee.ThreadedMakeTillDone`.
+
+	:param mode: `muvee.MakeFlags` enum
+	:param duration: Duration of muvee in seconds
+	:param timeout: How many polls until making is considered timed out.
+	"""
+
+	from . import MakeFlags
+	from .mvrt import Core
+	from .stubs import GetLastErrorDescription, is_true_or_non_zero
+
+	mode |= MakeFlags.THREADED
+	assert is_true_or_non_zero(Core.MakeMuveeTimeline(mode, duration)), \
+		"MakeMuveeTimeline failed: " + GetLastErrorDescription()
+
+	def poll():
+		prog = Core.GetMakeProgress()
+		assert prog >= 0, "GetMakeProgress failed: " + GetLastErrorDescription()
+		return prog
+
+	try:
+		yield progress(poll, timeout=timeout)
+	finally:
+		Core.CancelMake()
+
+def save(filename, resolution=1000, timeout=1800, hwnd=None, width=0, height=0):
+	"""
+	Task version of `muvee.SaveTillDone`, or of `muvee.SaveTillDoneWithPreview`
+	if given a window handle to preview in.
+
+	:param filename: Path of video file to save to
+	:param resolution: Frequency to poll for progress updates in milliseconds.
+	:param timeout: How many polls until saving is considered timed out.
+	:param hwnd: Handle of the window to preview in. Default: no preview
+	:param width: Width of the preview in pixels
+	:param height: Height of the preview in pixels
+	"""
+
+	from .mvrt import Core
+	from .stubs import GetLastErrorDescription, is_true_or_non_zero
+	from .testing import normalize
+
+	caller = inspect.getouterframes(inspect.currentframe())[-1][1]
+	runname = os.path.splitext(os.path.basename(caller))[0]
+	path = filename.replace("[CurrentStyle]", Core.GetActiveMVStyle()) \
+					.replace("[ConfigName]", runname)
+	path = normalize(path)
+
+	assert is_true_or_non_zero(
+			Core.StartRenderTL2FileProc(path, hwnd, 0, 0, width, height, None)), \
+			("StartRenderTL2FileProc failed: " + GetLastErrorDescription())
+
+	def poll():
+		prog = Core.GetRenderTL2FileProgress()
+		assert prog >= 0, "GetRenderTL2FileProgress failed: " + GetLastErrorDescription()
+		return prog
+
+	try:
+		yield progress(poll, timeout=timeout, sleep=resolution/1000.0)
+	finally:
+		Core.StopRenderTL2FileProc()
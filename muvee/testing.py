@@ -37,11 +37,15 @@ def normalize(path):
 	return path.replace("\\", "/")
 
 
+# local paths of all test media detected in this process
+detected_media = set()
+
 def detect_media(*media):
 	"""
 	Given an arbitrary amount of string arguments, check if they are a file on a
 	local filesystem used for muFAT test media; if the file is missing, copy it
-	from a remote network drive.
+	from a remote network drive. Detected media is remembered in
+	`detected_media`.
 
 	:param media: Any number of string arguments to check for test media
 	"""
@@ -61,6 +65,7 @@ def detect_media(*media):
 
 	# convert paths to specific platforms
 	media = map(normalize, media)
+	detected_media.update(media)
 	for dest in media:
 		src = local_re.sub(REMOTE, dest)
 		if not os.path.exists(dest) or os.stat(src).st_size != os.stat(dest).st_size:
@@ -0,0 +1,169 @@
+"""
+History of muFAT run and test timings, and detection of slowdowns between
+runtime builds.
+
+Timings are stored per run, test, host and runtime build in a sqlite database
+in the local muFAT cache. A new timing is compared against the most recent
+timings of earlier builds on the same host, and flagged as a regression if it
+is slower than their median by more than `THRESHOLD` robust standard
+deviations (estimated from the median absolute deviation), so that occasional
+slow outliers in the history do not hide or cause regressions.
+
+Example:
+	history = TimingHistory()
+	tests = parse_summary(result["summary"])
+	result["regressions"] = history.check_run(run, HOST, build, elapsed, tests)
+"""
+
+import os, sqlite3, time
+from . import cache
+
+# robust z-score above which a timing is a regression
+THRESHOLD = float(os.environ.get('MUFAT_TIMING_THRESHOLD', 3.5))
+# minimum slowdown, in seconds and relative to the median, to be reported
+MIN_DELTA = 1.0
+MIN_RATIO = 1.1
+# number of earlier timings needed, and used, to compare against
+MIN_SAMPLES = 5
+WINDOW = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timings (
+	run TEXT,
+	test TEXT,
+	host TEXT,
+	build TEXT,
+	dbkey TEXT,
+	seconds REAL,
+	seen REAL
+);
+CREATE INDEX IF NOT EXISTS timings_key ON timings (run, test, host, seen);
+"""
+
+def parse_summary(path):
+	"""
+	Reads per-test timings from a run's summary file, as written by
+	`testing.run`.
+
+	:param path: Path to the summary file
+	:rtype: List of (test id, passed, seconds) tuples. Repeated test ids are
+		numbered, e.g. "module.test#2"
+	"""
+
+	with open(path) as f:
+		lines = [line.strip() for line in f if line.strip()]
+	tests = []
+	seen = {}
+	# skip the header of time, passes, failures and untested counts
+	for i in xrange(4, len(lines) - 3, 4):
+		test, module, passed, ms = lines[i:i + 4] #@UnusedVariable
+		seen[test] = seen.get(test, 0) + 1
+		if seen[test] > 1:
+			test = "%s#%d" % (test, seen[test])
+		tests.append((test, passed == "1", float(ms) / 1000))
+	return tests
+
+def median(values):
+	values = sorted(values)
+	middle = len(values) // 2
+	if len(values) % 2:
+		return values[middle]
+	return (values[middle - 1] + values[middle]) / 2.0
+
+
+class TimingHistory(object):
+	"""
+	Timings stored in a sqlite database.
+	"""
+
+	def __init__(self, path=None):
+		"""
+		:param path: Database file. Default: 'timings.db' in the 'timings'
+			folder of the local muFAT cache
+		"""
+
+		self.path = path or os.path.join(cache.cache_dir('timings'), 'timings.db')
+		self.db = sqlite3.connect(self.path, timeout=30)
+		self.db.executescript(SCHEMA)
+
+	def close(self):
+		self.db.close()
+
+	def record(self, run, test, host, build, seconds, dbkey=None):
+		"""
+		Stores a timing.
+
+		:param run: Name of the muFAT run
+		:param test: Test id, or '' for the duration of the whole run
+		:param host: Name of the host
+		:param build: Runtime build
+		:param seconds: Time taken
+		:param dbkey: Database key of the night the run belongs to
+		"""
+
+		with self.db:
+			self.db.execute("INSERT INTO timings VALUES (?,?,?,?,?,?,?)",
+					(run, test, host, str(build), dbkey, seconds, time.time()))
+
+	def baseline(self, run, test, host, build, window=WINDOW):
+		"""
+		Gets the most recent timings of builds other than `build`.
+
+		:rtype: List of seconds, most recent first
+		"""
+
+		rows = self.db.execute("""SELECT seconds FROM timings
+				WHERE run = ? AND test = ? AND host = ? AND build != ?
+				ORDER BY seen DESC LIMIT ?""",
+				(run, test, host, str(build), window)).fetchall()
+		return [row[0] for row in rows]
+
+	def check(self, run, test, host, build, seconds, threshold=THRESHOLD):
+		"""
+		Compares a timing against the baseline of earlier builds.
+
+		:rtype: Dictionary describing the regression, or None if `seconds` is
+			not significantly slower, or there are too few earlier timings
+		"""
+
+		history = self.baseline(run, test, host, build)
+		if len(history) < MIN_SAMPLES:
+			return None
+		mid = median(history)
+		# scale the MAD to estimate a standard deviation, with a floor for
+		# histories of (nearly) identical timings
+		mad = median([abs(s - mid) for s in history])
+		sigma = max(1.4826 * mad, 0.01 * mid, 0.001)
+		score = (seconds - mid) / sigma
+		if score > threshold and seconds - mid >= MIN_DELTA and seconds >= mid * MIN_RATIO:
+			return {
+				'test': test,
+				'seconds': round(seconds, 3),
+				'median': round(mid, 3),
+				'mad': round(mad, 3),
+				'score': round(score, 1),
+				'samples': len(history),
+			}
+
+	def check_run(self, run, host, build, seconds, tests=(), dbkey=None):
+		"""
+		Checks the duration of a run and its passed tests for regressions, then
+		stores them in the history.
+
+		:param run: Name of the muFAT run
+		:param host: Name of the host
+		:param build: Runtime build
+		:param seconds: Duration of the whole run
+		:param tests: List of (test id, passed, seconds) tuples, as returned by
+			`parse_summary`
+		:rtype: List of regressions, as returned by `check`
+		"""
+
+		timings = [('', seconds)] + [(test, s) for test, passed, s in tests if passed]
+		regressions = []
+		for test, s in timings:
+			regression = self.check(run, test, host, build, s)
+			if regression is not None:
+				regressions.append(regression)
+			self.record(run, test, host, build, s, dbkey)
+		return regressions
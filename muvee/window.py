@@ -1,4 +1,4 @@
-import sys
+import os, sys
 
 class ClrForm(object):
 	def __init__(self, width=320, height=240, setup=None, teardown=None):
@@ -47,7 +47,10 @@ class ClrForm(object):
 
 #=== specify different Window implementations depending on platform
 
-if sys.platform == "cli": # .NET
+if os.environ.get("MUFAT_HEADLESS") == "1": # no GUI session, e.g. build hosts
+	from headless import HeadlessWindow
+	Window = HeadlessWindow
+elif sys.platform == "cli": # .NET
 	import clr
 	clr.AddReference('System.Drawing')
 	clr.AddReference('System.Windows.Forms')
@@ -55,5 +58,6 @@ if sys.platform == "cli": # .NET
 elif sys.platform == "darwin": # MacOS
 	from cocoa import CocoaWindow
 	Window = CocoaWindow
-else:
-	raise Exception("Only 'clr' and 'darwin' is supported for now.")
+else: # anything else can only render offscreen
+	from headless import HeadlessWindow
+	Window = HeadlessWindow
@@ -0,0 +1,470 @@
+"""
+Shared queue of muFAT runs, from which any number of hosts pull work.
+
+Instead of every host working through its own statically assigned suites,
+all hosts of a night register under the same database key and lease runs from
+a common queue, so that idle hosts take over work that slow hosts have not
+started yet. A leased run is kept alive by heartbeats while it executes. If a
+host dies, its lease expires and the run goes back to the queue for another
+host to pick up, unless it has used up its attempts (e.g. because it keeps
+killing hosts).
+
+Runs may be restricted to hosts with certain platform tags, e.g. 'mac' or
+'windows'. A host only leases runs whose tags are all among its own tags.
+
+The coordination backend is swappable: `RedisBackend` for sharing a queue
+between hosts, and `LocalBackend`, a sqlite file which stands in for it when
+testing with several runners on one machine.
+
+Example:
+	queue = WorkQueue(DBKEY, RedisBackend())
+	queue.register(HOST, ['mac'])
+	queue.add([("mac", "foo.py", ['mac'])])
+	for lease in queue.leases(HOST, ['mac']):
+		with Heartbeat(lease):
+			...
+		lease.complete()
+"""
+
+import json, os, sqlite3, sys, threading, time
+from hashlib import sha1
+from . import cache
+
+# seconds after the last heartbeat until a run is handed to another host
+LEASE_TIME = 300
+# number of times a run is attempted before it is given up on
+MAX_ATTEMPTS = 2
+# seconds between checks for returned work while other hosts are busy
+POLL = 10
+
+def platform_tags():
+	"""Gets the default platform tags of this host"""
+
+	if sys.platform == 'darwin':
+		return ['mac']
+	if sys.platform == 'cli' or sys.platform.startswith('win'):
+		return ['windows']
+	return [sys.platform.rstrip('0123456789')]
+
+def item_id(suite, run):
+	"""Gets the id of a run in the queue"""
+
+	return sha1("%s|%s" % (suite, run)).hexdigest()
+
+
+class Lease(object):
+	"""
+	A run leased by a host from a `WorkQueue`.
+	"""
+
+	def __init__(self, queue, host, item):
+		self.queue = queue
+		self.host = host
+		self.id = item['id']
+		self.suite = item['suite']
+		self.run = item['run']
+		self.tags = item['tags']
+		self.attempts = item['attempts']
+
+	def __repr__(self):
+		return '<Lease %s (%s) by %s>' % (self.run, self.suite, self.host)
+
+	def renew(self):
+		"""
+		Extends the lease by `LEASE_TIME`.
+
+		:rtype: False if the lease has expired and the run was taken back
+		"""
+
+		return self.queue.backend.renew(self.queue.dbkey, self.id, self.host,
+				time.time() + self.queue.lease_time)
+
+	def complete(self):
+		"""Marks the run as finished"""
+
+		self.queue.backend.finish(self.queue.dbkey, self.id, self.host)
+
+	def release(self):
+		"""
+		Returns the run to the queue for another attempt, e.g. after a crash.
+
+		:rtype: False if the run has used up its attempts and is finished
+			instead
+		"""
+
+		if self.attempts >= self.queue.max_attempts:
+			self.complete()
+			return False
+		self.queue.backend.requeue(self.queue.dbkey, self.id, self.host)
+		return True
+
+
+class Heartbeat(threading.Thread):
+	"""
+	Thread renewing a lease periodically until stopped, or used as a context
+	manager around the execution of the run.
+	"""
+
+	def __init__(self, lease, interval=None):
+		super(Heartbeat, self).__init__()
+		self.lease = lease
+		self.interval = interval or lease.queue.lease_time / 3.0
+		self.stopped = threading.Event()
+		self.daemon = True
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.stop()
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			try:
+				if not self.lease.renew():
+					print "Lease of %s expired, it may be run by another host!" % self.lease.run
+			except Exception, e:
+				print "Could not renew lease:", e
+
+	def stop(self):
+		self.stopped.set()
+		self.join()
+
+
+class WorkQueue(object):
+	"""
+	Queue of runs of one night, identified by its database key.
+	"""
+
+	def __init__(self, dbkey, backend, lease_time=LEASE_TIME, max_attempts=MAX_ATTEMPTS):
+		"""
+		:param dbkey: Database key shared by all hosts of the night
+		:param backend: `RedisBackend` or `LocalBackend`
+		:param lease_time: Seconds after the last heartbeat until a run is
+			handed to another host
+		:param max_attempts: Number of times a run is attempted
+		"""
+
+		self.dbkey = dbkey
+		self.backend = backend
+		self.lease_time = lease_time
+		self.max_attempts = max_attempts
+
+	def register(self, host, tags):
+		"""
+		Registers a host as working on the queue.
+
+		:param host: Name of the host
+		:param tags: List of platform tags of the host
+		"""
+
+		self.backend.register(self.dbkey, host, list(tags), time.time())
+
+	def hosts(self):
+		"""
+		:rtype: Dictionary of registered host names to their tags and last
+			seen timestamps
+		"""
+
+		return self.backend.hosts(self.dbkey)
+
+	def add(self, runs):
+		"""
+		Adds runs to the queue, unless they have been added already, e.g. by
+		another host.
+
+		:param runs: List of (suite, run, tags) tuples
+		"""
+
+		items = [{ 'id': item_id(suite, run), 'suite': suite, 'run': run,
+				'tags': sorted(tags), 'attempts': 0 } for suite, run, tags in runs]
+		self.backend.add(self.dbkey, items)
+
+	def lease(self, host, tags):
+		"""
+		Leases the oldest queued run that the host's tags allow, after
+		returning expired leases to the queue. Expired leases of runs that have
+		used up their attempts are finished instead.
+
+		:rtype: `Lease`, or None if there are no matching runs queued
+		"""
+
+		now = time.time()
+		self.backend.expire(self.dbkey, now, self.max_attempts)
+		item = self.backend.lease(self.dbkey, host, list(tags), now + self.lease_time)
+		if item is not None:
+			return Lease(self, host, item)
+
+	def leases(self, host, tags, poll=POLL):
+		"""
+		Leases runs one after another until all runs of the queue are
+		finished, waiting for runs leased by other hosts in case they are
+		returned.
+
+		:rtype: Generator of `Lease` objects
+		"""
+
+		while True:
+			lease = self.lease(host, tags)
+			if lease is not None:
+				yield lease
+			elif self.counts().get('leased'):
+				self.register(host, tags)
+				time.sleep(poll)
+			else:
+				break
+
+	def counts(self):
+		"""
+		:rtype: Dictionary of the number of 'pending', 'leased' and 'done' runs
+		"""
+
+		return self.backend.counts(self.dbkey)
+
+#==== backends
+
+class LocalBackend(object):
+	"""
+	Queue stored in a sqlite file, shared by processes on one machine.
+	"""
+
+	SCHEMA = """
+	CREATE TABLE IF NOT EXISTS items (
+		dbkey TEXT, id TEXT, suite TEXT, run TEXT, tags TEXT, attempts INTEGER,
+		state TEXT, host TEXT, expires REAL,
+		PRIMARY KEY (dbkey, id)
+	);
+	CREATE TABLE IF NOT EXISTS hosts (
+		dbkey TEXT, host TEXT, tags TEXT, seen REAL,
+		PRIMARY KEY (dbkey, host)
+	);
+	"""
+
+	def __init__(self, path=None):
+		"""
+		:param path: Database file. Default: 'workqueue.db' in the 'queue'
+			folder of the local muFAT cache
+		"""
+
+		self.path = path or os.path.join(cache.cache_dir('queue'), 'workqueue.db')
+		# transactions are started explicitly, to lock the queue while leasing
+		self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None,
+				check_same_thread=False)
+		self.db.executescript(self.SCHEMA)
+		self.lock = threading.Lock()
+
+	def _execute(self, *statements):
+		# runs statements in one exclusive transaction
+		with self.lock:
+			self.db.execute("BEGIN IMMEDIATE")
+			try:
+				results = [self.db.execute(*s).fetchall() for s in statements]
+				self.db.execute("COMMIT")
+			except:
+				self.db.execute("ROLLBACK")
+				raise
+		return results
+
+	def register(self, dbkey, host, tags, now):
+		self._execute(("INSERT OR REPLACE INTO hosts VALUES (?,?,?,?)",
+				(dbkey, host, json.dumps(tags), now)))
+
+	def hosts(self, dbkey):
+		rows = self._execute(("SELECT host, tags, seen FROM hosts WHERE dbkey = ?", (dbkey,)))[0]
+		return dict((host, { 'tags': json.loads(tags), 'seen': seen }) for host, tags, seen in rows)
+
+	def add(self, dbkey, items):
+		self._execute(*[("INSERT OR IGNORE INTO items VALUES (?,?,?,?,?,?,'pending',NULL,NULL)",
+				(dbkey, item['id'], item['suite'], item['run'], json.dumps(item['tags']),
+				item['attempts'])) for item in items])
+
+	def lease(self, dbkey, host, tags, expires):
+		with self.lock:
+			self.db.execute("BEGIN IMMEDIATE")
+			try:
+				rows = self.db.execute("""SELECT id, suite, run, tags, attempts FROM items
+						WHERE dbkey = ? AND state = 'pending' ORDER BY rowid""", (dbkey,))
+				for id, suite, run, item_tags, attempts in rows.fetchall(): #@ReservedAssignment
+					item_tags = json.loads(item_tags)
+					if set(item_tags).issubset(tags):
+						self.db.execute("""UPDATE items SET state = 'leased', host = ?,
+								expires = ?, attempts = attempts + 1 WHERE dbkey = ? AND id = ?""",
+								(host, expires, dbkey, id))
+						self.db.execute("COMMIT")
+						return { 'id': id, 'suite': suite, 'run': run, 'tags': item_tags,
+								'attempts': attempts + 1 }
+				self.db.execute("COMMIT")
+			except:
+				self.db.execute("ROLLBACK")
+				raise
+
+	def renew(self, dbkey, id, host, expires): #@ReservedAssignment
+		with self.lock:
+			return self.db.execute("""UPDATE items SET expires = ? WHERE dbkey = ? AND id = ?
+					AND state = 'leased' AND host = ?""", (expires, dbkey, id, host)).rowcount > 0
+
+	def finish(self, dbkey, id, host): #@ReservedAssignment
+		self._execute(("""UPDATE items SET state = 'done', expires = NULL
+				WHERE dbkey = ? AND id = ? AND host = ?""", (dbkey, id, host)))
+
+	def requeue(self, dbkey, id, host): #@ReservedAssignment
+		self._execute(("""UPDATE items SET state = 'pending', host = NULL, expires = NULL
+				WHERE dbkey = ? AND id = ? AND host = ?""", (dbkey, id, host)))
+
+	def expire(self, dbkey, now, max_attempts):
+		self._execute(("""UPDATE items SET state = 'done', expires = NULL
+				WHERE dbkey = ? AND state = 'leased' AND expires < ? AND attempts >= ?""",
+				(dbkey, now, max_attempts)),
+				("""UPDATE items SET state = 'pending', host = NULL, expires = NULL
+				WHERE dbkey = ? AND state = 'leased' AND expires < ?""", (dbkey, now)))
+
+	def counts(self, dbkey):
+		rows = self._execute(("SELECT state, COUNT(*) FROM items WHERE dbkey = ? GROUP BY state",
+				(dbkey,)))[0]
+		return dict(rows)
+
+
+class RedisBackend(object):
+	"""
+	Queue stored in Redis, shared by all hosts. Leasing, and every later change
+	to a lease, is done atomically by scripts on the server.
+	"""
+
+	LEASE = """
+	local tags = cjson.decode(ARGV[1])
+	for _, id in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+		local item = cjson.decode(redis.call('HGET', KEYS[2], id))
+		local allowed = true
+		for _, tag in ipairs(item.tags) do
+			if not tags[tag] then
+				allowed = false
+				break
+			end
+		end
+		if allowed then
+			redis.call('LREM', KEYS[1], 1, id)
+			redis.call('ZADD', KEYS[3], ARGV[2], id)
+			redis.call('HSET', KEYS[4], id, ARGV[3])
+			item.attempts = item.attempts + 1
+			local encoded = cjson.encode(item)
+			redis.call('HSET', KEYS[2], id, encoded)
+			return encoded
+		end
+	end
+	return false
+	"""
+
+	EXPIRE = """
+	local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+	for _, id in ipairs(ids) do
+		redis.call('ZREM', KEYS[1], id)
+		redis.call('HDEL', KEYS[3], id)
+		local item = cjson.decode(redis.call('HGET', KEYS[4], id))
+		if item.attempts >= tonumber(ARGV[2]) then
+			redis.call('SADD', KEYS[5], id)
+		else
+			redis.call('RPUSH', KEYS[2], id)
+		end
+	end
+	return #ids
+	"""
+
+	FINISH = """
+	if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+		redis.call('ZREM', KEYS[1], ARGV[1])
+		redis.call('HDEL', KEYS[2], ARGV[1])
+		redis.call('SADD', KEYS[3], ARGV[1])
+		return 1
+	end
+	return 0
+	"""
+
+	REQUEUE = """
+	if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+		redis.call('ZREM', KEYS[1], ARGV[1])
+		redis.call('HDEL', KEYS[2], ARGV[1])
+		redis.call('RPUSH', KEYS[3], ARGV[1])
+		return 1
+	end
+	return 0
+	"""
+
+	RENEW = """
+	if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] and redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+		redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+		return 1
+	end
+	return 0
+	"""
+
+	def __init__(self, client=None, expiry=7 * 24 * 3600):
+		"""
+		:param client: `redis.StrictRedis` client. Default: the server used
+			by `queue.RedisQueue`
+		:param expiry: Seconds until the keys of a queue are deleted
+		"""
+
+		if client is None:
+			from .queue import RedisQueue
+			client = RedisQueue("").cache
+		self.client = client
+		self.expiry = expiry
+		self._lease = client.register_script(self.LEASE)
+		self._expire = client.register_script(self.EXPIRE)
+		self._renew = client.register_script(self.RENEW)
+		self._finish = client.register_script(self.FINISH)
+		self._requeue = client.register_script(self.REQUEUE)
+
+	def _keys(self, dbkey, *names):
+		keys = ["W_%s_%s" % (dbkey, name) for name in names]
+		for key in keys:
+			self.client.expire(key, self.expiry)
+		return keys
+
+	def register(self, dbkey, host, tags, now):
+		hosts, = self._keys(dbkey, "hosts")
+		self.client.hset(hosts, host, json.dumps({ 'tags': tags, 'seen': now }))
+		self.client.expire(hosts, self.expiry)
+
+	def hosts(self, dbkey):
+		hosts, = self._keys(dbkey, "hosts")
+		return dict((host, json.loads(value))
+				for host, value in self.client.hgetall(hosts).iteritems())
+
+	def add(self, dbkey, items):
+		keys = self._keys(dbkey, "items", "pending")
+		for item in items:
+			if self.client.hsetnx(keys[0], item['id'], json.dumps(item)):
+				self.client.rpush(keys[1], item['id'])
+		for key in keys:
+			self.client.expire(key, self.expiry)
+
+	def lease(self, dbkey, host, tags, expires):
+		keys = self._keys(dbkey, "pending", "items", "leased", "owners")
+		item = self._lease(keys=keys,
+				args=[json.dumps(dict((tag, True) for tag in tags)), expires, host])
+		if item:
+			return json.loads(item)
+
+	def renew(self, dbkey, id, host, expires): #@ReservedAssignment
+		return bool(self._renew(keys=self._keys(dbkey, "leased", "owners"),
+				args=[id, host, expires]))
+
+	def finish(self, dbkey, id, host): #@ReservedAssignment
+		keys = self._keys(dbkey, "leased", "owners", "done")
+		self._finish(keys=keys, args=[id, host])
+		self.client.expire(keys[2], self.expiry)
+
+	def requeue(self, dbkey, id, host): #@ReservedAssignment
+		self._requeue(keys=self._keys(dbkey, "leased", "owners", "pending"), args=[id, host])
+
+	def expire(self, dbkey, now, max_attempts):
+		keys = self._keys(dbkey, "leased", "pending", "owners", "items", "done")
+		self._expire(keys=keys, args=[now, max_attempts])
+		self.client.expire(keys[4], self.expiry)
+
+	def counts(self, dbkey):
+		pending, leased, done = self._keys(dbkey, "pending", "leased", "done")
+		return { 'pending': self.client.llen(pending), 'leased': self.client.zcard(leased),
+				'done': self.client.scard(done) }